@@ -1,20 +1,48 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response, WebSocket
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
 import os
 import logging
+import mimetypes
 import asyncio
+import base64
+import contextvars
+import functools
+import bisect
+import hashlib
+import json
+import platform
+import re
+import shutil
+import socket
 import subprocess
 import sys
-import zipfile
+import threading
+import time
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager, contextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 import uuid
-from datetime import datetime, timezone
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+try:
+    from faster_whisper import WhisperModel
+except ImportError:  # captions are skipped without the speech-to-text model
+    WhisperModel = None
 
 
 ROOT_DIR = Path(__file__).parent
@@ -27,14 +55,15 @@ CLIP_DIR = STORAGE_DIR / "clips"
 for path in [VIDEO_DIR, CLIP_DIR]:
     path.mkdir(parents=True, exist_ok=True)
 
+PROBE_TIMEOUT_SECONDS = float(os.environ.get("PROBE_TIMEOUT_SECONDS", "300"))
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
 app = FastAPI()
-app.mount("/media", StaticFiles(directory=str(STORAGE_DIR)), name="media")
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -53,9 +82,40 @@ class ClipSegment(BaseModel):
     thumbnail_url: str
     caption: str
     video_url: str
+    hls_url: Optional[str] = None
+    subtitles_url: Optional[str] = None
+    render_profile: Optional[str] = None
+    version: int = 1
+    render_version: int = 1
+    render_status: str = "ready"
+
+
+class JobProgress(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    stage: str
+    percent: float
+    eta_seconds: Optional[int] = None
+    fps: Optional[float] = None
+    speed: Optional[float] = None
+    bytes_per_second: Optional[float] = None
+
+
+class StageTiming(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    count: int
+    wall_seconds: float
+    cpu_seconds: float
+    max_rss_bytes: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    frames: int = 0
+    encode_seconds: float = 0.0
+    encode_fps: Optional[float] = None
 
 
-class ClipJob(BaseModel):
+class ClipJobSummary(BaseModel):
     model_config = ConfigDict(extra="ignore")
 
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -64,15 +124,28 @@ class ClipJob(BaseModel):
     status: str
     progress: int
     clip_count: int
-    clips: List[ClipSegment] = []
     clip_length: int
     language: str
     style: str
     duration: Optional[int] = None
-    waveform_url: Optional[str] = None
-    sprite_url: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     error_message: Optional[str] = None
+    render_mode: str = "quality"
+    aspect_ratio: str = "original"
+    render_profile: str = "publish"
+    progress_detail: Optional[JobProgress] = None
+    queue_position: Optional[int] = None
+    eta_seconds: Optional[int] = None
+
+
+class ClipJob(ClipJobSummary):
+    clips: List[ClipSegment] = []
+    waveform_url: Optional[str] = None
+    sprite_url: Optional[str] = None
+    peaks_url: Optional[str] = None
+    sprites_url: Optional[str] = None
+    timings: Optional[Dict[str, StageTiming]] = None
+    storage_bytes: Optional[int] = None
 
 
 class ClipJobCreate(BaseModel):
@@ -80,6 +153,9 @@ class ClipJobCreate(BaseModel):
     clip_length: int = Field(default=30, ge=15, le=120)
     language: Optional[str] = "pt"
     style: Optional[str] = "dinamico"
+    render_mode: Optional[str] = Field(default="quality", pattern="^(quality|fast)$")
+    aspect_ratio: Optional[str] = Field(default="original", pattern="^(original|9:16)$")
+    render_profile: Optional[str] = Field(default="publish", pattern="^(preview|publish|archive)$")
 
 
 class ClipUpdate(BaseModel):
@@ -87,12 +163,26 @@ class ClipUpdate(BaseModel):
     caption: Optional[str] = None
     start_time: Optional[int] = Field(default=None, ge=0)
     end_time: Optional[int] = Field(default=None, ge=1)
+    render_profile: Optional[str] = Field(default=None, pattern="^(preview|publish|archive)$")
+    version: Optional[int] = None
 
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "Hello World"}
 
+
+@api_router.get("/storage")
+async def storage_status():
+    # Disk usage as of the last storage sweep.
+    return storage_summary
+
+
+@api_router.get("/metrics")
+async def metrics():
+    # Prometheus exposition of the per-stage histograms of this worker.
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 def serialize_job(job: dict) -> ClipJob:
     if isinstance(job.get("created_at"), str):
         job["created_at"] = datetime.fromisoformat(job["created_at"])
@@ -110,11 +200,37 @@ def serialize_job(job: dict) -> ClipJob:
         job["clips"] = valid_clips
     return ClipJob(**job)
 
+def serialize_summary(job: dict) -> ClipJobSummary:
+    if isinstance(job.get("created_at"), str):
+        job["created_at"] = datetime.fromisoformat(job["created_at"])
+    return ClipJobSummary(**job)
+
+
+def encode_cursor(job: dict) -> str:
+    created_at = job["created_at"]
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, job["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), job_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
 def media_url(path: Path) -> str:
     rel = path.relative_to(STORAGE_DIR).as_posix()
     return f"/media/{rel}"
 
 
+def media_path(url: str) -> Path:
+    return STORAGE_DIR / url.partition("?")[0].replace("/media/", "", 1)
+
+
 def run_command(command: List[str]) -> str:
     result = subprocess.run(
         command,
@@ -122,49 +238,224 @@ def run_command(command: List[str]) -> str:
         stderr=subprocess.PIPE,
         text=True,
         check=True,
+        timeout=PROBE_TIMEOUT_SECONDS,
     )
     return result.stdout.strip()
 
 
-def fetch_video_title(url: str) -> str:
+SOURCE_FORMAT = "mp4/best"
+YDL_OPTIONS = {"quiet": True, "no_warnings": True, "noprogress": True, "noplaylist": True, "format": SOURCE_FORMAT}
+MEDIA_WORKERS = max(1, int(os.environ.get("MEDIA_WORKERS", "4")))
+media_executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+ydl_local = threading.local()
+SOURCE_CACHE_MAX_BYTES = int(float(os.environ.get("SOURCE_CACHE_MAX_GB", "20")) * 1024**3)
+YOUTUBE_ID_PATTERN = re.compile(r"(?:[?&]v=|/shorts/|/embed/|/live/|youtu\.be/)([A-Za-z0-9_-]{11})")
+
+
+def warm_ydl() -> YoutubeDL:
+    # Each media worker thread keeps one YoutubeDL alive, so extractor
+    # instances and their sessions are reused across probes.
+    ydl = getattr(ydl_local, "instance", None)
+    if ydl is None:
+        ydl = YoutubeDL(YDL_OPTIONS)
+        ydl_local.instance = ydl
+    return ydl
+
+
+def probe_video_metadata(url: str) -> dict:
+    ydl = warm_ydl()
     try:
-        return run_command([sys.executable, "-m", "yt_dlp", "-e", url])
-    except subprocess.CalledProcessError:
-        return "Vídeo do YouTube"
+        return ydl.sanitize_info(ydl.extract_info(url, download=False))
+    except DownloadError:
+        return {}
 
 
-def download_video(job_id: str, url: str) -> Path:
-    output_template = VIDEO_DIR / f"{job_id}.%(ext)s"
-    command = [
-        sys.executable,
-        "-m",
-        "yt_dlp",
-        "-f",
-        "mp4/best",
-        "--merge-output-format",
-        "mp4",
-        "-o",
-        str(output_template),
-        url,
-    ]
-    run_command(command)
-    return VIDEO_DIR / f"{job_id}.mp4"
-
-
-def get_video_duration(video_path: Path) -> int:
-    output = run_command(
-        [
-            "ffprobe",
-            "-v",
-            "error",
-            "-show_entries",
-            "format=duration",
-            "-of",
-            "default=noprint_wrappers=1:nokey=1",
-            str(video_path),
-        ]
+def source_cache_key(url: str, metadata: Optional[dict] = None) -> Optional[str]:
+    # Sources are content-addressed by (extractor, video id, format) so the
+    # same video submitted through different URL spellings shares one file.
+    metadata = metadata or {}
+    extractor = (metadata.get("extractor_key") or "").lower()
+    video_id = metadata.get("id")
+    if not video_id:
+        match = YOUTUBE_ID_PATTERN.search(url)
+        if not match:
+            if not metadata:
+                return None
+            extractor, video_id = "url", hashlib.sha1(url.strip().encode()).hexdigest()[:16]
+        else:
+            extractor, video_id = "youtube", match.group(1)
+    slug = re.sub(r"[^A-Za-z0-9_-]", "_", f"{extractor or 'youtube'}-{video_id}")
+    return f"{slug}-{hashlib.sha1(SOURCE_FORMAT.encode()).hexdigest()[:8]}"
+
+
+def source_path_for(key: str) -> Path:
+    return VIDEO_DIR / f"{key}.mp4"
+
+
+def download_source(
+    key: str,
+    url: str,
+    info: Optional[dict] = None,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> Path:
+    # Download under a unique temporary name and rename into place, so a
+    # reader never sees a partial file under the cache key. When the probe
+    # result is available it is reused instead of extracting the page again.
+    temp_stem = f"{key}.{uuid.uuid4().hex}.tmp"
+
+    def progress_hook(status: dict) -> None:
+        if not on_progress or status.get("status") != "downloading":
+            return
+        total = status.get("total_bytes") or status.get("total_bytes_estimate")
+        downloaded = status.get("downloaded_bytes") or 0
+        on_progress(
+            {
+                "fraction": min(1.0, downloaded / total) if total else None,
+                "bytes_per_second": status.get("speed"),
+                "eta_seconds": int(status["eta"]) if status.get("eta") is not None else None,
+            }
+        )
+
+    options = {
+        **YDL_OPTIONS,
+        "merge_output_format": "mp4",
+        "outtmpl": {"default": str(VIDEO_DIR / f"{temp_stem}.%(ext)s")},
+        "progress_hooks": [progress_hook],
+    }
+    temp_path = VIDEO_DIR / f"{temp_stem}.mp4"
+    try:
+        with YoutubeDL(options) as ydl:
+            if info and info.get("formats"):
+                ydl.process_ie_result(info, download=True)
+            else:
+                ydl.download([url])
+        target = source_path_for(key)
+        os.replace(temp_path, target)
+        return target
+    finally:
+        for leftover in VIDEO_DIR.glob(f"{temp_stem}*"):
+            leftover.unlink(missing_ok=True)
+
+
+def run_measured(func: Callable, *args):
+    started = time.thread_time()
+    try:
+        return func(*args)
+    finally:
+        metrics = current_stage.get()
+        if metrics:
+            metrics.add_cpu(time.thread_time() - started)
+
+
+async def run_media(func: Callable, *args):
+    # The caller's context goes along, so work in the pool counts toward the
+    # caller's stage.
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(media_executor, context.run, run_measured, func, *args)
+
+
+STREAM_COPY_CODECS = {"video": {"h264"}, "audio": {"aac"}}
+media_info_lock = threading.Lock()
+
+
+def media_info_path(video_path: Path) -> Path:
+    return video_path.with_name(f"{video_path.stem}.probe.json")
+
+
+def parse_rate(value: Optional[str]) -> Optional[float]:
+    if not value or value == "0/0":
+        return None
+    numerator, _, denominator = value.partition("/")
+    return float(numerator) / float(denominator or 1)
+
+
+def probe_media(video_path: Path) -> dict:
+    probe = json.loads(
+        run_command(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_format",
+                "-show_streams",
+                "-of",
+                "json",
+                str(video_path),
+            ]
+        )
+    )
+    streams = probe.get("streams", [])
+    fmt = probe.get("format", {})
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), None)
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+    info = {
+        "duration": float(fmt.get("duration") or 0),
+        "format_name": fmt.get("format_name"),
+        "bit_rate": int(fmt["bit_rate"]) if fmt.get("bit_rate") else None,
+        "video": None,
+        "audio": None,
+        "keyframes": [],
+    }
+    if video:
+        info["video"] = {
+            "codec": video.get("codec_name"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "fps": parse_rate(video.get("avg_frame_rate")) or parse_rate(video.get("r_frame_rate")),
+            "pix_fmt": video.get("pix_fmt"),
+        }
+    if audio:
+        info["audio"] = {
+            "codec": audio.get("codec_name"),
+            "channels": audio.get("channels"),
+            "channel_layout": audio.get("channel_layout"),
+            "sample_rate": int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+        }
+    info["copyable"] = bool(video) and all(
+        stream.get("codec_name") in STREAM_COPY_CODECS[stream["codec_type"]]
+        for stream in streams
+        if stream.get("codec_type") in STREAM_COPY_CODECS
     )
-    return max(1, int(float(output)))
+    if video:
+        # Packet flags carry the keyframe marker, so this reads the container
+        # index without decoding a single frame.
+        output = run_command(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "packet=pts_time,flags",
+                "-of",
+                "csv=p=0",
+                str(video_path),
+            ]
+        )
+        for line in output.splitlines():
+            pts_time, _, flags = line.partition(",")
+            if "K" in flags and pts_time not in ("", "N/A"):
+                info["keyframes"].append(float(pts_time))
+        info["keyframes"].sort()
+    return info
+
+
+def load_media_info(video_path: Path) -> dict:
+    # Probed once per source and cached next to it; every later stage reads
+    # codecs, duration and keyframes from here instead of running ffprobe.
+    info_path = media_info_path(video_path)
+    stat = video_path.stat()
+    with media_info_lock:
+        if info_path.exists():
+            cached = json.loads(info_path.read_text())
+            if cached.get("file_size") == stat.st_size and cached.get("mtime") == stat.st_mtime:
+                return cached
+        with timed_stage("probe"):
+            info = probe_media(video_path)
+        info.update({"file_size": stat.st_size, "mtime": stat.st_mtime})
+        info_path.write_text(json.dumps(info))
+        return info
 
 
 def build_clip_plan(duration: int, clip_length: int) -> List[int]:
@@ -178,34 +469,620 @@ def build_clip_plan(duration: int, clip_length: int) -> List[int]:
     return [min(start, max(0, duration - safe_length)) for start in starts]
 
 
-def render_clip(video_path: Path, output_path: Path, start: int, duration: int) -> None:
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    command = [
-        "ffmpeg",
-        "-y",
-        "-ss",
-        str(start),
-        "-i",
-        str(video_path),
-        "-t",
-        str(duration),
+def even_clip_plan(duration: int, clip_length: int) -> List[tuple]:
+    starts = build_clip_plan(duration, clip_length)
+    return [(start, min(99, 70 + int(((index + 1) / len(starts)) * 25))) for index, start in enumerate(starts)]
+
+
+# Named encode profiles, chosen per job and per clip. Preview is a cheap
+# low-resolution encode for reviewing cuts; archive spends the CPU. The
+# publish preset comes from the startup auto-tuner once it has run.
+ENCODE_PROFILES = {
+    "preview": {"preset": "ultrafast", "crf": 30, "height": 480, "audio_kbps": 96, "thumb_quality": 6},
+    "publish": {"preset": "veryfast", "crf": 23, "height": None, "audio_kbps": None, "thumb_quality": 2},
+    "archive": {"preset": "slow", "crf": 18, "height": None, "audio_kbps": 192, "thumb_quality": 1},
+}
+DEFAULT_ENCODE_PROFILE = "publish"
+ENCODER_AUTOTUNE = os.environ.get("ENCODER_AUTOTUNE", "1") != "0"
+# Candidate publish presets, slowest (smallest files) first.
+ENCODER_TUNE_PRESETS = ["medium", "fast", "faster", "veryfast", "superfast"]
+# Encode fps one job's core share must sustain for a preset to be picked:
+# twice realtime for 30 fps sources by default.
+ENCODER_TUNE_TARGET_FPS = float(os.environ.get("ENCODER_TUNE_TARGET_FPS", "60"))
+ENCODER_TUNE_SECONDS = 4
+ENCODER_TUNE_RATE = 30
+encoder_tuning: dict = {}
+WAVEFORM_FILTER = "aformat=channel_layouts=mono,showwavespic=s=1200x200:colors=ccff00"
+BATCH_RENDER_ENABLED = os.environ.get("BATCH_RENDER_ENABLED", "1") != "0"
+RENDER_CPU_BUDGET = max(1, int(os.environ.get("RENDER_CPU_BUDGET", str(os.cpu_count() or 1))))
+FFMPEG_STALL_SECONDS = float(os.environ.get("FFMPEG_STALL_SECONDS", "120"))
+FFMPEG_TIMEOUT_SECONDS = float(os.environ.get("FFMPEG_TIMEOUT_SECONDS", "0"))
+HLS_ENABLED = os.environ.get("HLS_ENABLED", "0") == "1"
+HLS_LADDER = [int(height) for height in os.environ.get("HLS_LADDER", "360,720").split(",") if height.strip()]
+HLS_SEGMENT_SECONDS = 4
+HLS_VIDEO_KBPS = {240: 400, 360: 800, 480: 1400, 720: 2800, 1080: 5000}
+
+ProgressCallback = Callable[[dict], None]
+
+
+class CpuBudget:
+    # Global pool of cores shared by every ffmpeg process on this host.
+    # Each render reserves the cores it passes as -threads, so concurrent
+    # jobs split the machine instead of oversubscribing it.
+    def __init__(self, total: int):
+        self.total = total
+        self.available = total
+        self.condition: Optional[asyncio.Condition] = None
+
+    @asynccontextmanager
+    async def reserve(self, cores: int):
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        cores = max(1, min(cores, self.total))
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.available >= cores)
+            self.available -= cores
+        try:
+            yield cores
+        finally:
+            async with self.condition:
+                self.available += cores
+                self.condition.notify_all()
+
+
+cpu_budget = CpuBudget(RENDER_CPU_BUDGET)
+
+
+def job_core_share() -> int:
+    return max(1, RENDER_CPU_BUDGET // RENDER_WORKERS)
+
+
+def thread_args(threads: int) -> List[str]:
+    return ["-threads", str(threads)] if threads else []
+
+
+def encode_profile(name: Optional[str] = None) -> dict:
+    if name not in ENCODE_PROFILES:
+        name = DEFAULT_ENCODE_PROFILE
+    profile = {**ENCODE_PROFILES[name], "name": name}
+    if name == "publish" and encoder_tuning.get("preset"):
+        profile["preset"] = encoder_tuning["preset"]
+    # Part of the render cache key, so a retuned preset never serves stale
+    # renders.
+    profile["key"] = f"{name}.{profile['preset']}"
+    return profile
+
+
+def clip_encode_args(encode: dict) -> List[str]:
+    return [
         "-c:v",
         "libx264",
         "-preset",
-        "veryfast",
+        encode["preset"],
         "-crf",
-        "23",
+        str(encode["crf"]),
         "-c:a",
         "aac",
+        *(["-b:a", f"{encode['audio_kbps']}k"] if encode["audio_kbps"] else []),
         "-movflags",
         "+faststart",
-        str(output_path),
     ]
-    run_command(command)
 
 
-def render_thumbnail(video_path: Path, output_path: Path, timestamp: int) -> None:
+def thumbnail_args(encode: dict) -> List[str]:
+    return ["-frames:v", "1", "-q:v", str(encode["thumb_quality"])]
+
+
+def scale_filter(encode: dict) -> Optional[str]:
+    # Caps the output height without upscaling; the width keeps the aspect.
+    return f"scale=-2:'min({encode['height']},ih)'" if encode["height"] else None
+
+
+def encode_threads(share: int) -> int:
+    # Threads per encode with the best fps per core on this host, as
+    # measured by the auto-tuner; one thread until it has run.
+    return max(1, min(share, encoder_tuning.get("threads") or 1))
+
+
+STAGE_SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+STAGE_BYTES_BUCKETS = tuple(2**power for power in range(16, 36, 2))
+STAGE_FPS_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+STAGE_SECONDS = Histogram(
+    "cortes_stage_seconds", "Wall time per pipeline stage", ["stage"], buckets=STAGE_SECONDS_BUCKETS
+)
+STAGE_CPU_SECONDS = Histogram(
+    "cortes_stage_cpu_seconds", "CPU time of children and worker threads per stage", ["stage"],
+    buckets=STAGE_SECONDS_BUCKETS,
+)
+STAGE_PEAK_RSS = Histogram(
+    "cortes_stage_peak_rss_bytes", "Peak RSS of the largest child process per stage", ["stage"],
+    buckets=STAGE_BYTES_BUCKETS,
+)
+STAGE_BYTES = Histogram(
+    "cortes_stage_bytes", "Bytes read and written by child processes per stage", ["stage", "direction"],
+    buckets=STAGE_BYTES_BUCKETS,
+)
+STAGE_ENCODE_FPS = Histogram(
+    "cortes_stage_encode_fps", "ffmpeg frames per second per stage", ["stage"], buckets=STAGE_FPS_BUCKETS
+)
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PROCESS_SAMPLE_SECONDS = 0.5
+
+
+class StageMetrics:
+    # Resources of one run of a stage. Child processes and pool threads
+    # report into the innermost stage of the task that started them; nested
+    # stages still count toward the outer stage's wall time.
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.max_rss_bytes = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.frames = 0
+        self.encode_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add_cpu(self, seconds: float) -> None:
+        with self.lock:
+            self.cpu_seconds += seconds
+
+    def add_process(self, usage: dict, frames: int = 0, seconds: float = 0.0) -> None:
+        with self.lock:
+            self.cpu_seconds += usage["cpu_seconds"]
+            self.max_rss_bytes = max(self.max_rss_bytes, usage["max_rss_bytes"])
+            self.bytes_in += usage["bytes_in"]
+            self.bytes_out += usage["bytes_out"]
+            if frames:
+                self.frames += frames
+                self.encode_seconds += seconds
+
+
+current_stage: contextvars.ContextVar = contextvars.ContextVar("current_stage", default=None)
+job_timings: contextvars.ContextVar = contextvars.ContextVar("job_timings", default=None)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    # Re-entering the stage that is already current (a fast cut falling back
+    # to an encode) keeps counting into the outer run.
+    outer = current_stage.get()
+    if outer and outer.stage == stage:
+        yield outer
+        return
+    metrics = StageMetrics(stage)
+    token = current_stage.set(metrics)
+    started = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.wall_seconds = time.perf_counter() - started
+        current_stage.reset(token)
+        record_stage(metrics)
+
+
+def timed(stage: str):
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timed_stage(stage):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def record_stage(metrics: StageMetrics) -> None:
+    stage = metrics.stage
+    STAGE_SECONDS.labels(stage).observe(metrics.wall_seconds)
+    STAGE_CPU_SECONDS.labels(stage).observe(metrics.cpu_seconds)
+    if metrics.max_rss_bytes:
+        STAGE_PEAK_RSS.labels(stage).observe(metrics.max_rss_bytes)
+    if metrics.bytes_in or metrics.bytes_out:
+        STAGE_BYTES.labels(stage, "in").observe(metrics.bytes_in)
+        STAGE_BYTES.labels(stage, "out").observe(metrics.bytes_out)
+    if metrics.frames and metrics.encode_seconds:
+        STAGE_ENCODE_FPS.labels(stage).observe(metrics.frames / metrics.encode_seconds)
+    timings = job_timings.get()
+    if timings is not None:
+        merge_stage_timing(timings, stage, stage_timing(metrics))
+
+
+def stage_timing(metrics: StageMetrics) -> dict:
+    return {
+        "count": 1,
+        "wall_seconds": metrics.wall_seconds,
+        "cpu_seconds": metrics.cpu_seconds,
+        "max_rss_bytes": metrics.max_rss_bytes,
+        "bytes_in": metrics.bytes_in,
+        "bytes_out": metrics.bytes_out,
+        "frames": metrics.frames,
+        "encode_seconds": metrics.encode_seconds,
+    }
+
+
+def merge_stage_timing(timings: dict, stage: str, timing: dict) -> None:
+    current = timings.get(stage)
+    if not current:
+        timings[stage] = dict(timing)
+        return
+    for field in ("count", "wall_seconds", "cpu_seconds", "bytes_in", "bytes_out", "frames", "encode_seconds"):
+        current[field] = current.get(field, 0) + timing.get(field, 0)
+    current["max_rss_bytes"] = max(current.get("max_rss_bytes", 0), timing.get("max_rss_bytes", 0))
+
+
+def timing_breakdown(timings: dict) -> dict:
+    # Stored form of a job's timings, with rounded figures and encode fps.
+    breakdown = {}
+    for stage, timing in timings.items():
+        breakdown[stage] = {
+            **timing,
+            "wall_seconds": round(timing["wall_seconds"], 3),
+            "cpu_seconds": round(timing["cpu_seconds"], 3),
+            "encode_seconds": round(timing["encode_seconds"], 3),
+            "encode_fps": round(timing["frames"] / timing["encode_seconds"], 1) if timing["encode_seconds"] else None,
+        }
+    return breakdown
+
+
+def sample_process(pid: int) -> Optional[dict]:
+    # Usage of a running child read from /proc (Linux). asyncio reaps its
+    # children without keeping their rusage, so the last sample taken before
+    # exit stands in for it.
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rpartition(")")[2].split()
+        status = Path(f"/proc/{pid}/status").read_text()
+        io = dict(line.split(": ", 1) for line in Path(f"/proc/{pid}/io").read_text().splitlines())
+    except (OSError, ValueError):
+        return None
+    peak = re.search(r"VmHWM:\s+(\d+) kB", status)
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "max_rss_bytes": int(peak.group(1)) * 1024 if peak else 0,
+        "bytes_in": int(io.get("rchar", 0)),
+        "bytes_out": int(io.get("wchar", 0)),
+    }
+
+
+def record_process(usage: Optional[dict], frames: int = 0, seconds: float = 0.0) -> None:
+    metrics = current_stage.get()
+    if metrics and usage:
+        metrics.add_process(usage, frames, seconds)
+
+
+def parse_ffmpeg_progress(block: dict, duration: Optional[float]) -> dict:
+    def number(key: str) -> Optional[float]:
+        try:
+            return float(block.get(key, "").rstrip("x"))
+        except ValueError:
+            return None
+
+    out_time = (number("out_time_us") or 0) / 1_000_000
+    speed = number("speed")
+    fraction = None
+    eta = None
+    if duration:
+        fraction = 1.0 if block.get("progress") == "end" else min(1.0, out_time / duration)
+        if speed:
+            eta = max(0, int((duration - out_time) / speed))
+    return {
+        "fraction": fraction,
+        "fps": number("fps"),
+        "speed": speed,
+        "eta_seconds": eta,
+        "out_time": out_time,
+        "frame": int(number("frame") or 0),
+    }
+
+
+async def run_ffmpeg(
+    command: List[str],
+    duration: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    stdin: int = asyncio.subprocess.DEVNULL,
+) -> None:
+    # ffmpeg writes key=value progress blocks to stdout as it encodes. A
+    # process that goes FFMPEG_STALL_SECONDS without reporting, or exceeds
+    # FFMPEG_TIMEOUT_SECONDS overall, is killed; so is one whose caller is
+    # cancelled.
+    args = [command[0], "-nostats", "-progress", "pipe:1", *command[1:]]
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=stdin,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_tail: deque = deque(maxlen=40)
+
+    async def drain_stderr() -> None:
+        async for line in process.stderr:
+            stderr_tail.append(line.decode(errors="replace").rstrip())
+
+    started = time.perf_counter()
+    usage = None
+    frames = 0
+
+    async def read_progress() -> None:
+        nonlocal usage, frames
+        block: dict = {}
+        while True:
+            line = await asyncio.wait_for(process.stdout.readline(), FFMPEG_STALL_SECONDS)
+            if not line:
+                return
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            block[key] = value
+            if key == "progress":
+                stats = parse_ffmpeg_progress(block, duration)
+                usage = sample_process(process.pid) or usage
+                frames = stats["frame"] or frames
+                if on_progress:
+                    on_progress(stats)
+                block = {}
+
+    stderr_task = asyncio.ensure_future(drain_stderr())
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(read_progress(), process.wait()),
+            FFMPEG_TIMEOUT_SECONDS or None,
+        )
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        stderr_task.cancel()
+        raise
+    finally:
+        record_process(usage, frames, time.perf_counter() - started)
+    await stderr_task
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, stderr="\n".join(stderr_tail))
+
+
+def hls_rungs(media_info: dict) -> List[int]:
+    # Ladder heights below the source's; the source rendition itself is a
+    # remux of the clip mp4 and is always added.
+    source_height = (media_info.get("video") or {}).get("height") or 0
+    if not HLS_ENABLED or not source_height:
+        return []
+    return sorted(height for height in HLS_LADDER if height < source_height)
+
+
+def hls_dir_for(video_path: Path) -> Path:
+    return video_path.with_name(f"{video_path.stem}.hls")
+
+
+def hls_playlist_args(rung_dir: Path) -> List[str]:
+    rung_dir.mkdir(parents=True, exist_ok=True)
+    return [
+        "-f",
+        "hls",
+        "-hls_time",
+        str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type",
+        "vod",
+        "-hls_segment_type",
+        "fmp4",
+        "-hls_fmp4_init_filename",
+        "init.mp4",
+        "-hls_segment_filename",
+        str(rung_dir / "seg_%03d.m4s"),
+        str(rung_dir / "index.m3u8"),
+    ]
+
+
+def hls_rung_args(height: int, encode: dict, threads: int = 0) -> List[str]:
+    # Rungs are bitrate-capped for streaming but share the job's profile
+    # preset (as tuned for this host) and its slice of the core budget.
+    kbps = HLS_VIDEO_KBPS.get(height, height * 4)
+    return [
+        "-c:v",
+        "libx264",
+        "-preset",
+        encode["preset"],
+        *thread_args(threads),
+        "-b:v",
+        f"{kbps}k",
+        "-maxrate",
+        f"{int(kbps * 1.07)}k",
+        "-bufsize",
+        f"{int(kbps * 1.5)}k",
+        "-force_key_frames",
+        f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "96k" if height < 720 else "128k",
+    ]
+
+
+def encoder_share(threads: int, encoders: int) -> int:
+    # Threads per encoder when several outputs of one ffmpeg process split
+    # a single budget reservation; 0 leaves the choice to ffmpeg.
+    return max(1, threads // max(1, encoders)) if threads else 0
+
+
+def hls_ladder_graph(
+    video_label: str,
+    audio_label: Optional[str],
+    rungs: List[int],
+    prefix: str,
+    hls_dir: Path,
+    encode: dict,
+    threads: int = 0,
+    with_main: bool = True,
+) -> tuple:
+    # Splits one decoded (and already trimmed) branch into the main clip
+    # output plus one scaled branch per ladder rung, so every rendition
+    # comes out of the same decode. Returns the filters, the labels the main
+    # output should map instead of the originals, and the rung outputs.
+    main = [f"[{prefix}v]"] if with_main else []
+    filters = [
+        f"[{video_label}]split={len(main) + len(rungs)}"
+        + "".join(main + [f"[{prefix}v{j}]" for j in range(len(rungs))])
+    ]
+    main_audio = None
+    if audio_label:
+        audio_main = [f"[{prefix}a]"] if with_main else []
+        filters.append(
+            f"[{audio_label}]asplit={len(audio_main) + len(rungs)}"
+            + "".join(audio_main + [f"[{prefix}a{j}]" for j in range(len(rungs))])
+        )
+        main_audio = f"{prefix}a" if with_main else None
+    outputs: List[str] = []
+    for j, height in enumerate(rungs):
+        filters.append(f"[{prefix}v{j}]scale=-2:{height}[{prefix}s{j}]")
+        outputs += ["-map", f"[{prefix}s{j}]"]
+        if audio_label:
+            outputs += ["-map", f"[{prefix}a{j}]"]
+        outputs += [*hls_rung_args(height, encode, threads), *hls_playlist_args(hls_dir / str(height))]
+    return filters, f"{prefix}v" if with_main else None, main_audio, outputs
+
+
+def write_hls_master(clip_path: Path, rungs: List[int], media_info: dict, duration: float) -> Path:
+    # Packages the finished clip mp4 as the source rendition (stream copy)
+    # and writes a master playlist over every rendition, with bandwidth
+    # measured from the segments actually produced.
+    hls_dir = hls_dir_for(clip_path)
+    source_dir = hls_dir / "source"
+    source_dir.mkdir(parents=True, exist_ok=True)
+    run_command(["ffmpeg", "-y", "-v", "error", "-i", str(clip_path), "-c", "copy", *hls_playlist_args(source_dir)])
+    video = media_info.get("video") or {}
+    aspect = (video.get("width") or 16) / (video.get("height") or 9)
+    variants = [(str(height), height) for height in rungs] + [("source", video.get("height") or 0)]
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for name, height in variants:
+        rung_dir = hls_dir / name
+        size = sum(path.stat().st_size for path in rung_dir.iterdir() if path.suffix in (".m4s", ".mp4"))
+        bandwidth = int(size * 8 / max(duration, 1) * 1.1)
+        width = int(round(height * aspect / 2) * 2)
+        resolution = f",RESOLUTION={width}x{height}" if height else ""
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth}{resolution}")
+        lines.append(f"{name}/index.m3u8")
+    master_path = hls_dir / "master.m3u8"
+    master_path.write_text("\n".join(lines) + "\n")
+    return master_path
+
+
+@timed("hls")
+async def render_hls_from_clip(
+    clip_path: Path,
+    rungs: List[int],
+    media_info: dict,
+    duration: float,
+    encode: Optional[dict] = None,
+    threads: int = 0,
+) -> Path:
+    # Used for edited clips: decodes the short clip once (not the source)
+    # and produces every ladder rung from that pass.
+    if rungs:
+        filters, _, _, outputs = hls_ladder_graph(
+            "0:v",
+            "0:a" if media_info.get("audio") else None,
+            rungs,
+            "h",
+            hls_dir_for(clip_path),
+            encode or encode_profile(),
+            encoder_share(threads, len(rungs)),
+            with_main=False,
+        )
+        await run_ffmpeg(["ffmpeg", "-y", "-i", str(clip_path), "-filter_complex", ";".join(filters), *outputs])
+    return await run_media(write_hls_master, clip_path, rungs, media_info, duration)
+
+
+@timed("clip")
+async def render_clip(
+    video_path: Path,
+    output_path: Path,
+    start: int,
+    duration: int,
+    threads: int = 0,
+    on_progress: Optional[ProgressCallback] = None,
+    rungs: Optional[List[int]] = None,
+    crop_track: Optional[dict] = None,
+    captions: Optional[dict] = None,
+    encode: Optional[dict] = None,
+    media_info: Optional[dict] = None,
+) -> None:
+    # media_info stands in for probing video_path, which callers reading a
+    # source that is still growing must not do.
+    encode = encode or encode_profile()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    video_filter = clip_video_filter(crop_track, captions, start, duration, output_path, encode)
+    try:
+        if not rungs:
+            command = [
+                "ffmpeg",
+                "-y",
+                "-ss",
+                str(start),
+                "-i",
+                str(video_path),
+                "-t",
+                str(duration),
+                *(["-vf", video_filter] if video_filter else []),
+                *clip_encode_args(encode),
+                *thread_args(threads),
+                str(output_path),
+            ]
+            await run_ffmpeg(command, duration, on_progress)
+            return
+        # With an HLS ladder the input itself is trimmed (-t before -i) so the
+        # clip and every rendition share one decode.
+        if media_info:
+            has_audio = media_info.get("audio") is not None
+        else:
+            has_audio = await has_audio_stream(video_path)
+        filters = [f"[0:v]{video_filter}[rf]"] if video_filter else []
+        encoder_threads = encoder_share(threads, len(rungs) + 1)
+        ladder, main_video, main_audio, rung_outputs = hls_ladder_graph(
+            "rf" if video_filter else "0:v",
+            "0:a" if has_audio else None,
+            rungs,
+            "h",
+            hls_dir_for(output_path),
+            encode,
+            encoder_threads,
+        )
+        command = [
+            "ffmpeg",
+            "-y",
+            "-ss",
+            str(start),
+            "-t",
+            str(duration),
+            "-i",
+            str(video_path),
+            "-filter_complex",
+            ";".join(filters + ladder),
+            "-map",
+            f"[{main_video}]",
+            *(["-map", f"[{main_audio}]"] if main_audio else []),
+            *clip_encode_args(encode),
+            *thread_args(encoder_threads),
+            str(output_path),
+            *rung_outputs,
+        ]
+        await run_ffmpeg(command, duration, on_progress)
+    finally:
+        clear_filter_files(output_path)
+
+
+@timed("thumbnail")
+async def render_thumbnail(
+    video_path: Path,
+    output_path: Path,
+    timestamp: int,
+    threads: int = 0,
+    crop_track: Optional[dict] = None,
+    encode: Optional[dict] = None,
+) -> None:
+    encode = encode or encode_profile()
     output_path.parent.mkdir(parents=True, exist_ok=True)
+    commands_path = output_path.with_name(f"{output_path.stem}.crop.cmd")
+    reframe = reframe_filter(crop_track, timestamp, 1, commands_path) if crop_track else None
+    video_filter = ",".join(part for part in (reframe, scale_filter(encode)) if part)
     command = [
         "ffmpeg",
         "-y",
@@ -213,16 +1090,19 @@ def render_thumbnail(video_path: Path, output_path: Path, timestamp: int) -> Non
         str(timestamp),
         "-i",
         str(video_path),
-        "-frames:v",
-        "1",
-        "-q:v",
-        "2",
+        *(["-vf", video_filter] if video_filter else []),
+        *thumbnail_args(encode),
+        *thread_args(threads),
         str(output_path),
     ]
-    run_command(command)
+    try:
+        await run_ffmpeg(command)
+    finally:
+        commands_path.unlink(missing_ok=True)
 
 
-def render_waveform(video_path: Path, output_path: Path) -> None:
+@timed("waveform")
+async def render_waveform(video_path: Path, output_path: Path, threads: int = 0) -> None:
     output_path.parent.mkdir(parents=True, exist_ok=True)
     command = [
         "ffmpeg",
@@ -230,190 +1110,3710 @@ def render_waveform(video_path: Path, output_path: Path) -> None:
         "-i",
         str(video_path),
         "-filter_complex",
-        "aformat=channel_layouts=mono,showwavespic=s=1200x200:colors=ccff00",
+        WAVEFORM_FILTER,
         "-frames:v",
         "1",
+        *thread_args(threads),
         str(output_path),
     ]
-    run_command(command)
+    await run_ffmpeg(command)
 
 
-def render_sprite(video_path: Path, output_path: Path, duration: int) -> None:
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    frame_count = min(8, max(4, max(1, duration // 6)))
-    fps = frame_count / max(1, duration)
-    filter_value = f"fps={fps},scale=200:-1,tile={frame_count}x1"
-    command = [
+async def has_audio_stream(video_path: Path) -> bool:
+    return (await run_media(load_media_info, video_path))["audio"] is not None
+
+
+def build_batch_command(
+    video_path: Path,
+    clips: List[dict],
+    waveform_path: Optional[Path],
+    has_audio: bool,
+    threads: int = 0,
+    rungs: Optional[List[int]] = None,
+    crop_track: Optional[dict] = None,
+    captions: Optional[dict] = None,
+    encode: Optional[dict] = None,
+) -> List[str]:
+    # One decode of the source feeds every output: each clip and thumbnail
+    # gets its own trimmed branch of a split graph, plus the waveform.
+    # The last video branch goes untrimmed to a null sink so ffmpeg's
+    # reported out_time tracks the position in the source.
+    video_branches = len(clips) * 2 + 1
+    audio_branches = len(clips) + (1 if waveform_path else 0)
+    encode = encode or encode_profile()
+    encoder_threads = encoder_share(threads, len(clips) * (len(rungs or []) + 1))
+    filters = [f"[0:v]split={video_branches}" + "".join(f"[v{i}]" for i in range(video_branches))]
+    if has_audio and audio_branches:
+        filters.append(f"[0:a]asplit={audio_branches}" + "".join(f"[a{i}]" for i in range(audio_branches)))
+    outputs: List[str] = []
+    for index, clip in enumerate(clips):
+        start = clip["start"]
+        end = start + clip["duration"]
+        thumb_at = clip["thumb_at"]
+        video_filter = clip_video_filter(crop_track, captions, start, clip["duration"], clip["video_path"], encode)
+        clip_reframe = f",{video_filter}" if video_filter else ""
+        thumb_reframe = ""
+        if crop_track:
+            thumb_path = clip["thumb_path"]
+            commands = thumb_path.with_name(f"{thumb_path.stem}.thumb.crop.cmd")
+            thumb_reframe = "," + reframe_filter(crop_track, thumb_at, 1, commands)
+        if encode["height"]:
+            thumb_reframe += "," + scale_filter(encode)
+        filters.append(f"[v{index * 2}]trim=start={start}:end={end},setpts=PTS-STARTPTS{clip_reframe}[cv{index}]")
+        filters.append(
+            f"[v{index * 2 + 1}]trim=start={thumb_at}:end={thumb_at + 1},setpts=PTS-STARTPTS{thumb_reframe}[tv{index}]"
+        )
+        video_label, audio_label = f"cv{index}", None
+        if has_audio:
+            filters.append(f"[a{index}]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[ca{index}]")
+            audio_label = f"ca{index}"
+        rung_outputs: List[str] = []
+        if rungs:
+            ladder, video_label, audio_label, rung_outputs = hls_ladder_graph(
+                video_label, audio_label, rungs, f"h{index}", hls_dir_for(clip["video_path"]), encode, encoder_threads
+            )
+            filters += ladder
+        outputs += ["-map", f"[{video_label}]"]
+        if audio_label:
+            outputs += ["-map", f"[{audio_label}]"]
+        outputs += [*clip_encode_args(encode), *thread_args(encoder_threads), str(clip["video_path"])]
+        outputs += ["-map", f"[tv{index}]", *thumbnail_args(encode), str(clip["thumb_path"]), *rung_outputs]
+    if waveform_path and has_audio:
+        filters.append(f"[a{audio_branches - 1}]{WAVEFORM_FILTER}[wave]")
+        outputs += ["-map", "[wave]", "-frames:v", "1", str(waveform_path)]
+    filters.append(f"[v{video_branches - 1}]null[position]")
+    outputs += ["-map", "[position]", "-f", "null", os.devnull]
+    global_args = ["-filter_complex_threads", str(threads)] if threads else []
+    return [
         "ffmpeg",
         "-y",
+        *global_args,
         "-i",
         str(video_path),
-        "-vf",
-        filter_value,
-        "-frames:v",
-        "1",
-        str(output_path),
+        "-filter_complex",
+        ";".join(filters),
+        *outputs,
     ]
-    run_command(command)
-
 
-async def update_job(job_id: str, updates: dict) -> None:
-    await db.clip_jobs.update_one({"id": job_id}, {"$set": updates})
 
-
-async def process_job(job_id: str, url: str, clip_length: int) -> None:
+@timed("batch")
+async def render_job_batch(
+    video_path: Path,
+    clips: List[dict],
+    waveform_path: Optional[Path],
+    duration: int,
+    on_progress: Optional[ProgressCallback] = None,
+    rungs: Optional[List[int]] = None,
+    crop_track: Optional[dict] = None,
+    captions: Optional[dict] = None,
+    encode: Optional[dict] = None,
+) -> bool:
+    for clip in clips:
+        clip["video_path"].parent.mkdir(parents=True, exist_ok=True)
+    has_audio = await has_audio_stream(video_path)
     try:
-        await update_job(job_id, {"status": "downloading", "progress": 5, "error_message": None})
-        title = await asyncio.to_thread(fetch_video_title, url)
-        await update_job(job_id, {"title": title, "progress": 10})
-        video_path = await asyncio.to_thread(download_video, job_id, url)
-        await update_job(job_id, {"progress": 20, "status": "processing"})
-        duration = await asyncio.to_thread(get_video_duration, video_path)
-        waveform_path = CLIP_DIR / job_id / "waveform.png"
-        sprite_path = CLIP_DIR / job_id / "sprite.jpg"
-        await asyncio.to_thread(render_waveform, video_path, waveform_path)
-        await asyncio.to_thread(render_sprite, video_path, sprite_path, duration)
-        await update_job(
-            job_id,
-            {
-                "duration": duration,
-                "waveform_url": media_url(waveform_path),
-                "sprite_url": media_url(sprite_path),
-            },
-        )
-        plan = build_clip_plan(duration, clip_length)
-        safe_length = min(clip_length, max(5, duration))
-        clips: List[dict] = []
-        total = len(plan)
-
-        for index, start_time in enumerate(plan):
-            clip_id = str(uuid.uuid4())
-            output_path = CLIP_DIR / job_id / f"{clip_id}.mp4"
-            thumb_path = CLIP_DIR / job_id / f"{clip_id}.jpg"
-            await asyncio.to_thread(render_clip, video_path, output_path, start_time, safe_length)
-            await asyncio.to_thread(render_thumbnail, video_path, thumb_path, min(start_time + 1, duration - 1))
-            end_time = start_time + safe_length
-            viral_score = min(99, 70 + int(((index + 1) / total) * 25))
-            clips.append(
-                ClipSegment(
-                    id=clip_id,
-                    title=f"Corte destacado #{index + 1}",
-                    start_time=start_time,
-                    end_time=end_time,
-                    duration=safe_length,
-                    viral_score=viral_score,
-                    thumbnail_url=media_url(thumb_path),
-                    caption=f"Trecho selecionado de {title}.",
-                    video_url=media_url(output_path),
-                ).model_dump()
-            )
-            await update_job(
-                job_id,
-                {
-                    "progress": 20 + int(((index + 1) / total) * 70),
-                    "clips": clips,
-                    "clip_count": len(clips),
-                },
+        async with cpu_budget.reserve(job_core_share()) as threads:
+            command = build_batch_command(
+                video_path,
+                clips,
+                waveform_path,
+                has_audio,
+                threads,
+                rungs,
+                crop_track,
+                captions,
+                encode,
             )
+            await run_ffmpeg(command, duration, on_progress)
+    finally:
+        for clip in clips:
+            clear_filter_files(clip["video_path"])
+            thumb_path = clip["thumb_path"]
+            thumb_path.with_name(f"{thumb_path.stem}.thumb.crop.cmd").unlink(missing_ok=True)
+    return has_audio
 
-        await update_job(job_id, {"status": "completed", "progress": 100, "clips": clips, "clip_count": len(clips)})
-    except Exception as exc:
-        await update_job(job_id, {"status": "error", "error_message": str(exc), "progress": 0})
 
+KEYFRAME_SNAP_SECONDS = float(os.environ.get("KEYFRAME_SNAP_SECONDS", "1.0"))
 
-@api_router.post("/jobs", response_model=ClipJob)
-async def create_job(payload: ClipJobCreate):
-    job = ClipJob(
-        youtube_url=payload.youtube_url,
-        title="Importação do YouTube",
-        status="queued",
-        progress=0,
-        clip_count=0,
-        clips=[],
-        clip_length=payload.clip_length,
-        language=payload.language or "pt",
-        style=payload.style or "dinamico",
-        error_message=None,
+
+def probe_frames(video_path: Path, fps: Optional[float] = None) -> int:
+    # Frame count of the first video stream. Concatenated files carry small
+    # timestamp gaps, so this measures their length better than the stream
+    # duration does. Containers that store no count in the header
+    # (stream-copied mkv, some mp4 segments) are counted by demuxing their
+    # packets, and as a last resort the stream or format duration times fps
+    # is used; 0 means none of these was available.
+    probe = json.loads(
+        run_command(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-count_packets",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=nb_frames,nb_read_packets,duration:format=duration",
+                "-of",
+                "json",
+                str(video_path),
+            ]
+        )
     )
-    doc = job.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
-    doc["clips"] = [clip.model_dump() for clip in job.clips]
-    await db.clip_jobs.insert_one(doc)
-    asyncio.create_task(process_job(job.id, payload.youtube_url, payload.clip_length))
-    return job
+    stream = next(iter(probe.get("streams", [])), {})
+    for field in ("nb_frames", "nb_read_packets"):
+        frames = str(stream.get(field, ""))
+        if frames.isdigit() and int(frames):
+            return int(frames)
+    duration = stream.get("duration") or probe.get("format", {}).get("duration")
+    try:
+        return round(float(duration) * fps) if fps else 0
+    except (TypeError, ValueError):
+        return 0
 
 
-@api_router.get("/jobs", response_model=List[ClipJob])
-async def list_jobs():
-    jobs = await db.clip_jobs.find(
-        {},
-        {
-            "_id": 0,
-            "id": 1,
-            "title": 1,
-            "status": 1,
-            "progress": 1,
-            "clip_count": 1,
-            "clip_length": 1,
-            "youtube_url": 1,
-            "created_at": 1,
-            "clips": 1,
-            "language": 1,
-            "style": 1,
-        },
-    ).sort("created_at", -1).to_list(100)
-    return [serialize_job(job) for job in jobs]
+def duration_matches(video_path: Path, expected: float, fps: Optional[float]) -> bool:
+    # Stream-copied cuts are accurate to a frame; a seek that landed one GOP
+    # early shows up here as whole seconds of repeated footage.
+    fps = fps or 30
+    frames = probe_frames(video_path, fps)
+    if abs(frames - expected * fps) <= 1:
+        return True
+    if frames:
+        logger.info("%s has %d frames where %d were expected", video_path.name, frames, round(expected * fps))
+    else:
+        logger.info("Could not measure the length of %s", video_path.name)
+    return False
 
 
-@api_router.get("/jobs/{job_id}", response_model=ClipJob)
-async def get_job(job_id: str):
-    job = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0})
-    if not job:
-        raise HTTPException(status_code=404, detail="Job não encontrado")
-    return serialize_job(job)
+@timed("clip")
+async def copy_segment(video_path: Path, output_path: Path, start: float, duration: float) -> None:
+    # start is a keyframe pts. An input seek snaps back to the keyframe at or
+    # before it, so it is nudged a millisecond past instead of rounded down
+    # onto the previous GOP. -t stops copying on decode timestamps, which
+    # lets frames held back by B-frame reordering run past the end, so the
+    # video is capped by its frame count as well.
+    fps = (await run_media(load_media_info, video_path))["video"]["fps"]
+    command = [
+        "ffmpeg",
+        "-y",
+        "-ss",
+        f"{start + 0.001:.3f}",
+        "-i",
+        str(video_path),
+        "-t",
+        f"{duration:.3f}",
+        *(["-frames:v", str(round(duration * fps))] if fps else []),
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0?",
+        "-c",
+        "copy",
+        "-avoid_negative_ts",
+        "make_zero",
+        "-movflags",
+        "+faststart",
+        str(output_path),
+    ]
+    await run_ffmpeg(command)
 
 
-@api_router.get("/jobs/{job_id}/clips", response_model=List[ClipSegment])
-async def get_job_clips(job_id: str):
-    job = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0, "clips": 1})
-    if not job:
-        raise HTTPException(status_code=404, detail="Job não encontrado")
+@timed("clip")
+async def concat_segments(segments: List[Path], output_path: Path) -> None:
+    list_path = output_path.with_name(f"{output_path.stem}.concat.txt")
+    list_path.write_text("".join(f"file '{segment.as_posix()}'\n" for segment in segments))
+    try:
+        await run_ffmpeg(
+            [
+                "ffmpeg",
+                "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                str(list_path),
+                "-c",
+                "copy",
+                "-movflags",
+                "+faststart",
+                str(output_path),
+            ]
+        )
+    finally:
+        list_path.unlink(missing_ok=True)
+
+
+@timed("clip")
+async def render_clip_fast(
+    video_path: Path,
+    output_path: Path,
+    start: int,
+    duration: int,
+    threads: int = 0,
+    on_progress: Optional[ProgressCallback] = None,
+    encode: Optional[dict] = None,
+) -> None:
+    # Stream-copy when the cut lands near a keyframe; otherwise re-encode only
+    # the leading partial GOP and concat-copy the rest of the clip onto it.
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    index = await run_media(load_media_info, video_path)
+    keyframes = index["keyframes"]
+    if not index["copyable"] or not keyframes:
+        await render_clip(video_path, output_path, start, duration, threads, on_progress, encode=encode)
+        return
+    end = start + duration
+    nearest = bisect.bisect_left(keyframes, start - KEYFRAME_SNAP_SECONDS)
+    following = bisect.bisect_right(keyframes, start)
+    if nearest < len(keyframes) and abs(keyframes[nearest] - start) <= KEYFRAME_SNAP_SECONDS:
+        await copy_segment(video_path, output_path, keyframes[nearest], duration)
+    elif following >= len(keyframes) or keyframes[following] >= end:
+        await render_clip(video_path, output_path, start, duration, threads, on_progress, encode=encode)
+        return
+    else:
+        boundary = keyframes[following]
+        head_path = output_path.with_name(f"{output_path.stem}.head.mp4")
+        tail_path = output_path.with_name(f"{output_path.stem}.tail.mp4")
+        try:
+            await render_clip(video_path, head_path, start, boundary - start, threads, encode=encode)
+            await copy_segment(video_path, tail_path, boundary, end - boundary)
+            await concat_segments([head_path, tail_path], output_path)
+        finally:
+            head_path.unlink(missing_ok=True)
+            tail_path.unlink(missing_ok=True)
+    if not await run_media(duration_matches, output_path, duration, index["video"]["fps"]):
+        logger.warning("Stream copy of %s at %ss has the wrong length, re-encoding", video_path.name, start)
+        await render_clip(video_path, output_path, start, duration, threads, on_progress, encode=encode)
+
+
+def stream_copyable(render_mode: str, crop_track: Optional[dict], captions: Optional[dict], encode: dict) -> bool:
+    # Fast mode copies source GOPs, which only works when nothing changes
+    # the picture.
+    return render_mode == "fast" and not crop_track and not captions and not encode["height"]
+
+
+def clip_rungs(media_info: dict, render_mode: str, encode: dict) -> List[int]:
+    # Capped-height profiles are already a low rendition.
+    return hls_rungs(media_info) if render_mode != "fast" and not encode["height"] else []
+
+
+def encoder_tuning_path() -> Path:
+    return STORAGE_DIR / "encoder-tuning.json"
+
+
+def host_signature() -> dict:
+    # A cached tuning is only reused on the same CPUs, budget and ffmpeg.
+    version = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, check=True).stdout
+    return {
+        "cpu_count": os.cpu_count(),
+        "machine": platform.machine(),
+        "cpu_budget": RENDER_CPU_BUDGET,
+        "core_share": job_core_share(),
+        "ffmpeg": version.partition("\n")[0],
+    }
+
+
+async def measure_encode(sample_path: Path, preset: str, threads: int) -> float:
+    # Encode fps of the sample with nothing else rendering on the host.
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        str(sample_path),
+        "-an",
+        "-c:v",
+        "libx264",
+        "-preset",
+        preset,
+        "-crf",
+        str(ENCODE_PROFILES["publish"]["crf"]),
+        *thread_args(threads),
+        "-f",
+        "null",
+        os.devnull,
+    ]
+    async with cpu_budget.reserve(RENDER_CPU_BUDGET):
+        started = time.perf_counter()
+        await run_ffmpeg(command)
+        return ENCODER_TUNE_SECONDS * ENCODER_TUNE_RATE / (time.perf_counter() - started)
+
+
+def pick_encoder_tuning(results: List[dict], share: int) -> dict:
+    # Threads per encode: the best fps per core at the default preset. The
+    # publish preset: the slowest one whose fps at those threads, times the
+    # encodes a job runs side by side, still reaches the target.
+    default = [result for result in results if result["preset"] == ENCODE_PROFILES["publish"]["preset"]]
+    threads = max(default, key=lambda result: result["fps_per_core"])["threads"]
+    parallel = max(1, share // threads)
+    for preset in ENCODER_TUNE_PRESETS:
+        fps = next(result["fps"] for result in results if result["preset"] == preset and result["threads"] == threads)
+        if fps * parallel >= ENCODER_TUNE_TARGET_FPS:
+            return {"preset": preset, "threads": threads}
+    return {"preset": ENCODER_TUNE_PRESETS[-1], "threads": threads}
+
+
+async def tune_encoder() -> None:
+    # Runs in the background at startup: benchmarks preset/thread pairs on
+    # a short synthetic 720p clip once per host and caches the choice next
+    # to the storage. Renders use the untuned defaults until it finishes.
+    path = encoder_tuning_path()
+    try:
+        signature = await run_media(host_signature)
+        try:
+            cached = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            cached = {}
+        if cached.get("signature") == signature:
+            encoder_tuning.update(cached)
+            return
+        share = job_core_share()
+        sample_path = VIDEO_DIR / f"encoder-tune.{uuid.uuid4().hex}.mp4"
+        results = []
+        try:
+            with timed_stage("autotune"):
+                await run_ffmpeg(
+                    [
+                        "ffmpeg",
+                        "-y",
+                        "-f",
+                        "lavfi",
+                        "-i",
+                        f"testsrc2=size=1280x720:rate={ENCODER_TUNE_RATE}:duration={ENCODER_TUNE_SECONDS}",
+                        "-c:v",
+                        "libx264",
+                        "-preset",
+                        "ultrafast",
+                        "-crf",
+                        "18",
+                        str(sample_path),
+                    ]
+                )
+                for preset in ENCODER_TUNE_PRESETS:
+                    for threads in sorted({1, max(1, share // 2), share}):
+                        fps = await measure_encode(sample_path, preset, threads)
+                        results.append(
+                            {
+                                "preset": preset,
+                                "threads": threads,
+                                "fps": round(fps, 1),
+                                "fps_per_core": round(fps / threads, 1),
+                            }
+                        )
+        finally:
+            sample_path.unlink(missing_ok=True)
+        tuning = {
+            **pick_encoder_tuning(results, share),
+            "signature": signature,
+            "results": results,
+            "tuned_at": datetime.now(timezone.utc).isoformat(),
+        }
+        temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        temp_path.write_text(json.dumps(tuning))
+        os.replace(temp_path, path)
+        encoder_tuning.update(tuning)
+        logger.info("Encoder tuned: preset %s, %s thread(s) per encode", tuning["preset"], tuning["threads"])
+    except (OSError, subprocess.CalledProcessError):
+        logger.warning("Encoder auto-tuning failed, keeping the default profiles", exc_info=True)
+
+
+RENDER_CACHE_DIR = STORAGE_DIR / "renders"
+RENDER_CACHE_MAX_BYTES = int(float(os.environ.get("RENDER_CACHE_MAX_GB", "5")) * 1024**3)
+PARTIAL_MIN_COPY_SECONDS = float(os.environ.get("PARTIAL_MIN_COPY_SECONDS", "4"))
+render_cache_lock = threading.Lock()
+
+
+def render_source_id(job: dict, video_path: Path) -> str:
+    return job.get("source_key") or video_path.stem
+
+
+def render_cache_path(source_id: str, start: float, end: float, profile: str, suffix: str) -> Path:
+    key = hashlib.sha1(f"{source_id}:{start:.3f}:{end:.3f}:{profile}".encode()).hexdigest()
+    return RENDER_CACHE_DIR / f"{key}.{suffix}"
+
+
+def render_profile(
+    profile: str, aspect_ratio: str = "original", captions: Optional[dict] = None, encode: Optional[dict] = None
+) -> str:
+    if aspect_ratio != "original":
+        profile = f"{profile}@{aspect_ratio}"
+    if captions:
+        profile = f"{profile}+{captions['key']}"
+    return f"{profile}~{encode['key']}" if encode else profile
+
+
+def thumb_cache_path(
+    source_id: str, timestamp: float, aspect_ratio: str = "original", encode: Optional[dict] = None
+) -> Path:
+    profile = render_profile("thumb", aspect_ratio, None, encode)
+    return render_cache_path(source_id, timestamp, timestamp, profile, "jpg")
+
+
+def touch_cached(path: Path) -> bool:
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def render_cache_files() -> List[Path]:
+    return [
+        path
+        for path in RENDER_CACHE_DIR.glob("*.*")
+        # more than one suffix: a render still being written
+        if len(path.suffixes) == 1 or path.name.endswith(".probe.json")
+    ]
+
+
+def prune_render_cache() -> None:
+    # Least recently used renders go first; hits refresh mtime. Job outputs
+    # are hard links, so evicting a cache entry never removes a served file.
+    with render_cache_lock:
+        entries = []
+        for path in render_cache_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= RENDER_CACHE_MAX_BYTES:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def seed_render_cache(
+    source_id: str,
+    renders: List[dict],
+    render_mode: str,
+    aspect_ratio: str = "original",
+    captions: Optional[dict] = None,
+    encode: Optional[dict] = None,
+) -> None:
+    # First renders go into the cache as hard links so the first trim of a
+    # clip can already reuse its GOPs.
+    RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    encode = encode or encode_profile()
+    profile = render_profile(render_mode, aspect_ratio, captions, encode)
+    for render in renders:
+        start = render["start"]
+        end = start + render["duration"]
+        link_file(render["video_path"], render_cache_path(source_id, start, end, profile, "mp4"))
+        link_file(render["thumb_path"], thumb_cache_path(source_id, render["thumb_at"], aspect_ratio, encode))
+    prune_render_cache()
+
+
+async def render_clip_partial(
+    video_path: Path,
+    base_path: Path,
+    base_start: float,
+    output_path: Path,
+    start: float,
+    duration: float,
+    threads: int = 0,
+    crop_track: Optional[dict] = None,
+    captions: Optional[dict] = None,
+    encode: Optional[dict] = None,
+) -> bool:
+    # Reuses an earlier render of an overlapping range: the GOPs of that file
+    # that fall inside the new range are stream-copied, and only the head
+    # and tail up to the nearest copied keyframe are encoded from the source.
+    # Returns False when too little would be copied to be worth it.
+    base_info = await run_media(load_media_info, base_path)
+    if not base_info["copyable"] or not base_info["keyframes"]:
+        return False
+    base_end = base_start + base_info["duration"]
+    end = start + duration
+    keyframes = [base_start + keyframe for keyframe in base_info["keyframes"]]
+    first = bisect.bisect_left(keyframes, max(start, base_start) - 0.001)
+    last = bisect.bisect_right(keyframes, min(end, base_end) + 0.001) - 1
+    if first >= len(keyframes):
+        return False
+    copy_from = keyframes[first]
+    copy_to = base_end if abs(end - base_end) < 0.05 else keyframes[last] if last >= 0 else copy_from
+    if copy_to - copy_from < PARTIAL_MIN_COPY_SECONDS:
+        return False
+    stem = output_path.stem
+    head_path = output_path.with_name(f"{stem}.head.mp4")
+    middle_path = output_path.with_name(f"{stem}.middle.mp4")
+    tail_path = output_path.with_name(f"{stem}.tail.mp4")
+    segments = []
+    try:
+        if copy_from - start > 0.05:
+            await render_clip(
+                video_path,
+                head_path,
+                start,
+                round(copy_from - start, 3),
+                threads,
+                crop_track=crop_track,
+                captions=captions,
+                encode=encode,
+            )
+            segments.append(head_path)
+        await copy_segment(base_path, middle_path, copy_from - base_start, copy_to - copy_from)
+        segments.append(middle_path)
+        if end - copy_to > 0.05:
+            await render_clip(
+                video_path,
+                tail_path,
+                copy_to,
+                round(end - copy_to, 3),
+                threads,
+                crop_track=crop_track,
+                captions=captions,
+                encode=encode,
+            )
+            segments.append(tail_path)
+        await concat_segments(segments, output_path)
+    finally:
+        for path in (head_path, middle_path, tail_path):
+            path.unlink(missing_ok=True)
+    # Overlapping head, middle or tail would repeat footage; the caller then
+    # renders the whole range instead.
+    if not await run_media(duration_matches, output_path, duration, base_info["video"]["fps"]):
+        logger.warning("Partial render of %s at %ss has the wrong length, rendering in full", base_path.name, start)
+        return False
+    return True
+
+
+async def rerender_clip(
+    video_path: Path,
+    source_id: str,
+    previous: tuple,
+    start: int,
+    duration: int,
+    render_mode: str = "quality",
+    crop_track: Optional[dict] = None,
+    captions: Optional[dict] = None,
+    encode: Optional[dict] = None,
+) -> tuple:
+    # Trim edits render into the content-addressed cache under
+    # (source, start, end, profile) and return the cached clip and thumbnail
+    # paths. Returning to an earlier range is a cache hit; nudging an edge
+    # reuses the previous range's render. Files are written to a temp name
+    # and renamed, so a reader never sees a partial file.
+    RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    aspect_ratio = "9:16" if crop_track else "original"
+    encode = encode or encode_profile()
+    profile = render_profile(render_mode, aspect_ratio, captions, encode)
+    clip_path = render_cache_path(source_id, start, start + duration, profile, "mp4")
+    # Same frame as clip_render picks, so a trim near the end of the source
+    # does not ask for a thumbnail past it.
+    source_duration = max(1, int((await run_media(load_media_info, video_path))["duration"]))
+    thumb_at = max(0, min(start + 1, source_duration - 1))
+    thumb_path = thumb_cache_path(source_id, thumb_at, aspect_ratio, encode)
+    missing = [path for path in (clip_path, thumb_path) if not touch_cached(path)]
+    if not missing:
+        return clip_path, thumb_path
+    async with cpu_budget.reserve(job_core_share()) as threads:
+        if clip_path in missing:
+            temp_path = clip_path.with_name(f"{clip_path.stem}.{uuid.uuid4().hex}.mp4")
+            try:
+                base_path = render_cache_path(source_id, previous[0], previous[1], profile, "mp4")
+                reused = False
+                if render_mode != "fast" and touch_cached(base_path):
+                    reused = await render_clip_partial(
+                        video_path,
+                        base_path,
+                        previous[0],
+                        temp_path,
+                        start,
+                        duration,
+                        threads,
+                        crop_track,
+                        captions,
+                        encode,
+                    )
+                if not reused and stream_copyable(render_mode, crop_track, captions, encode):
+                    await render_clip_fast(video_path, temp_path, start, duration, threads, encode=encode)
+                elif not reused:
+                    await render_clip(
+                        video_path,
+                        temp_path,
+                        start,
+                        duration,
+                        threads,
+                        crop_track=crop_track,
+                        captions=captions,
+                        encode=encode,
+                    )
+                os.replace(temp_path, clip_path)
+            finally:
+                temp_path.unlink(missing_ok=True)
+        if thumb_path in missing:
+            temp_path = thumb_path.with_name(f"{thumb_path.stem}.{uuid.uuid4().hex}.jpg")
+            try:
+                await render_thumbnail(video_path, temp_path, thumb_at, threads, crop_track, encode)
+                os.replace(temp_path, thumb_path)
+            finally:
+                temp_path.unlink(missing_ok=True)
+    await run_media(prune_render_cache)
+    return clip_path, thumb_path
+
+
+async def render_job_parallel(
+    video_path: Path,
+    clips: List[dict],
+    waveform_path: Optional[Path],
+    on_clips_ready: Optional[Callable[[int], Awaitable[None]]] = None,
+    render_mode: str = "quality",
+    on_progress: Optional[ProgressCallback] = None,
+    rungs: Optional[List[int]] = None,
+    crop_track: Optional[dict] = None,
+    captions: Optional[dict] = None,
+    encode: Optional[dict] = None,
+) -> bool:
+    # Clips of one job render side by side, each with an equal slice of the
+    # job's core share; slots keeps the job from reserving more than that
+    # share when it has more clips than fit at once. on_clips_ready receives
+    # the length of the finished prefix so callers can persist clips in
+    # plan order.
+    encode = encode or encode_profile()
+    share = job_core_share()
+    concurrency = max(1, min(len(clips), share // encode_threads(share)))
+    threads = max(1, share // concurrency)
+    slots = asyncio.Semaphore(concurrency)
+    fractions = [0.0] * len(clips)
+
+    def clip_progress(index: int) -> ProgressCallback:
+        def report(stats: dict) -> None:
+            fractions[index] = stats["fraction"] or 0.0
+            if on_progress:
+                on_progress({**stats, "fraction": sum(fractions) / len(fractions)})
+
+        return report
+
+    async def render_one(index: int) -> int:
+        clip = clips[index]
+        async with slots, cpu_budget.reserve(threads) as granted:
+            if stream_copyable(render_mode, crop_track, captions, encode):
+                await render_clip_fast(
+                    video_path,
+                    clip["video_path"],
+                    clip["start"],
+                    clip["duration"],
+                    granted,
+                    clip_progress(index),
+                    encode,
+                )
+            else:
+                await render_clip(
+                    video_path,
+                    clip["video_path"],
+                    clip["start"],
+                    clip["duration"],
+                    granted,
+                    clip_progress(index),
+                    rungs,
+                    crop_track,
+                    captions,
+                    encode,
+                )
+            await render_thumbnail(video_path, clip["thumb_path"], clip["thumb_at"], granted, crop_track, encode)
+        return index
+
+    async def render_timeline() -> bool:
+        async with slots, cpu_budget.reserve(threads) as granted:
+            has_audio = await has_audio_stream(video_path)
+            if has_audio and waveform_path:
+                await render_waveform(video_path, waveform_path, granted)
+        return has_audio
+
+    tasks = [asyncio.ensure_future(render_one(index)) for index in range(len(clips))]
+    timeline = asyncio.ensure_future(render_timeline())
+    finished = [False] * len(clips)
+    ready = 0
+    try:
+        for future in asyncio.as_completed(tasks):
+            finished[await future] = True
+            while ready < len(clips) and finished[ready]:
+                ready += 1
+                if on_clips_ready:
+                    await on_clips_ready(ready)
+        return await timeline
+    except BaseException:
+        for task in [*tasks, timeline]:
+            task.cancel()
+        raise
+
+
+ANALYSIS_SAMPLE_RATE = 16000
+ANALYSIS_CHUNK_SECONDS = 30
+ANALYSIS_HOP_SECONDS = 0.1
+SCENE_THUMB_SIZE = (32, 18)
+PEAKS_BASE_BUCKET = 64
+PEAKS_LEVEL_FACTOR = 4
+PEAKS_LEVELS = 6
+PEAKS_MAX_WIDTH = 8192
+PEAKS_HEADER = struct.Struct("<4sIIIIQ")
+PEAKS_LEVEL_ENTRY = struct.Struct("<QQ")
+analysis_lock = threading.Lock()
+
+
+def analysis_path(video_path: Path) -> Path:
+    return video_path.with_name(f"{video_path.stem}.analysis.npz")
+
+
+def peaks_path(video_path: Path) -> Path:
+    return video_path.with_name(f"{video_path.stem}.peaks.bin")
+
+
+def reduce_peaks(peaks: "np.ndarray", factor: int) -> "np.ndarray":
+    # Pads with the last bucket, which leaves min/max unchanged.
+    count = -(-len(peaks) // factor)
+    padded = np.concatenate([peaks, np.repeat(peaks[-1:], count * factor - len(peaks), axis=0)])
+    grouped = padded.reshape(count, factor, 2)
+    return np.stack([grouped[:, :, 0].min(axis=1), grouped[:, :, 1].max(axis=1)], axis=1)
+
+
+def write_peak_pyramid(level0_path: Path, output_path: Path, samples: int) -> None:
+    # Layout: header, one (byte offset, bucket count) entry per level, then
+    # each level as int16 (min, max) pairs. Every level is FACTOR times
+    # coarser than the one before and is built from it, never from PCM.
+    level0 = np.fromfile(level0_path, dtype="<i2").reshape(-1, 2)
+    levels = [level0]
+    while len(levels) < PEAKS_LEVELS and len(levels[-1]) > 1:
+        levels.append(reduce_peaks(levels[-1], PEAKS_LEVEL_FACTOR))
+    offset = PEAKS_HEADER.size + PEAKS_LEVEL_ENTRY.size * len(levels)
+    temp_path = output_path.with_name(f"{output_path.name}.{uuid.uuid4().hex}.tmp")
+    with temp_path.open("wb") as handle:
+        handle.write(
+            PEAKS_HEADER.pack(
+                b"PKS1", ANALYSIS_SAMPLE_RATE, PEAKS_BASE_BUCKET, PEAKS_LEVEL_FACTOR, len(levels), samples
+            )
+        )
+        for level in levels:
+            handle.write(PEAKS_LEVEL_ENTRY.pack(offset, len(level)))
+            offset += level.nbytes
+        for level in levels:
+            handle.write(level.astype("<i2").tobytes())
+    os.replace(temp_path, output_path)
+    level0_path.unlink(missing_ok=True)
+
+
+def span_args(span: Optional[tuple]) -> List[str]:
+    # Input options limiting a decode to (start, length); a length of None
+    # reads to the end.
+    if not span:
+        return []
+    start, length = span
+    return ["-ss", str(start), *(["-t", str(length)] if length else [])]
+
+
+async def stream_ffmpeg(command: List[str], block_bytes: int):
+    # Yields ffmpeg's raw stdout in blocks that are a whole multiple of
+    # block_bytes (PCM samples, gray frames), so callers never see a partial
+    # sample. The process is killed if the consumer stops early or it stalls.
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_tail: deque = deque(maxlen=40)
+
+    async def drain_stderr() -> None:
+        async for line in process.stderr:
+            stderr_tail.append(line.decode(errors="replace").rstrip())
+
+    stderr_task = asyncio.ensure_future(drain_stderr())
+    pending = b""
+    usage = None
+    sampled = 0.0
+    try:
+        while True:
+            data = await asyncio.wait_for(process.stdout.read(1024 * 1024), FFMPEG_STALL_SECONDS)
+            if time.monotonic() - sampled >= PROCESS_SAMPLE_SECONDS:
+                usage = sample_process(process.pid) or usage
+                sampled = time.monotonic()
+            if not data:
+                break
+            pending += data
+            usable = len(pending) - len(pending) % block_bytes
+            if usable:
+                yield pending[:usable]
+                pending = pending[usable:]
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await asyncio.gather(stderr_task, return_exceptions=True)
+        record_process(usage)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr="\n".join(stderr_tail))
+
+
+@timed("analyze")
+async def analyze_audio(
+    video_path: Path,
+    duration: float,
+    on_progress: Optional[ProgressCallback] = None,
+    span: Optional[tuple] = None,
+    with_peaks: bool = True,
+) -> dict:
+    # Decodes mono PCM once and folds it into per-hop RMS and zero-crossing
+    # rate chunk by chunk; only the hop features are kept, so memory stays
+    # flat no matter how long the source is. The same pass streams the
+    # finest level of the waveform peak pyramid to disk.
+    hop = int(ANALYSIS_SAMPLE_RATE * ANALYSIS_HOP_SECONDS)
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        *span_args(span),
+        "-i",
+        str(video_path),
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        str(ANALYSIS_SAMPLE_RATE),
+        "-f",
+        "s16le",
+        "pipe:1",
+    ]
+    rms_parts: List = []
+    zcr_parts: List = []
+    carry = np.zeros(0, dtype=np.float32)
+    decoded = 0
+    chunk_bytes = ANALYSIS_SAMPLE_RATE * ANALYSIS_CHUNK_SECONDS * 2
+    buffer = bytearray()
+    pcm_carry = np.zeros(0, dtype=np.int16)
+    level0_path = peaks_path(video_path).with_suffix(f".{uuid.uuid4().hex}.level0")
+
+    def write_peaks(pcm: "np.ndarray", final: bool) -> None:
+        nonlocal pcm_carry
+        if not with_peaks:
+            return
+        pcm = np.concatenate([pcm_carry, pcm])
+        count = len(pcm) // PEAKS_BASE_BUCKET
+        if final and len(pcm) % PEAKS_BASE_BUCKET:
+            count += 1
+            pcm = np.pad(pcm, (0, count * PEAKS_BASE_BUCKET - len(pcm)), mode="edge")
+        buckets = pcm[: count * PEAKS_BASE_BUCKET].reshape(count, PEAKS_BASE_BUCKET)
+        pcm_carry = pcm[count * PEAKS_BASE_BUCKET :]
+        np.stack([buckets.min(axis=1), buckets.max(axis=1)], axis=1).astype("<i2").tofile(peaks_file)
+
+    def consume(raw: bytes, final: bool = False) -> None:
+        nonlocal carry
+        pcm = np.frombuffer(raw, dtype="<i2")
+        write_peaks(pcm, final)
+        samples = np.concatenate([carry, pcm.astype(np.float32) / 32768.0])
+        count = len(samples) // hop
+        frames = samples[: count * hop].reshape(count, hop)
+        carry = samples[count * hop:]
+        rms_parts.append(np.sqrt(np.mean(frames * frames, axis=1)))
+        signs = np.signbit(frames)
+        zcr_parts.append(np.mean(signs[:, 1:] != signs[:, :-1], axis=1))
+
+    try:
+        with level0_path.open("wb") as peaks_file:
+            async for block in stream_ffmpeg(command, 2):
+                buffer += block
+                decoded += len(block) // 2
+                if len(buffer) >= chunk_bytes:
+                    consume(bytes(buffer))
+                    buffer.clear()
+                    if on_progress and duration:
+                        on_progress({"fraction": min(1.0, decoded / ANALYSIS_SAMPLE_RATE / duration)})
+            consume(bytes(buffer), final=True)
+        if decoded and with_peaks:
+            await run_media(write_peak_pyramid, level0_path, peaks_path(video_path), decoded)
+    finally:
+        level0_path.unlink(missing_ok=True)
+    rms = np.concatenate(rms_parts) if rms_parts else np.zeros(0, dtype=np.float32)
+    zcr = np.concatenate(zcr_parts) if zcr_parts else np.zeros(0, dtype=np.float32)
+    return {"loudness": 20 * np.log10(rms + 1e-6), "zcr": zcr}
+
+
+async def analyze_scenes(video_path: Path, keyframes: List[float]) -> dict:
+    # Encoders place keyframes on shot changes, so decoding keyframes only
+    # (as tiny gray thumbnails) and diffing neighbours finds cuts at a small
+    # fraction of a full decode.
+    width, height = SCENE_THUMB_SIZE
+    frame_bytes = width * height
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-skip_frame",
+        "nokey",
+        "-i",
+        str(video_path),
+        "-an",
+        "-vsync",
+        "0",
+        "-vf",
+        f"scale={width}:{height},format=gray",
+        "-f",
+        "rawvideo",
+        "pipe:1",
+    ]
+    scores: List = []
+    previous = None
+    async for block in stream_ffmpeg(command, frame_bytes):
+        frames = np.frombuffer(block, dtype=np.uint8).reshape(-1, frame_bytes).astype(np.int16)
+        if previous is not None:
+            frames = np.concatenate([previous[None, :], frames])
+        else:
+            scores.append(np.zeros(1, dtype=np.float32))
+        scores.append((np.abs(np.diff(frames, axis=0)).mean(axis=1) / 255.0).astype(np.float32))
+        previous = frames[-1]
+    values = np.concatenate(scores) if previous is not None else np.zeros(0, dtype=np.float32)
+    count = min(len(values), len(keyframes))
+    return {"scene_times": np.asarray(keyframes[:count], dtype=np.float32), "scene_scores": values[:count]}
+
+
+def link_file(source: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_name(f"{target.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, target)
+
+
+def read_analysis(video_path: Path, stat: os.stat_result, needs_peaks: bool) -> Optional[dict]:
+    cache_path = analysis_path(video_path)
+    with analysis_lock:
+        if not cache_path.exists() or (needs_peaks and not peaks_path(video_path).exists()):
+            return None
+        with np.load(cache_path) as cached:
+            if int(cached["file_size"]) != stat.st_size or float(cached["mtime"]) != stat.st_mtime:
+                return None
+            return {key: cached[key] for key in cached.files}
+
+
+async def load_analysis(
+    video_path: Path, media_info: dict, on_progress: Optional[ProgressCallback] = None
+) -> dict:
+    # Highlight features are computed once per source and cached next to it
+    # as .analysis.npz, validated the same way as the probe sidecar.
+    cache_path = analysis_path(video_path)
+    stat = video_path.stat()
+    cached = await run_media(read_analysis, video_path, stat, bool(media_info.get("audio")))
+    if cached is not None:
+        return cached
+    empty = np.zeros(0, dtype=np.float32)
+    audio = {"loudness": empty, "zcr": empty}
+    scenes = {"scene_times": empty, "scene_scores": empty}
+    tasks = []
+    if media_info.get("audio"):
+        tasks.append(analyze_audio(video_path, media_info["duration"], on_progress))
+    if media_info.get("video") and media_info.get("keyframes"):
+        tasks.append(analyze_scenes(video_path, media_info["keyframes"]))
+    for result in await asyncio.gather(*tasks):
+        if "loudness" in result:
+            audio = result
+        else:
+            scenes = result
+    analysis = {
+        **audio,
+        **scenes,
+        "hop_seconds": np.float32(ANALYSIS_HOP_SECONDS),
+        "file_size": np.int64(stat.st_size),
+        "mtime": np.float64(stat.st_mtime),
+    }
+
+    def save() -> None:
+        temp_path = cache_path.with_name(f"{cache_path.stem}.{uuid.uuid4().hex}.npz")
+        np.savez(temp_path, **analysis)
+        with analysis_lock:
+            os.replace(temp_path, cache_path)
+
+    await run_media(save)
+    return analysis
+
+
+def highlight_count(duration: int, safe_length: int) -> int:
+    return min(6, max(3, max(1, duration // safe_length)))
+
+
+def highlight_timeline(analysis: dict, duration: int) -> tuple:
+    # Per-second content score in [0, 1] plus a per-second silence ratio:
+    # loudness above the source's own median, share of speech-like hops and
+    # density of scene cuts.
+    seconds = max(1, duration)
+    hops_per_second = max(1, int(round(1 / float(analysis["hop_seconds"]))))
+    loudness = np.asarray(analysis["loudness"], dtype=np.float32)
+    zcr = np.asarray(analysis["zcr"], dtype=np.float32)
+    score = np.zeros(seconds, dtype=np.float32)
+    silence = np.zeros(seconds, dtype=np.float32)
+    if loudness.size:
+        floor = np.percentile(loudness, 10)
+        speech = (loudness > floor + 12) & (zcr > 0.01) & (zcr < 0.3)
+        quiet = loudness < floor + 6
+        spread = float(np.std(loudness)) or 1.0
+        level = np.clip((loudness - np.median(loudness)) / spread, -2, 3)
+        padded = seconds * hops_per_second
+
+        def per_second(values):
+            values = values.astype(np.float32)[:padded]
+            values = np.pad(values, (0, padded - values.size), mode="edge") if values.size else np.zeros(padded)
+            return values.reshape(seconds, hops_per_second).mean(axis=1)
+
+        score += 0.45 * (per_second(level) + 2) / 5 + 0.35 * per_second(speech)
+        silence = per_second(quiet)
+    scene_times = np.asarray(analysis["scene_times"])
+    if scene_times.size:
+        cuts = np.zeros(seconds, dtype=np.float32)
+        np.add.at(cuts, np.clip(scene_times.astype(np.int64), 0, seconds - 1), analysis["scene_scores"])
+        score += 0.2 * np.minimum(1.0, cuts / (np.percentile(cuts[cuts > 0], 90) if (cuts > 0).any() else 1.0))
+    return score, silence
+
+
+def plan_highlights(
+    analysis: dict, duration: int, clip_length: int, clip_count: Optional[int] = None
+) -> List[tuple]:
+    # Scores every window start with a cumulative sum, keeps the starts that
+    # are the maximum of their own sliding window, then greedily takes the
+    # best ones that do not overlap an already chosen clip. Returns
+    # (start, viral_score) pairs in timeline order.
+    safe_length = min(clip_length, max(5, duration))
+    if duration <= safe_length:
+        return [(0, 80)]
+    score, silence = highlight_timeline(analysis, duration)
+    if not score.any():
+        return even_clip_plan(duration, clip_length)
+    clip_count = clip_count or highlight_count(duration, safe_length)
+    sums = np.concatenate([[0.0], np.cumsum(score, dtype=np.float64)])
+    windows = (sums[safe_length:] - sums[:-safe_length]) / safe_length
+    half = safe_length // 2
+    padded = np.pad(windows, half, constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1).max(axis=1)
+    candidates = np.flatnonzero(windows >= local_max)
+    ordered = np.concatenate(
+        [candidates[np.argsort(-windows[candidates], kind="stable")], np.argsort(-windows, kind="stable")]
+    )
+    chosen: List[int] = []
+    for start in ordered.tolist():
+        if len(chosen) == clip_count:
+            break
+        if all(abs(start - other) >= safe_length for other in chosen):
+            chosen.append(start)
+    chosen.sort()
+    planned = []
+    for index, start in enumerate(chosen):
+        # Nudge the cut into the quietest second nearby so it does not land
+        # mid-sentence, as long as that keeps clips apart. Among equally
+        # quiet seconds the closest wins, so flat audio keeps the start.
+        low, high = max(0, start - 2), min(len(windows) - 1, start + 2)
+        nearby = silence[low : high + 1]
+        quietest = low + np.flatnonzero(nearby == nearby.max())
+        nudged = int(quietest[np.argmin(np.abs(quietest - start))])
+        if all(abs(nudged - other) >= safe_length for other in chosen[:index] + chosen[index + 1 :]):
+            chosen[index] = start = nudged
+        rank = float(np.mean(windows < windows[start]))
+        planned.append((start, min(99, 60 + int(rank * 39))))
+    return planned
+
+
+REFRAME_SAMPLE_FPS = 4
+REFRAME_SAMPLE_SIZE = (96, 54)
+REFRAME_SMOOTH_SECONDS = 2.0
+REFRAME_MAX_PAN = 0.25
+reframe_lock = threading.Lock()
+
+
+def crop_track_path(video_path: Path) -> Path:
+    return video_path.with_name(f"{video_path.stem}.reframe.npz")
+
+
+def crop_centers(frames: "np.ndarray", previous: Optional["np.ndarray"]) -> "np.ndarray":
+    # Horizontal center of interest per frame: column-wise motion energy
+    # against the previous sample plus edge energy as a static saliency cue,
+    # sharpened and reduced to a weighted centroid in [0, 1].
+    frames = frames.astype(np.float32)
+    before = np.concatenate([frames[:1] if previous is None else previous[None], frames[:-1]])
+    motion = np.abs(frames - before).sum(axis=1)
+    edges = np.abs(np.diff(frames, axis=2)).sum(axis=1)
+    edges = np.pad(edges, ((0, 0), (0, 1)), mode="edge")
+    energy = motion / (motion.sum(axis=1, keepdims=True) + 1e-6) * 0.7
+    energy += edges / (edges.sum(axis=1, keepdims=True) + 1e-6) * 0.3
+    energy = energy**2
+    columns = (np.arange(frames.shape[2], dtype=np.float32) + 0.5) / frames.shape[2]
+    return (energy * columns).sum(axis=1) / (energy.sum(axis=1) + 1e-12)
+
+
+def smooth_track(centers: "np.ndarray") -> "np.ndarray":
+    # Median over ~1 s kills single-frame jumps, a moving average over
+    # REFRAME_SMOOTH_SECONDS makes the pan continuous, and the per-sample
+    # step is capped so the virtual camera never whips.
+    if centers.size < 3:
+        return centers
+    half = REFRAME_SAMPLE_FPS // 2
+    padded = np.pad(centers, half, mode="edge")
+    centers = np.median(np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1), axis=1)
+    window = max(1, int(REFRAME_SMOOTH_SECONDS * REFRAME_SAMPLE_FPS))
+    padded = np.pad(centers, (window // 2, window - 1 - window // 2), mode="edge")
+    centers = np.convolve(padded, np.ones(window) / window, mode="valid")
+    step = REFRAME_MAX_PAN / REFRAME_SAMPLE_FPS
+    limited = np.empty_like(centers)
+    limited[0] = centers[0]
+    for index in range(1, len(centers)):
+        limited[index] = limited[index - 1] + np.clip(centers[index] - limited[index - 1], -step, step)
+    return limited.astype(np.float32)
+
+
+@timed("reframe")
+async def compute_crop_track(video_path: Path, span: Optional[tuple] = None) -> "np.ndarray":
+    width, height = REFRAME_SAMPLE_SIZE
+    frame_bytes = width * height
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-skip_frame",
+        "bidir",
+        *span_args(span),
+        "-i",
+        str(video_path),
+        "-an",
+        "-vf",
+        f"fps={REFRAME_SAMPLE_FPS},scale={width}:{height},format=gray",
+        "-f",
+        "rawvideo",
+        "pipe:1",
+    ]
+    parts: List = []
+    previous = None
+    async for block in stream_ffmpeg(command, frame_bytes):
+        frames = np.frombuffer(block, dtype=np.uint8).reshape(-1, height, width)
+        parts.append(crop_centers(frames, previous))
+        previous = frames[-1].astype(np.float32)
+    centers = np.concatenate(parts) if parts else np.full(1, 0.5, dtype=np.float32)
+    return smooth_track(centers)
+
+
+def read_crop_track(video_path: Path, stat: os.stat_result) -> Optional["np.ndarray"]:
+    track_path = crop_track_path(video_path)
+    with reframe_lock:
+        if not track_path.exists():
+            return None
+        with np.load(track_path) as cached:
+            if int(cached["file_size"]) != stat.st_size or float(cached["mtime"]) != stat.st_mtime:
+                return None
+            return cached["centers"]
+
+
+def save_crop_track(video_path: Path, stat: os.stat_result, centers: "np.ndarray") -> None:
+    track_path = crop_track_path(video_path)
+    temp_path = track_path.with_name(f"{track_path.stem}.{uuid.uuid4().hex}.npz")
+    np.savez(temp_path, centers=centers, file_size=np.int64(stat.st_size), mtime=np.float64(stat.st_mtime))
+    with reframe_lock:
+        os.replace(temp_path, track_path)
+
+
+async def load_crop_track(video_path: Path) -> dict:
+    # Sampled at REFRAME_SAMPLE_FPS from a low-res decode that skips
+    # B-frames, computed once per source and cached next to it.
+    stat = video_path.stat()
+    centers = await run_media(read_crop_track, video_path, stat)
+    if centers is None:
+        centers = await compute_crop_track(video_path)
+        await run_media(save_crop_track, video_path, stat, centers)
+    media_info = await run_media(load_media_info, video_path)
+    return crop_track_for(centers, media_info)
+
+
+def crop_track_for(centers: "np.ndarray", media_info: dict) -> dict:
+    video = media_info.get("video") or {}
+    return {"centers": centers, "width": video.get("width") or 0, "height": video.get("height") or 0}
+
+
+def reframe_width(width: int, height: int) -> int:
+    return min(width, int(height * 9 / 16) // 2 * 2)
+
+
+def reframed_media_info(media_info: dict) -> dict:
+    # Media info as seen by outputs of the 9:16 crop (HLS master sizes).
+    video = dict(media_info.get("video") or {})
+    if video.get("width") and video.get("height"):
+        video["width"] = reframe_width(video["width"], video["height"])
+    return {**media_info, "video": video}
+
+
+def reframe_filter(track: dict, start: float, duration: float, commands_path: Path) -> str:
+    # 9:16 crop whose x follows the track. sendcmd feeds crop new x values
+    # at the track's sample times, relative to the (already trimmed) clip.
+    width, height = track["width"], track["height"]
+    crop_width = reframe_width(width, height)
+    centers = track["centers"]
+    first = int(start * REFRAME_SAMPLE_FPS)
+    last = min(len(centers), int(np.ceil((start + duration) * REFRAME_SAMPLE_FPS)) + 1)
+    window = centers[min(first, len(centers) - 1) : max(last, first + 1)]
+    positions = np.clip(np.round(window * width - crop_width / 2), 0, width - crop_width).astype(int)
+    times = np.arange(len(positions)) / REFRAME_SAMPLE_FPS + (first / REFRAME_SAMPLE_FPS - start)
+    commands_path.parent.mkdir(parents=True, exist_ok=True)
+    commands_path.write_text(
+        "".join(f"{max(0.0, t):.3f} crop x {x};\n" for t, x in zip(times.tolist(), positions.tolist()))
+    )
+    return f"sendcmd=f={commands_path.as_posix()},crop=w={crop_width}:h={height // 2 * 2}:x={positions[0]}:y=0"
+
+TRANSCRIBE_MODEL = os.environ.get("TRANSCRIBE_MODEL", "small")
+TRANSCRIBE_WORKERS = max(1, int(os.environ.get("TRANSCRIBE_WORKERS", "2")))
+TRANSCRIBE_CHUNK_SECONDS = 30
+TRANSCRIBE_CUT_WINDOW_SECONDS = 5
+CAPTIONS_ENABLED = os.environ.get("CAPTIONS_ENABLED", "1") != "0" and WhisperModel is not None
+# Caption looks per job style. Sizes and margins are fractions of the output
+# frame height, so the same preset works for 16:9 and 9:16 clips.
+CAPTION_STYLES = {
+    "dinamico": {
+        "font_size": 0.075,
+        "colour": "&H0000FFFF",
+        "outline": 4,
+        "box": False,
+        "margin": 0.22,
+        "max_words": 3,
+        "uppercase": True,
+    },
+    "calmo": {
+        "font_size": 0.05,
+        "colour": "&H00FFFFFF",
+        "outline": 2,
+        "box": False,
+        "margin": 0.08,
+        "max_words": 7,
+        "uppercase": False,
+    },
+    "podcast": {
+        "font_size": 0.055,
+        "colour": "&H00FFFFFF",
+        "outline": 1,
+        "box": True,
+        "margin": 0.1,
+        "max_words": 6,
+        "uppercase": False,
+    },
+}
+CAPTION_MAX_GAP_SECONDS = 0.6
+transcript_lock = threading.Lock()
+speech_model_lock = threading.Lock()
+transcribe_executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix="transcribe")
+transcriptions: dict = {}
+loaded_speech_model = None
+
+
+def transcript_path(video_path: Path, language: str) -> Path:
+    return video_path.with_name(f"{video_path.stem}.words.{language}.json")
+
+
+def job_transcript_path(job_id: str) -> Path:
+    return CLIP_DIR / job_id / "transcript.json"
+
+
+def transcribe_threads() -> int:
+    # Inference threads per transcribe worker. All workers together use one
+    # job's core share, which is what a transcription reserves, so renders
+    # of other jobs keep the rest of the budget.
+    return max(1, job_core_share() // TRANSCRIBE_WORKERS)
+
+
+def speech_model():
+    # Loaded on first use; num_workers lets every transcribe thread run its
+    # own inference on the shared weights.
+    global loaded_speech_model
+    with speech_model_lock:
+        if loaded_speech_model is None:
+            loaded_speech_model = WhisperModel(
+                TRANSCRIBE_MODEL,
+                device="cpu",
+                compute_type="int8",
+                cpu_threads=transcribe_threads(),
+                num_workers=TRANSCRIBE_WORKERS,
+            )
+        return loaded_speech_model
+
+
+def transcribe_chunk(samples: "np.ndarray", offset: float, language: str) -> List[list]:
+    segments, _ = speech_model().transcribe(
+        samples,
+        language=language,
+        word_timestamps=True,
+        beam_size=1,
+        condition_on_previous_text=False,
+        vad_filter=True,
+    )
+    return [
+        [round(offset + word.start, 3), round(offset + word.end, 3), word.word.strip()]
+        for segment in segments
+        for word in segment.words or []
+        if word.word.strip()
+    ]
+
+
+def quiet_cut(samples: "np.ndarray", target: int) -> int:
+    # Chunks end at the quietest hop in the last TRANSCRIBE_CUT_WINDOW_SECONDS
+    # before the target, so a cut rarely splits a word.
+    hop = int(ANALYSIS_SAMPLE_RATE * ANALYSIS_HOP_SECONDS)
+    window = int(ANALYSIS_SAMPLE_RATE * TRANSCRIBE_CUT_WINDOW_SECONDS) // hop * hop
+    frames = samples[target - window : target].reshape(-1, hop)
+    quietest = int(np.argmin(np.sqrt(np.mean(frames**2, axis=1))))
+    return target - window + quietest * hop + hop // 2
+
+
+@timed("transcribe")
+async def transcribe_audio(
+    video_path: Path,
+    language: str,
+    duration: float,
+    on_progress: Optional[ProgressCallback] = None,
+    span: Optional[tuple] = None,
+) -> List[list]:
+    # The decode is streamed and cut into ~30 s chunks that are transcribed
+    # side by side on the transcribe pool; at most two chunks per worker are
+    # buffered, which also throttles the decoder.
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        *span_args(span),
+        "-i",
+        str(video_path),
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        str(ANALYSIS_SAMPLE_RATE),
+        "-f",
+        "f32le",
+        "pipe:1",
+    ]
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(TRANSCRIBE_WORKERS * 2)
+    chunk_samples = ANALYSIS_SAMPLE_RATE * TRANSCRIBE_CHUNK_SECONDS
+    tasks: List[asyncio.Future] = []
+    transcribed = 0.0
+
+    async def submit(samples: "np.ndarray", offset: float) -> List[list]:
+        nonlocal transcribed
+        try:
+            context = contextvars.copy_context()
+            words = await loop.run_in_executor(
+                transcribe_executor, context.run, run_measured, transcribe_chunk, samples, offset, language
+            )
+        finally:
+            slots.release()
+        transcribed += len(samples) / ANALYSIS_SAMPLE_RATE
+        if on_progress and duration:
+            on_progress({"fraction": min(1.0, transcribed / duration)})
+        return words
+
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = float(span[0]) if span else 0.0
+    try:
+        async for block in stream_ffmpeg(command, 4):
+            buffer = np.concatenate([buffer, np.frombuffer(block, dtype="<f4")])
+            while len(buffer) >= chunk_samples:
+                cut = quiet_cut(buffer, chunk_samples)
+                await slots.acquire()
+                tasks.append(asyncio.ensure_future(submit(buffer[:cut].copy(), offset)))
+                offset += cut / ANALYSIS_SAMPLE_RATE
+                buffer = buffer[cut:]
+        if len(buffer) > ANALYSIS_SAMPLE_RATE * ANALYSIS_HOP_SECONDS:
+            await slots.acquire()
+            tasks.append(asyncio.ensure_future(submit(buffer, offset)))
+        chunks = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return sorted((word for words in chunks for word in words), key=lambda word: word[0])
+
+
+def read_transcript(path: Path, stat: Optional[os.stat_result] = None) -> Optional[List[list]]:
+    with transcript_lock:
+        if not path.exists():
+            return None
+        cached = json.loads(path.read_text())
+    if cached.get("model") != TRANSCRIBE_MODEL:
+        return None
+    if stat and (cached.get("file_size") != stat.st_size or cached.get("mtime") != stat.st_mtime):
+        return None
+    return cached["words"]
+
+
+def save_transcript(video_path: Path, language: str, stat: os.stat_result, words: List[list]) -> Path:
+    path = transcript_path(video_path, language)
+    document = {
+        "model": TRANSCRIBE_MODEL,
+        "language": language,
+        "file_size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "words": words,
+    }
+    temp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.json")
+    temp_path.write_text(json.dumps(document))
+    with transcript_lock:
+        os.replace(temp_path, path)
+    return path
+
+
+async def load_transcript(
+    video_path: Path, language: str, duration: float, on_progress: Optional[ProgressCallback] = None
+) -> Path:
+    # Word timestamps are inferred once per source and language and cached
+    # next to it; jobs over the same source share one running transcription.
+    path = transcript_path(video_path, language)
+    stat = video_path.stat()
+    if await run_media(read_transcript, path, stat) is not None:
+        return path
+    task = transcriptions.get(path)
+    if task is None:
+
+        async def transcribe() -> None:
+            async with cpu_budget.reserve(transcribe_threads() * TRANSCRIBE_WORKERS):
+                words = await transcribe_audio(video_path, language, duration, on_progress)
+            await run_media(save_transcript, video_path, language, stat, words)
+
+        task = asyncio.ensure_future(transcribe())
+        transcriptions[path] = task
+        task.add_done_callback(lambda _: transcriptions.pop(path, None))
+    await asyncio.shield(task)
+    return path
+
+
+def caption_lines(words: List[list], style: str) -> List[tuple]:
+    # Lines are grouped over the whole transcript in source time, so every
+    # render of an overlapping range (and every partial re-render segment)
+    # shows the same line at the same moment.
+    preset = CAPTION_STYLES.get(style, CAPTION_STYLES["dinamico"])
+    lines: List[tuple] = []
+    current: List[list] = []
+    for word in words:
+        if current and (
+            len(current) >= preset["max_words"]
+            or word[0] - current[-1][1] > CAPTION_MAX_GAP_SECONDS
+            or current[-1][2][-1:] in ".?!"
+        ):
+            lines.append((current[0][0], current[-1][1], " ".join(item[2] for item in current)))
+            current = []
+        current.append(word)
+    if current:
+        lines.append((current[0][0], current[-1][1], " ".join(item[2] for item in current)))
+    return lines
+
+
+def caption_track(words: Optional[List[list]], style: str, language: str, media_info: dict) -> Optional[dict]:
+    if not words:
+        return None
+    video = media_info.get("video") or {}
+    lines = caption_lines(words, style)
+    return {
+        "lines": lines,
+        "ends": [line[1] for line in lines],
+        "style": style if style in CAPTION_STYLES else "dinamico",
+        "key": f"{style}-{language}",
+        "width": video.get("width") or 1280,
+        "height": video.get("height") or 720,
+    }
+
+
+def clip_lines(captions: dict, start: float, duration: float) -> List[tuple]:
+    end = start + duration
+    index = bisect.bisect_right(captions["ends"], start)
+    lines = []
+    for line_start, line_end, text in captions["lines"][index:]:
+        if line_start >= end:
+            break
+        lines.append((max(0.0, line_start - start), min(duration, line_end - start), text))
+    return lines
+
+
+def subtitle_time(seconds: float, separator: str, fraction_digits: int) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, rest = divmod(rest, 60)
+    fraction = f"{rest:0{3 + fraction_digits}.{fraction_digits}f}".replace(".", separator)
+    return f"{int(hours):0{1 if separator == '.' else 2}d}:{int(minutes):02d}:{fraction}"
+
+
+def write_srt(captions: dict, start: float, duration: float, output_path: Path) -> None:
+    blocks = [
+        f"{index}\n{subtitle_time(begin, ',', 3)} --> {subtitle_time(end, ',', 3)}\n{text}\n"
+        for index, (begin, end, text) in enumerate(clip_lines(captions, start, duration), 1)
+    ]
+    output_path.write_text("\n".join(blocks), encoding="utf-8")
+
+
+def clip_caption(captions: Optional[dict], start: float, duration: float) -> Optional[str]:
+    if not captions:
+        return None
+    text = " ".join(line[2] for line in clip_lines(captions, start, duration))
+    return text[:197] + "..." if len(text) > 200 else text or None
+
+
+def caption_filter(captions: dict, start: float, duration: float, subtitles_path: Path) -> str:
+    # ASS script for the clip range, burned in by libass in the clip encode.
+    preset = CAPTION_STYLES[captions["style"]]
+    width, height = captions["width"], captions["height"]
+    border_style, back_colour = (3, "&H80000000") if preset["box"] else (1, "&H00000000")
+    header = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 0",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BackColour, Bold, BorderStyle, Outline, "
+        "Shadow, Alignment, MarginL, MarginR, MarginV",
+        f"Style: Default,DejaVu Sans,{int(height * preset['font_size'])},{preset['colour']},&H00000000,"
+        f"{back_colour},-1,{border_style},{preset['outline']},0,2,{width // 20},{width // 20},"
+        f"{int(height * preset['margin'])}",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    events = [
+        f"Dialogue: 0,{subtitle_time(begin, '.', 2)},{subtitle_time(end, '.', 2)},Default,,0,0,0,,"
+        + re.sub(r"[{}\\]", "", text.upper() if preset["uppercase"] else text)
+        for begin, end, text in clip_lines(captions, start, duration)
+    ]
+    subtitles_path.parent.mkdir(parents=True, exist_ok=True)
+    subtitles_path.write_text("\n".join(header + events) + "\n", encoding="utf-8")
+    return f"ass=filename={subtitles_path.as_posix()}"
+
+
+def clip_video_filter(
+    crop_track: Optional[dict],
+    captions: Optional[dict],
+    start: float,
+    duration: float,
+    output_path: Path,
+    encode: Optional[dict] = None,
+) -> Optional[str]:
+    # Reframe first, then captions, so the ASS canvas is the reframed frame;
+    # a profile's height cap scales the finished picture.
+    filters = []
+    stem = output_path.stem
+    if crop_track:
+        filters.append(reframe_filter(crop_track, start, duration, output_path.with_name(f"{stem}.crop.cmd")))
+    if captions:
+        filters.append(caption_filter(captions, start, duration, output_path.with_name(f"{stem}.ass")))
+    if encode and encode["height"]:
+        filters.append(scale_filter(encode))
+    return ",".join(filters) or None
+
+
+def clear_filter_files(output_path: Path) -> None:
+    for suffix in ("crop.cmd", "ass"):
+        output_path.with_name(f"{output_path.stem}.{suffix}").unlink(missing_ok=True)
+
+
+SPRITE_TILE_WIDTH = 160
+SPRITE_TILE_HEIGHT = 90
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_LEVEL_INTERVALS = [2, 10, 60]
+sprite_renders: dict = {}
+
+
+def sprite_sheet_path(job_id: str, level: int, sheet: int) -> Path:
+    return CLIP_DIR / job_id / "sprites" / f"{level}-{sheet}.jpg"
+
+
+def sprite_sheet_url(job_id: str, level: int, sheet: int) -> str:
+    return f"/api/jobs/{job_id}/sprites/{level}/{sheet}.jpg"
+
+
+def sprite_levels(duration: float) -> List[dict]:
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    levels = []
+    for level, interval in enumerate(SPRITE_LEVEL_INTERVALS):
+        tiles = max(1, int(np.ceil(duration / interval)))
+        levels.append({"level": level, "interval": interval, "tiles": tiles, "sheets": -(-tiles // per_sheet)})
+    return levels
+
+
+def sprite_tile(level: dict, tile: int) -> tuple:
+    # (sheet, x, y) of a tile; the layout is fixed, so the index never has
+    # to wait for a sheet to be rendered.
+    sheet, position = divmod(tile, SPRITE_COLUMNS * SPRITE_ROWS)
+    row, column = divmod(position, SPRITE_COLUMNS)
+    return sheet, column * SPRITE_TILE_WIDTH, row * SPRITE_TILE_HEIGHT
+
+
+async def encode_still(frame: "np.ndarray", output_path: Path) -> None:
+    height, width = frame.shape[:2]
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg",
+        "-v",
+        "error",
+        "-y",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "-s",
+        f"{width}x{height}",
+        "-i",
+        "pipe:0",
+        *thumbnail_args(encode_profile()),
+        str(output_path),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await process.communicate(np.ascontiguousarray(frame).tobytes())
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, "ffmpeg", stderr=stderr.decode(errors="replace"))
+
+
+@timed("sprite")
+async def render_sprite_sheet(video_path: Path, media_info: dict, level: dict, sheet: int, output_path: Path) -> None:
+    # Tiles show the last keyframe at or before their timestamp. Only the
+    # keyframes between the sheet's first and last tile are decoded
+    # (-skip_frame nokey), scaled straight down to tile size.
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    first_tile = sheet * per_sheet
+    tile_count = min(per_sheet, level["tiles"] - first_tile)
+    keyframes = np.asarray(media_info.get("keyframes") or [0.0])
+    times = (first_tile + np.arange(tile_count)) * level["interval"]
+    picks = np.maximum(np.searchsorted(keyframes, times, side="right") - 1, 0)
+    low, high = int(picks.min()), int(picks.max())
+    frame_bytes = SPRITE_TILE_WIDTH * SPRITE_TILE_HEIGHT * 3
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-skip_frame",
+        "nokey",
+        "-noaccurate_seek",
+        "-ss",
+        f"{keyframes[low] + 0.001:.3f}",
+        "-i",
+        str(video_path),
+        "-an",
+        "-vsync",
+        "0",
+        "-vf",
+        f"scale={SPRITE_TILE_WIDTH}:{SPRITE_TILE_HEIGHT}:force_original_aspect_ratio=decrease,"
+        f"pad={SPRITE_TILE_WIDTH}:{SPRITE_TILE_HEIGHT}:(ow-iw)/2:(oh-ih)/2,format=rgb24",
+        "-f",
+        "rawvideo",
+        "pipe:1",
+    ]
+    wanted = high - low + 1
+    frames = np.zeros((wanted, SPRITE_TILE_HEIGHT, SPRITE_TILE_WIDTH, 3), dtype=np.uint8)
+    decoded = 0
+    async with aclosing(stream_ffmpeg(command, frame_bytes)) as blocks:
+        async for block in blocks:
+            batch = np.frombuffer(block, dtype=np.uint8).reshape(-1, SPRITE_TILE_HEIGHT, SPRITE_TILE_WIDTH, 3)
+            batch = batch[: wanted - decoded]
+            frames[decoded : decoded + len(batch)] = batch
+            decoded += len(batch)
+            if decoded == wanted:
+                break
+    if decoded:
+        # A short decode (container keyframe index off by one) repeats the
+        # last decoded frame instead of leaving black tiles.
+        frames[decoded:] = frames[decoded - 1]
+    rows = -(-tile_count // SPRITE_COLUMNS)
+    canvas = np.zeros((rows * SPRITE_TILE_HEIGHT, SPRITE_COLUMNS * SPRITE_TILE_WIDTH, 3), dtype=np.uint8)
+    for index, pick in enumerate((picks - low).tolist()):
+        row, column = divmod(index, SPRITE_COLUMNS)
+        canvas[
+            row * SPRITE_TILE_HEIGHT : (row + 1) * SPRITE_TILE_HEIGHT,
+            column * SPRITE_TILE_WIDTH : (column + 1) * SPRITE_TILE_WIDTH,
+        ] = frames[pick]
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(f"{output_path.stem}.{uuid.uuid4().hex}.jpg")
+    try:
+        await encode_still(canvas, temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+async def ensure_sprite_sheet(job: dict, level: dict, sheet: int) -> Path:
+    # Sheets are rendered on first request and kept; concurrent requests for
+    # the same sheet share one render.
+    output_path = sprite_sheet_path(job["id"], level["level"], sheet)
+    if output_path.exists():
+        return output_path
+    key = (job["id"], level["level"], sheet)
+    if key not in sprite_renders:
+        video_path = Path(job.get("source_path") or "")
+        if not job.get("source_path") or not video_path.exists():
+            raise HTTPException(status_code=404, detail="Arquivo fonte não encontrado")
+
+        async def render() -> Path:
+            try:
+                media_info = await run_media(load_media_info, video_path)
+                async with cpu_budget.reserve(1):
+                    await render_sprite_sheet(video_path, media_info, level, sheet, output_path)
+                return output_path
+            finally:
+                sprite_renders.pop(key, None)
+
+        sprite_renders[key] = asyncio.ensure_future(render())
+    return await asyncio.shield(sprite_renders[key])
+
+
+JOB_EVENT_QUEUE_SIZE = int(os.environ.get("JOB_EVENT_QUEUE_SIZE", "100"))
+JOB_EVENTS_CHANGE_STREAM = os.environ.get("JOB_EVENTS_CHANGE_STREAM", "0") == "1"
+EVENT_KEEPALIVE_SECONDS = float(os.environ.get("EVENT_KEEPALIVE_SECONDS", "15"))
+TERMINAL_STATUSES = {"completed", "error"}
+
+
+class JobEventHub:
+    # In-process fan-out of job patches to SSE and WebSocket subscribers.
+    # Subscribers register for one job id or for "*" (every job). A
+    # subscriber that falls behind gets a single resync marker instead of
+    # an unbounded backlog.
+    def __init__(self):
+        self.subscribers: dict = {}
+
+    def subscribe(self, job_id: str = "*") -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=JOB_EVENT_QUEUE_SIZE)
+        self.subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, job_id: str = "*") -> None:
+        queues = self.subscribers.get(job_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(job_id, None)
+
+    def publish(self, job_id: str, updates: dict) -> None:
+        event = {key: value for key, value in updates.items() if key in ClipJob.model_fields}
+        if event:
+            event["id"] = job_id
+            self.deliver(job_id, event)
+
+    def resync(self, job_id: str) -> None:
+        self.deliver(job_id, {"id": job_id, "resync": True})
+
+    def deliver(self, job_id: str, event: dict) -> None:
+        for queue in [*self.subscribers.get(job_id, ()), *self.subscribers.get("*", ())]:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"id": job_id, "resync": True})
+            else:
+                queue.put_nowait(event)
+
+
+job_events = JobEventHub()
+
+
+@timed("db")
+async def update_job(job_id: str, updates: dict) -> None:
+    await db.clip_jobs.update_one({"id": job_id}, {"$set": updates})
+    if not JOB_EVENTS_CHANGE_STREAM:
+        job_events.publish(job_id, updates)
+
+
+@timed("db")
+async def push_job_clips(job_id: str, clips: List[dict], all_clips: List[dict]) -> None:
+    # Appends only the new clips; the full list already in memory goes to
+    # the event hub so subscribers still get complete state without a read.
+    await db.clip_jobs.update_one(
+        {"id": job_id},
+        {"$push": {"clips": {"$each": clips}}, "$set": {"clip_count": len(all_clips)}},
+    )
+    if not JOB_EVENTS_CHANGE_STREAM:
+        job_events.publish(job_id, {"clips": all_clips, "clip_count": len(all_clips)})
+
+
+async def watch_job_changes() -> None:
+    # With several replicas each one only sees its own update_job calls, so
+    # the hub is fed from a Mongo change stream instead (replica set only).
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+        {
+            "$project": {
+                "operationType": 1,
+                "fullDocument.id": 1,
+                "updateDescription.updatedFields": 1,
+            }
+        },
+    ]
+    while True:
+        try:
+            async with db.clip_jobs.watch(pipeline, full_document="updateLookup") as stream:
+                async for change in stream:
+                    job_id = (change.get("fullDocument") or {}).get("id")
+                    if not job_id:
+                        continue
+                    updates = change.get("updateDescription", {}).get("updatedFields", {})
+                    if change["operationType"] == "update" and not any(key.startswith("clips.") for key in updates):
+                        job_events.publish(job_id, updates)
+                    else:
+                        job_events.resync(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job change stream interrupted, reconnecting")
+            await asyncio.sleep(5)
+
+
+PROGRESS_UPDATE_SECONDS = float(os.environ.get("PROGRESS_UPDATE_SECONDS", "1.0"))
+
+
+class ProgressReporter:
+    # Maps a stage's raw yt-dlp/ffmpeg progress onto the job's [low, high]
+    # progress span and writes it to the job document at most once every
+    # PROGRESS_UPDATE_SECONDS, skipping ticks while a write is in flight.
+    def __init__(self, job_id: str, stage: str, low: int, high: int):
+        self.job_id = job_id
+        self.stage = stage
+        self.low = low
+        self.high = high
+        self.last_write = 0.0
+        self.pending: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def __call__(self, stats: dict) -> None:
+        fraction = stats.get("fraction")
+        if self.closed or fraction is None:
+            return
+        now = time.monotonic()
+        if now - self.last_write < PROGRESS_UPDATE_SECONDS or (self.pending and not self.pending.done()):
+            return
+        self.last_write = now
+        detail = {"stage": self.stage, "percent": round(fraction * 100, 1)}
+        for field in ("eta_seconds", "fps", "speed", "bytes_per_second"):
+            if stats.get(field) is not None:
+                detail[field] = stats[field]
+        self.pending = asyncio.ensure_future(
+            update_job(
+                self.job_id,
+                {"progress": self.low + int((self.high - self.low) * fraction), "progress_detail": detail},
+            )
+        )
+
+    async def close(self) -> None:
+        self.closed = True
+        if self.pending:
+            await asyncio.gather(self.pending, return_exceptions=True)
+
+
+source_downloads: dict = {}
+source_listeners: dict = {}
+
+
+STREAMING_INGEST = os.environ.get("STREAMING_INGEST", "1") != "0"
+STREAM_FIRST_REGION_SECONDS = max(30, int(os.environ.get("STREAM_FIRST_REGION_SECONDS", "180")))
+# Media time ingested beyond a region before it is read, covering the
+# fragment (one GOP) ffmpeg may still be holding when it reports progress.
+STREAM_SAFETY_SECONDS = 10
+growing_sources: dict = {}
+
+
+class GrowingSource:
+    # A source still being ingested as fragmented mp4, which ffmpeg can read
+    # while it grows. available is the media time written so far; readers
+    # wait for their range before touching it. Once complete the file is
+    # linked under its cache key, and the temporary name is removed when the
+    # last reader releases it.
+    def __init__(self, key: str, path: Path, target: Path, media_info: dict):
+        self.key = key
+        self.path = path
+        self.target = target
+        self.media_info = media_info
+        self.available = 0.0
+        self.complete = False
+        self.error: Optional[BaseException] = None
+        self.ingesting = True
+        self.users = 0
+        self.started = asyncio.Event()
+        self.progress = asyncio.Event()
+
+    def advance(self, seconds: float) -> None:
+        if seconds <= self.available:
+            return
+        self.available = seconds
+        self.started.set()
+        self.progress.set()
+        self.progress = asyncio.Event()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.complete = error is None
+        self.error = error
+        self.ingesting = False
+        self.started.set()
+        self.progress.set()
+        self.cleanup()
+
+    async def wait_until(self, seconds: Optional[float]) -> None:
+        # seconds=None waits for the whole file.
+        while not self.complete:
+            if self.error:
+                raise self.error
+            if seconds is not None and self.available >= seconds:
+                return
+            await self.progress.wait()
+
+    def acquire(self) -> None:
+        self.users += 1
+
+    def release(self) -> None:
+        self.users -= 1
+        self.cleanup()
+
+    def cleanup(self) -> None:
+        if self.ingesting or self.users:
+            return
+        if growing_sources.get(self.key) is self:
+            growing_sources.pop(self.key)
+        self.path.unlink(missing_ok=True)
+
+
+def streaming_media_info(info: Optional[dict]) -> Optional[dict]:
+    # Media info taken from the extractor, for a source that cannot be probed
+    # yet. Only single-file formats can be piped through while downloading;
+    # formats that yt-dlp has to merge are downloaded whole.
+    if not info or info.get("requested_formats") or not info.get("url") or not info.get("duration"):
+        return None
+    vcodec, acodec = info.get("vcodec"), info.get("acodec")
+    return {
+        "duration": float(info["duration"]),
+        "format_name": "mp4",
+        "bit_rate": None,
+        "video": {
+            "codec": vcodec,
+            "width": info.get("width"),
+            "height": info.get("height"),
+            "fps": info.get("fps"),
+            "pix_fmt": None,
+        }
+        if vcodec and vcodec != "none"
+        else None,
+        "audio": {
+            "codec": acodec,
+            "channels": info.get("audio_channels"),
+            "channel_layout": None,
+            "sample_rate": info.get("asr"),
+        }
+        if acodec and acodec != "none"
+        else None,
+        "keyframes": [],
+        "copyable": False,
+    }
+
+
+def probe_video_stream(video_path: Path) -> dict:
+    # Picture size and rate of the first video stream, read from the header
+    # alone, so it also works on a file that is still growing.
+    probe = json.loads(
+        run_command(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=width,height,avg_frame_rate,r_frame_rate",
+                "-of",
+                "json",
+                str(video_path),
+            ]
+        )
+    )
+    stream = next(iter(probe.get("streams", [])), {})
+    return {
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+        "fps": parse_rate(stream.get("avg_frame_rate")) or parse_rate(stream.get("r_frame_rate")),
+    }
+
+
+async def complete_streaming_video_info(growing: GrowingSource) -> bool:
+    # yt-dlp often leaves width, height and fps out of a format; the header
+    # ffmpeg writes ahead of the first fragment has them. Returns whether
+    # the picture size is known.
+    video = growing.media_info.get("video")
+    if not video or (video.get("width") and video.get("height") and video.get("fps")):
+        return True
+    await growing.started.wait()
+    try:
+        probed = await run_media(probe_video_stream, growing.path)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, json.JSONDecodeError):
+        probed = {}
+    video.update({field: value for field, value in probed.items() if value and not video.get(field)})
+    return bool(video.get("width") and video.get("height"))
+
+
+async def ingest_source(
+    growing: GrowingSource, url: str, info: dict, on_progress: Optional[ProgressCallback] = None
+) -> None:
+    # yt-dlp writes the selected format to a pipe and ffmpeg remuxes it into
+    # fragmented mp4; ffmpeg's progress is the ingested media time. Unlike
+    # the in-process downloads, yt-dlp runs as its own process here: it only
+    # streams a format to its stdout, and piping that into ffmpeg is what
+    # lets clips start before the download ends. One interpreter spawn per
+    # streamed source is the price of that overlap.
+    read_fd, write_fd = os.pipe()
+    try:
+        downloader = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "yt_dlp",
+            "--quiet",
+            "--no-warnings",
+            "--no-playlist",
+            "-f",
+            info.get("format_id") or SOURCE_FORMAT,
+            "-o",
+            "-",
+            info.get("webpage_url") or url,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=write_fd,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    finally:
+        os.close(write_fd)
+    stderr_tail: deque = deque(maxlen=20)
+
+    async def drain_stderr() -> None:
+        async for line in downloader.stderr:
+            stderr_tail.append(line.decode(errors="replace").rstrip())
+
+    stderr_task = asyncio.ensure_future(drain_stderr())
+    duration = growing.media_info["duration"]
+
+    def progress(stats: dict) -> None:
+        growing.advance(stats["out_time"])
+        if on_progress:
+            on_progress(stats)
+
+    command = [
+        "ffmpeg",
+        "-y",
+        "-v",
+        "error",
+        "-i",
+        "pipe:0",
+        "-map",
+        "0",
+        "-c",
+        "copy",
+        "-f",
+        "mp4",
+        "-movflags",
+        "frag_keyframe+empty_moov+default_base_moof",
+        str(growing.path),
+    ]
+    try:
+        try:
+            await run_ffmpeg(command, duration, progress, stdin=read_fd)
+        except subprocess.CalledProcessError:
+            # A yt-dlp that dies leaves ffmpeg an empty or cut-off pipe; its
+            # own error is the one that says what went wrong.
+            try:
+                await asyncio.wait_for(downloader.wait(), 5)
+            except asyncio.TimeoutError:
+                pass
+            if downloader.returncode in (None, 0):
+                raise
+        if await downloader.wait() != 0:
+            await stderr_task
+            # Raised the way the in-process downloads fail, with yt-dlp's own
+            # message, so callers and the job's error_message treat both alike.
+            raise DownloadError("\n".join(stderr_tail) or f"yt-dlp exited with status {downloader.returncode}")
+    finally:
+        os.close(read_fd)
+        if downloader.returncode is None:
+            downloader.kill()
+            await downloader.wait()
+        await asyncio.gather(stderr_task, return_exceptions=True)
+
+
+async def hold_streaming_jobs(key: str) -> None:
+    # Jobs handed to the render stage while their source streams in may only
+    # be claimed by this worker; the claim is refreshed like a job lease.
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        await db.clip_jobs.update_many(
+            {"source_key": key, "streaming_owner": WORKER_ID},
+            {"$set": {"streaming_expires_at": lease_deadline()}},
+        )
+
+
+async def stream_source(key: str, url: str, info: dict, media_info: dict, on_progress: ProgressCallback) -> Path:
+    target = source_path_for(key)
+    growing = GrowingSource(key, VIDEO_DIR / f"{key}.{uuid.uuid4().hex}.tmp.mp4", target, media_info)
+    growing_sources[key] = growing
+    holder = asyncio.ensure_future(hold_streaming_jobs(key))
+    try:
+        await ingest_source(growing, url, info, on_progress)
+        await run_media(link_file, growing.path, target)
+        growing.finish()
+    except BaseException as exc:
+        growing.finish(exc)
+        raise
+    finally:
+        holder.cancel()
+        await db.clip_jobs.update_many(
+            {"source_key": key, "streaming_owner": WORKER_ID}, {"$set": {"streaming_owner": None}}
+        )
+    return target
+
+
+async def fetch_source(key: str, url: str, info: Optional[dict] = None) -> Path:
+    loop = asyncio.get_running_loop()
+
+    def broadcast(stats: dict) -> None:
+        for listener in list(source_listeners.get(key, [])):
+            listener(stats)
+
+    def on_progress(stats: dict) -> None:
+        loop.call_soon_threadsafe(broadcast, stats)
+
+    media_info = streaming_media_info(info) if STREAMING_INGEST else None
+    with timed_stage("download") as metrics:
+        if media_info:
+            path = await stream_source(key, url, info, media_info, on_progress)
+        else:
+            path = await run_media(download_source, key, url, info, on_progress)
+        size = path.stat().st_size
+        # yt-dlp downloads in-process; the finished file is what came in.
+        metrics.bytes_in = max(metrics.bytes_in, size)
+    await db.source_cache.update_one(
+        {"key": key},
+        {"$set": {"size": size, "last_used_at": datetime.now(timezone.utc).isoformat()}},
+    )
+    await evict_sources()
+    notify_storage()
+    return path
+
+
+async def acquire_source(
+    key: str,
+    url: str,
+    holder: str,
+    metadata: Optional[dict] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    streaming: bool = False,
+) -> Path:
+    # refs holds one entry per holder: the job id while its stages use the
+    # source, or a token per trim render. With streaming=True a source that is being ingested as a growing file
+    # is handed back (under its final path) as soon as its first fragment is
+    # written; render_stage reads it through growing_sources.
+    entry = {"url": url}
+    if metadata:
+        entry.update({"title": metadata.get("title"), "duration": metadata.get("duration")})
+    await db.source_cache.update_one(
+        {"key": key},
+        {
+            "$addToSet": {"refs": holder},
+            "$set": {"last_used_at": datetime.now(timezone.utc).isoformat(), **entry},
+            "$setOnInsert": {"size": 0},
+        },
+        upsert=True,
+    )
+    path = source_path_for(key)
+    if path.exists() and key not in source_downloads:
+        return path
+    # Concurrent requests for the same source share a single download.
+    task = source_downloads.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch_source(key, url, metadata))
+        source_downloads[key] = task
+        task.add_done_callback(lambda _: source_downloads.pop(key, None))
+    listeners = source_listeners.setdefault(key, [])
+    if on_progress:
+        listeners.append(on_progress)
+    try:
+        while streaming and not task.done():
+            growing = growing_sources.get(key)
+            if growing and growing.started.is_set() and not growing.error:
+                return growing.target
+            started = asyncio.ensure_future(growing.started.wait()) if growing else None
+            await asyncio.wait(
+                [task, *([started] if started else [])],
+                timeout=QUEUE_POLL_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if started:
+                started.cancel()
+        return await asyncio.shield(task)
+    finally:
+        if on_progress:
+            listeners.remove(on_progress)
+        if not listeners:
+            source_listeners.pop(key, None)
+
+
+async def release_source(holder: str) -> None:
+    await db.source_cache.update_many({"refs": holder}, {"$pull": {"refs": holder}})
+
+
+def source_files(path: Path) -> List[Path]:
+    # A source and every sidecar cached next to it.
+    return [
+        path,
+        media_info_path(path),
+        analysis_path(path),
+        peaks_path(path),
+        crop_track_path(path),
+        *path.parent.glob(f"{path.stem}.words.*.json"),
+    ]
+
+
+def remove_source_files(path: Path) -> None:
+    for item in source_files(path):
+        item.unlink(missing_ok=True)
+
+
+async def drop_source(key: str) -> bool:
+    # Removes a source nobody holds; a job acquiring it in the meantime
+    # keeps it, since the delete only matches an empty refs list.
+    if key in source_downloads or key in growing_sources:
+        return False
+    deleted = await db.source_cache.delete_one({"key": key, "refs": {"$size": 0}})
+    if deleted.deleted_count:
+        await run_media(remove_source_files, source_path_for(key))
+    return bool(deleted.deleted_count)
+
+
+async def evict_sources(needed: int = 0) -> int:
+    # Least recently used sources go until the cache fits its budget, and
+    # at least `needed` bytes more when the disk is under pressure.
+    entries = await db.source_cache.find({}, {"_id": 0, "key": 1, "size": 1, "refs": 1}).sort(
+        "last_used_at", 1
+    ).to_list(None)
+    total = sum(entry.get("size", 0) for entry in entries)
+    limit = min(SOURCE_CACHE_MAX_BYTES, total - needed)
+    freed = 0
+    for entry in entries:
+        if total <= limit:
+            break
+        if entry.get("refs"):
+            continue
+        if await drop_source(entry["key"]):
+            total -= entry.get("size", 0)
+            freed += entry.get("size", 0)
+    return freed
+
+
+async def cached_source(url: str) -> Optional[dict]:
+    key = source_cache_key(url)
+    if not key or not source_path_for(key).exists():
+        return None
+    return await db.source_cache.find_one({"key": key, "title": {"$ne": None}}, {"_id": 0})
+
+
+async def acquire_job_source(job_id: str, job: dict, holder: Optional[str] = None) -> Path:
+    # Sources may have been evicted since the job finished; trims pull them
+    # back through the cache instead of failing.
+    if job.get("source_key"):
+        try:
+            return await acquire_source(job["source_key"], job.get("youtube_url", ""), holder or job_id)
+        except DownloadError:
+            await release_source(holder or job_id)
+    else:
+        source_path = Path(job.get("source_path") or VIDEO_DIR / f"{job_id}.mp4")
+        if source_path.exists():
+            return source_path
+    raise HTTPException(status_code=400, detail="Arquivo fonte não encontrado")
+
+
+STORAGE_MAX_BYTES = int(float(os.environ.get("STORAGE_MAX_GB", "0")) * 1024**3)
+STORAGE_MIN_FREE_BYTES = int(float(os.environ.get("STORAGE_MIN_FREE_GB", "2")) * 1024**3)
+SOURCE_TTL_SECONDS = float(os.environ.get("SOURCE_TTL_HOURS", "24")) * 3600
+ERROR_JOB_TTL_SECONDS = float(os.environ.get("ERROR_JOB_TTL_HOURS", "72")) * 3600
+STORAGE_SWEEP_SECONDS = float(os.environ.get("STORAGE_SWEEP_SECONDS", "600"))
+# Files younger than this are never orphans: their job document or cache
+# entry may simply not be written yet.
+ORPHAN_GRACE_SECONDS = 3600
+storage_wakeup = asyncio.Event()
+storage_summary: dict = {}
+
+
+def notify_storage() -> None:
+    storage_wakeup.set()
+
+
+def tree_bytes(root: Path) -> int:
+    # Allocated bytes under root. Job files are hard links into the render
+    # cache, so each inode is counted once.
+    seen = set()
+    total = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            try:
+                stat = os.lstat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_blocks * 512
+    return total
+
+
+def measure_storage() -> dict:
+    used = tree_bytes(STORAGE_DIR)
+    free = shutil.disk_usage(STORAGE_DIR).free
+    over_budget = used - STORAGE_MAX_BYTES if STORAGE_MAX_BYTES else 0
+    return {
+        "used_bytes": used,
+        "free_bytes": free,
+        "budget_bytes": STORAGE_MAX_BYTES or None,
+        "sources_bytes": tree_bytes(VIDEO_DIR),
+        "clips_bytes": tree_bytes(CLIP_DIR),
+        "render_cache_bytes": tree_bytes(RENDER_CACHE_DIR),
+        "needed_bytes": max(0, over_budget, STORAGE_MIN_FREE_BYTES - free),
+    }
+
+
+def evict_files(paths: List[Path], needed: int) -> int:
+    # Oldest first. Only unlinking the last link of an inode frees space,
+    # so files still linked elsewhere do not count toward `needed`.
+    entries = []
+    for path in paths:
+        try:
+            entries.append((path.stat(), path))
+        except FileNotFoundError:
+            continue
+    freed = 0
+    for stat, path in sorted(entries, key=lambda entry: entry[0].st_mtime):
+        if freed >= needed:
+            break
+        path.unlink(missing_ok=True)
+        if stat.st_nlink == 1:
+            freed += stat.st_blocks * 512
+    return freed
+
+
+def evict_render_cache(needed: int) -> int:
+    with render_cache_lock:
+        return evict_files(render_cache_files(), needed)
+
+
+def rebuildable_job_files(jobs: dict) -> List[Path]:
+    # Export manifests and legacy zips are rebuilt on the next download;
+    # sprite sheets are rendered again on demand, which needs the source.
+    paths: List[Path] = []
+    for job_id, job in jobs.items():
+        job_dir = CLIP_DIR / job_id
+        paths += job_dir.glob("exports/*")
+        paths += job_dir.glob("*.zip")
+        if job.get("source_path") and Path(job["source_path"]).exists():
+            paths += job_dir.glob("sprites/*.jpg")
+    return paths
+
+
+def job_dirs() -> List[Path]:
+    return [path for path in CLIP_DIR.iterdir() if path.is_dir()]
+
+
+def remove_stale_zips(job_dir: Path) -> None:
+    # Archives are streamed now; zips written by older versions are dead.
+    for path in job_dir.glob("*.zip"):
+        path.unlink(missing_ok=True)
+
+
+def known_source_keys(cache_keys: List[str], jobs: List[dict]) -> set:
+    # Jobs from before the source cache own their source by path, and the
+    # oldest ones have no source_path at all: acquire_job_source falls back
+    # to VIDEO_DIR/{job id}.mp4 for those.
+    known = set(cache_keys)
+    known.update(Path(job["source_path"]).stem if job.get("source_path") else job["id"] for job in jobs)
+    return known
+
+
+def remove_orphan_sources(known: set, active: set) -> None:
+    # Sources and sidecars of keys no cache entry or job knows about, and
+    # temp files of downloads that died with their worker.
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    for path in VIDEO_DIR.iterdir():
+        key = path.name.split(".", 1)[0]
+        if key in active or (key in known and ".tmp" not in path.name):
+            continue
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            continue
+
+
+async def reconcile_jobs() -> dict:
+    # Records bytes per job, removes job directories without a clip_jobs
+    # document and clears errored jobs past their TTL. Returns the jobs
+    # that still own a directory.
+    dirs = await run_media(job_dirs)
+    jobs = {
+        job["id"]: job
+        async for job in db.clip_jobs.find(
+            {"id": {"$in": [path.name for path in dirs]}},
+            {"_id": 0, "id": 1, "status": 1, "created_at": 1, "source_path": 1, "storage_bytes": 1},
+        )
+    }
+    error_cutoff = datetime.now(timezone.utc) - timedelta(seconds=ERROR_JOB_TTL_SECONDS)
+    for job_dir in dirs:
+        job = jobs.get(job_dir.name)
+        if job is None:
+            if time.time() - job_dir.stat().st_mtime > ORPHAN_GRACE_SECONDS:
+                await run_media(shutil.rmtree, job_dir, True)
+            continue
+        created_at = job.get("created_at")
+        if job.get("status") == "error" and isinstance(created_at, datetime) and created_at < error_cutoff:
+            await run_media(shutil.rmtree, job_dir, True)
+            await update_job(job["id"], {"clips": [], "clip_count": 0, "storage_bytes": 0})
+            del jobs[job["id"]]
+            continue
+        await run_media(remove_stale_zips, job_dir)
+        size = await run_media(tree_bytes, job_dir)
+        if size != job.get("storage_bytes"):
+            await db.clip_jobs.update_one({"id": job["id"]}, {"$set": {"storage_bytes": size}})
+    return jobs
+
+
+async def expire_sources() -> None:
+    # A source nobody holds goes SOURCE_TTL_SECONDS after its last use;
+    # trims of its jobs fetch it again through the cache.
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=SOURCE_TTL_SECONDS)).isoformat()
+    entries = await db.source_cache.find(
+        {"refs": {"$size": 0}, "last_used_at": {"$lt": cutoff}}, {"_id": 0, "key": 1}
+    ).to_list(None)
+    for entry in entries:
+        await drop_source(entry["key"])
+    known = known_source_keys(
+        await db.source_cache.distinct("key"),
+        await db.clip_jobs.find({}, {"_id": 0, "id": 1, "source_path": 1}).to_list(None),
+    )
+    await run_media(remove_orphan_sources, known, {*source_downloads, *growing_sources})
+
+
+async def sweep_storage() -> None:
+    jobs = await reconcile_jobs()
+    await expire_sources()
+    summary = await run_media(measure_storage)
+    needed = summary["needed_bytes"]
+    if needed:
+        # Cheapest to rebuild goes first; sources only when nothing else is left.
+        freed = await run_media(evict_render_cache, needed)
+        if freed < needed:
+            freed += await run_media(evict_files, await run_media(rebuildable_job_files, jobs), needed - freed)
+        if freed < needed:
+            freed += await evict_sources(needed - freed)
+        if freed < needed:
+            logger.warning("Storage needs %d more bytes but nothing evictable is left", needed - freed)
+        summary = await run_media(measure_storage)
+    storage_summary.clear()
+    storage_summary.update({**summary, "swept_at": datetime.now(timezone.utc).isoformat()})
+
+
+async def storage_manager() -> None:
+    while True:
+        storage_wakeup.clear()
+        try:
+            await sweep_storage()
+        except Exception:
+            logger.exception("Storage sweep failed")
+        try:
+            await asyncio.wait_for(storage_wakeup.wait(), STORAGE_SWEEP_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def download_stage(job: dict) -> dict:
+    job_id = job["id"]
+    url = job.get("youtube_url", "")
+    cached = await cached_source(url)
+    if cached:
+        metadata = {"title": cached.get("title"), "duration": cached.get("duration")}
+        key = cached["key"]
+    else:
+        with timed_stage("title"):
+            metadata = await run_media(probe_video_metadata, url)
+        key = source_cache_key(url, metadata) or f"job-{job_id}"
+    title = metadata.get("title") or "Vídeo do YouTube"
+    updates = {"title": title, "source_key": key}
+    if metadata.get("duration"):
+        updates["duration"] = max(1, int(metadata["duration"]))
+    await update_job(job_id, {**updates, "progress": 10})
+    reporter = ProgressReporter(job_id, "download", 10, 20)
+    # Fast mode cuts by stream copy, which needs the finished file's
+    # keyframe index, so only encoding jobs start on a growing source.
+    streaming = job.get("render_mode", "quality") != "fast"
+    try:
+        video_path = await acquire_source(key, url, job_id, metadata, reporter, streaming)
+    finally:
+        await reporter.close()
+    growing = growing_sources.get(key)
+    if growing and not growing.complete:
+        updates.update({"streaming_owner": WORKER_ID, "streaming_expires_at": lease_deadline()})
+    return {**updates, "source_path": str(video_path), "progress": 20, "progress_detail": None}
+
+
+def clip_render(job_id: str, start: int, length: int, viral_score: int, duration: int) -> dict:
+    clip_id = str(uuid.uuid4())
+    return {
+        "id": clip_id,
+        "start": start,
+        "duration": length,
+        "viral_score": viral_score,
+        "thumb_at": min(start + 1, duration - 1),
+        "video_path": CLIP_DIR / job_id / f"{clip_id}.mp4",
+        "thumb_path": CLIP_DIR / job_id / f"{clip_id}.jpg",
+    }
+
+
+def clip_document(render: dict, index: int, captions: Optional[dict], title: str) -> dict:
+    return ClipSegment(
+        id=render["id"],
+        title=f"Corte destacado #{index + 1}",
+        start_time=render["start"],
+        end_time=render["start"] + render["duration"],
+        duration=render["duration"],
+        viral_score=render["viral_score"],
+        thumbnail_url=media_url(render["thumb_path"]),
+        caption=clip_caption(captions, render["start"], render["duration"]) or f"Trecho selecionado de {title}.",
+        video_url=media_url(render["video_path"]),
+    ).model_dump()
+
+
+def pin_clip_doc(doc: dict, render: dict, captions: Optional[dict], rungs: List[int], output_info: dict) -> None:
+    doc["video_url"] = versioned_media_url(render["video_path"])
+    doc["thumbnail_url"] = versioned_media_url(render["thumb_path"])
+    if captions:
+        subtitles_path = render["video_path"].with_suffix(".srt")
+        write_srt(captions, render["start"], render["duration"], subtitles_path)
+        doc["subtitles_url"] = versioned_media_url(subtitles_path)
+    if HLS_ENABLED:
+        master_path = write_hls_master(render["video_path"], rungs, output_info, render["duration"])
+        doc["hls_url"] = media_url(master_path)
+
+
+def job_output_info(job: dict, media_info: dict) -> tuple:
+    # (aspect_ratio, media info of the rendered frame) for a job.
+    if job.get("aspect_ratio") == "9:16" and media_info.get("video"):
+        return "9:16", reframed_media_info(media_info)
+    return "original", media_info
+
+
+def job_wants_captions(media_info: dict) -> bool:
+    return CAPTIONS_ENABLED and bool(media_info.get("audio")) and bool(media_info.get("video"))
+
+
+async def job_captions(job: dict, video_path: Path, media_info: dict, output_info: dict) -> Optional[dict]:
+    job_id = job["id"]
+    language = job.get("language") or "pt"
+    reporter = ProgressReporter(job_id, "transcribe", 20, 30)
+    try:
+        transcript = await load_transcript(video_path, language, media_info["duration"], reporter)
+        # Linked into the job so trims keep their captions (without any new
+        # inference) after the source is evicted.
+        await run_media(link_file, transcript, job_transcript_path(job_id))
+        words = await run_media(read_transcript, transcript)
+        return caption_track(words, job.get("style") or "dinamico", language, output_info)
+    except Exception:
+        logger.exception("Transcription failed for job %s, rendering without captions", job_id)
+        return None
+    finally:
+        await reporter.close()
+
+
+@timed("render")
+async def render_stage(job: dict) -> dict:
+    job_id = job["id"]
+    growing = growing_sources.get(job.get("source_key") or "")
+    if growing and not growing.complete:
+        growing.acquire()
+        try:
+            # The crop track needs the picture size; without it a 9:16 job
+            # waits for the whole file and renders from the probed source.
+            if await complete_streaming_video_info(growing) or job.get("aspect_ratio") != "9:16":
+                return await render_streaming(job, growing)
+            await growing.wait_until(None)
+        finally:
+            growing.release()
+    title = job.get("title", "")
+    clip_length = job.get("clip_length", 30)
+    video_path = Path(job.get("source_path") or VIDEO_DIR / f"{job_id}.mp4")
+    if not video_path.exists():
+        video_path = await acquire_job_source(job_id, job)
+    media_info = await run_media(load_media_info, video_path)
+    duration = max(1, int(media_info["duration"]))
+    await update_job(job_id, {"duration": duration, "media_info": media_info})
+    waveform_path: Optional[Path] = CLIP_DIR / job_id / "waveform.png"
+    # Scrubbing previews come from the tiled sprite sheets, rendered on demand
+    # by the sprites endpoints, so no timeline strip is rendered here.
+    has_peaks = False
+    aspect_ratio, output_info = job_output_info(job, media_info)
+    # Highlight analysis, the crop track and the transcript are independent
+    # per-source passes, so they run side by side.
+    crop_task = asyncio.ensure_future(load_crop_track(video_path)) if aspect_ratio == "9:16" else None
+    captions_task = (
+        asyncio.ensure_future(job_captions(job, video_path, media_info, output_info))
+        if job_wants_captions(media_info)
+        else None
+    )
+    # Transcription is the longer pass, so it reports progress when it runs.
+    analyze_reporter = None if captions_task else ProgressReporter(job_id, "analyze", 20, 30)
+    try:
+        analysis = await load_analysis(video_path, media_info, analyze_reporter)
+        plan = plan_highlights(analysis, duration, clip_length)
+        if media_info.get("audio"):
+            # The peak pyramid replaces the waveform PNG; it is linked into
+            # the job directory so it outlives the cached source.
+            await run_media(link_file, peaks_path(video_path), CLIP_DIR / job_id / "peaks.bin")
+            has_peaks = True
+            waveform_path = None
+    except subprocess.CalledProcessError:
+        logger.warning("Highlight analysis failed for job %s, falling back to evenly spaced clips", job_id)
+        plan = even_clip_plan(duration, clip_length)
+    except BaseException:
+        for task in (crop_task, captions_task):
+            if task:
+                task.cancel()
+        raise
+    finally:
+        if analyze_reporter:
+            await analyze_reporter.close()
+    crop_track = await crop_task if crop_task else None
+    captions = await captions_task if captions_task else None
+    safe_length = min(clip_length, max(5, duration))
+    renders = [
+        clip_render(job_id, start_time, safe_length, viral_score, duration) for start_time, viral_score in plan
+    ]
+    total = len(renders)
+    clip_docs = [clip_document(render, index, captions, title) for index, render in enumerate(renders)]
+
+    published = 0
+
+    render_mode = job.get("render_mode", "quality")
+    encode = encode_profile(job.get("render_profile"))
+    rungs = clip_rungs(media_info, render_mode, encode)
+
+    def pin_clip_urls(docs: List[dict]) -> None:
+        for doc, render in zip(docs, renders[published : published + len(docs)]):
+            pin_clip_doc(doc, render, captions, rungs, output_info)
+
+    async def publish_clips(count: int) -> None:
+        nonlocal published
+        await run_media(pin_clip_urls, clip_docs[published:count])
+        await push_job_clips(job_id, clip_docs[published:count], clip_docs[:count])
+        published = count
+
+    await update_job(job_id, {"clips": [], "clip_count": 0})
+
+    reporter = ProgressReporter(job_id, "render", 30, 90)
+    has_waveform = None
+    try:
+        if BATCH_RENDER_ENABLED and render_mode != "fast":
+            try:
+                has_waveform = await render_job_batch(
+                    video_path,
+                    renders,
+                    waveform_path,
+                    duration,
+                    reporter,
+                    rungs,
+                    crop_track,
+                    captions,
+                    encode,
+                )
+            except subprocess.CalledProcessError:
+                logger.warning("Batch render failed for job %s, falling back to per-clip rendering", job_id)
+        if has_waveform is None:
+            has_waveform = await render_job_parallel(
+                video_path,
+                renders,
+                waveform_path,
+                publish_clips,
+                render_mode,
+                reporter,
+                rungs,
+                crop_track,
+                captions,
+                encode,
+            )
+    finally:
+        await reporter.close()
+    if published < total:
+        await publish_clips(total)
+    await run_media(
+        seed_render_cache, render_source_id(job, video_path), renders, render_mode, aspect_ratio, captions, encode
+    )
+    waveform_url = None
+    if has_waveform and waveform_path:
+        waveform_url = await run_media(versioned_media_url, waveform_path)
+    await update_job(
+        job_id,
+        {
+            "duration": duration,
+            "waveform_url": waveform_url,
+            "sprite_url": None,
+            "sprites_url": f"/api/jobs/{job_id}/sprites.json" if media_info.get("video") else None,
+            "peaks_url": f"/api/jobs/{job_id}/peaks" if has_peaks else None,
+        },
+    )
+    return {"status": "completed", "progress": 100, "progress_detail": None}
+
+
+def stream_regions(duration: int, safe_length: int) -> List[tuple]:
+    # (start, length) regions in whole seconds tiling the source, one clip
+    # each. The first region is capped at STREAM_FIRST_REGION_SECONDS so the
+    # first clip never waits for a share of a long source; the remaining
+    # clips split what is left.
+    count = highlight_count(duration, safe_length)
+    first = max(safe_length, min(STREAM_FIRST_REGION_SECONDS, duration // count))
+    rest = duration - first
+    if duration <= safe_length or rest < safe_length:
+        return [(0, duration)]
+    count = max(1, min(count - 1, rest // safe_length))
+    bounds = [first + rest * index // count for index in range(count + 1)]
+    return [(0, first)] + [(bounds[index], bounds[index + 1] - bounds[index]) for index in range(count)]
+
+
+def fit_samples(values: "np.ndarray", count: int) -> "np.ndarray":
+    # Per-region tracks are stitched by sample index, so each region is
+    # trimmed or edge-padded to exactly its share.
+    if values.size >= count:
+        return values[:count]
+    if not values.size:
+        return np.full(count, 0.5, dtype=np.float32)
+    return np.pad(values, (0, count - values.size), mode="edge")
+
+
+async def render_streaming(job: dict, growing: "GrowingSource") -> dict:
+    # Renders while the source is still being ingested. Each region is
+    # analysed (highlights, crop track, transcript) as soon as it has been
+    # written and its best clip starts rendering at once; the regions tile
+    # the source, so the per-region crop tracks and transcripts add up to
+    # the whole-source caches. Whole-file work (probe, peak pyramid, scene
+    # analysis) runs once the ingest completes, alongside the last renders.
+    job_id = job["id"]
+    title = job.get("title", "")
+    clip_length = job.get("clip_length", 30)
+    media_info = growing.media_info
+    duration = max(1, int(media_info["duration"]))
+    await update_job(job_id, {"duration": duration})
+    safe_length = min(clip_length, max(5, duration))
+    regions = stream_regions(duration, safe_length)
+    aspect_ratio, output_info = job_output_info(job, media_info)
+    wants_captions = job_wants_captions(media_info)
+    language = job.get("language") or "pt"
+    style = job.get("style") or "dinamico"
+    render_mode = job.get("render_mode", "quality")
+    encode = encode_profile(job.get("render_profile"))
+    rungs = clip_rungs(media_info, render_mode, encode)
+    # Regions' renders overlap each other and the next region's analysis;
+    # like render_job_parallel they split the job's core share between them.
+    share = job_core_share()
+    render_threads = max(1, encode_threads(share))
+    render_slots = asyncio.Semaphore(max(1, share // render_threads))
+    renders: List[dict] = []
+    clip_docs: List[dict] = []
+    finished: List[bool] = []
+    crop_parts: List = []
+    words: List[list] = []
+    tasks: List[asyncio.Future] = []
+    published = 0
+    reporter = ProgressReporter(job_id, "render", 20, 90)
+
+    async def publish_ready() -> None:
+        nonlocal published
+        count = published
+        while count < len(finished) and finished[count]:
+            count += 1
+        if count > published:
+            docs = clip_docs[published:count]
+            await push_job_clips(job_id, docs, clip_docs[:count])
+            published = count
+            reporter({"fraction": published / len(regions)})
+
+    async def render_one(index: int, crop_track: Optional[dict], captions: Optional[dict]) -> None:
+        render = renders[index]
+        async with render_slots, cpu_budget.reserve(render_threads) as threads:
+            await render_clip(
+                growing.path,
+                render["video_path"],
+                render["start"],
+                render["duration"],
+                threads,
+                None,
+                rungs,
+                crop_track,
+                captions,
+                encode,
+                media_info,
+            )
+            await render_thumbnail(
+                growing.path, render["thumb_path"], render["thumb_at"], threads, crop_track, encode
+            )
+        await run_media(pin_clip_doc, clip_docs[index], render, captions, rungs, output_info)
+        finished[index] = True
+        await publish_ready()
+
+    await update_job(job_id, {"clips": [], "clip_count": 0})
+    try:
+        for region_start, region_length in regions:
+            last = region_start + region_length >= duration
+            if last:
+                await growing.wait_until(None)
+            else:
+                await growing.wait_until(region_start + region_length + STREAM_SAFETY_SECONDS)
+            span = (region_start, None if last else region_length)
+            empty = np.zeros(0, dtype=np.float32)
+            analysis = {"loudness": empty, "zcr": empty, "scene_times": empty, "scene_scores": empty}
+            analysis["hop_seconds"] = np.float32(ANALYSIS_HOP_SECONDS)
+            if media_info.get("audio"):
+                analysis.update(await analyze_audio(growing.path, region_length, span=span, with_peaks=False))
+            start, viral_score = plan_highlights(analysis, region_length, clip_length, clip_count=1)[0]
+            crop_track = None
+            if aspect_ratio == "9:16":
+                centers = await compute_crop_track(growing.path, span)
+                crop_parts.append(centers if last else fit_samples(centers, region_length * REFRAME_SAMPLE_FPS))
+                crop_track = crop_track_for(np.concatenate(crop_parts), media_info)
+            captions = None
+            if wants_captions:
+                async with cpu_budget.reserve(job_core_share()):
+                    words.extend(await transcribe_audio(growing.path, language, region_length, span=span))
+                captions = caption_track(words, style, language, output_info)
+            render = clip_render(job_id, region_start + start, safe_length, viral_score, duration)
+            renders.append(render)
+            clip_docs.append(clip_document(render, len(clip_docs), captions, title))
+            finished.append(False)
+            tasks.append(asyncio.ensure_future(render_one(len(renders) - 1, crop_track, captions)))
+        tasks.append(asyncio.ensure_future(finish_streamed_source(job, growing, crop_parts, words)))
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        await reporter.close()
+    video_path, full_info, has_peaks = results[-1]
+    await run_media(
+        seed_render_cache,
+        render_source_id(job, video_path),
+        renders,
+        render_mode,
+        aspect_ratio,
+        caption_track(words, style, language, output_info) if wants_captions else None,
+        encode,
+    )
+    await update_job(
+        job_id,
+        {
+            "duration": max(1, int(full_info["duration"])),
+            "media_info": full_info,
+            "source_path": str(video_path),
+            "waveform_url": None,
+            "sprite_url": None,
+            "sprites_url": f"/api/jobs/{job_id}/sprites.json" if full_info.get("video") else None,
+            "peaks_url": f"/api/jobs/{job_id}/peaks" if has_peaks else None,
+        },
+    )
+    return {"status": "completed", "progress": 100, "progress_detail": None}
+
+
+async def finish_streamed_source(job: dict, growing: "GrowingSource", crop_parts: List, words: List[list]) -> tuple:
+    # Runs once the ingest is complete: probes the final file, builds the
+    # analysis and peak caches, and stores the stitched crop track and
+    # transcript as the source's caches. Returns (path, media_info, has_peaks).
+    job_id = job["id"]
+    await growing.wait_until(None)
+    video_path = growing.target
+    media_info = await run_media(load_media_info, video_path)
+    stat = video_path.stat()
+    has_peaks = False
+    try:
+        await load_analysis(video_path, media_info)
+        if media_info.get("audio"):
+            await run_media(link_file, peaks_path(video_path), CLIP_DIR / job_id / "peaks.bin")
+            has_peaks = True
+    except subprocess.CalledProcessError:
+        logger.warning("Analysis of streamed source failed for job %s", job_id)
+    if crop_parts:
+        await run_media(save_crop_track, video_path, stat, np.concatenate(crop_parts).astype(np.float32))
+    if job_wants_captions(media_info):
+        transcript = await run_media(save_transcript, video_path, job.get("language") or "pt", stat, words)
+        await run_media(link_file, transcript, job_transcript_path(job_id))
+    return video_path, media_info, has_peaks
+
+
+DOWNLOAD_WORKERS = max(1, int(os.environ.get("DOWNLOAD_WORKERS", "2")))
+RENDER_WORKERS = max(1, int(os.environ.get("RENDER_WORKERS", "2")))
+JOB_LEASE_SECONDS = max(10, int(os.environ.get("JOB_LEASE_SECONDS", "120")))
+JOB_MAX_ATTEMPTS = max(1, int(os.environ.get("JOB_MAX_ATTEMPTS", "3")))
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "0"))
+QUEUE_POLL_SECONDS = float(os.environ.get("QUEUE_POLL_SECONDS", "2"))
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# Each stage has its own pool: downloads are network-bound, renders CPU-bound.
+# A job moves ready -> active inside one stage and is handed to the next stage
+# through its status, so the clip_jobs collection itself is the queue.
+QUEUE_STAGES = {
+    "download": {"ready": "queued", "active": "downloading", "workers": DOWNLOAD_WORKERS, "handler": download_stage},
+    "render": {"ready": "downloaded", "active": "processing", "workers": RENDER_WORKERS, "handler": render_stage},
+}
+DEFAULT_STAGE_SECONDS = {"download": 60.0, "render": 90.0}
+stage_durations = {stage: deque(maxlen=50) for stage in QUEUE_STAGES}
+queue_wakeups: dict = {}
+queue_tasks: List[asyncio.Task] = []
+
+
+def lease_deadline() -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)).isoformat()
+
+
+def notify_queue(stage: str) -> None:
+    event = queue_wakeups.get(stage)
+    if event:
+        event.set()
+
+
+def average_stage_seconds(stage: str) -> float:
+    samples = stage_durations[stage]
+    if not samples:
+        return DEFAULT_STAGE_SECONDS[stage]
+    return sum(samples) / len(samples)
+
+
+async def claim_job(stage: str, job_id: Optional[str] = None) -> Optional[dict]:
+    # job_id restricts the claim to one job, for callers that drive a job
+    # through the stages themselves (the offline benchmark).
+    config = QUEUE_STAGES[stage]
+    now = datetime.now(timezone.utc).isoformat()
+    ready = {"status": config["ready"]}
+    if stage == "render":
+        # A source still streaming in can only be read by the worker that
+        # ingests it, until that worker stops refreshing its claim.
+        ready["$or"] = [
+            {"streaming_owner": {"$in": [None, WORKER_ID]}},
+            {"streaming_expires_at": {"$lt": now}},
+        ]
+    query = {
+        "$or": [
+            ready,
+            {"status": config["active"], "lease_expires_at": {"$lt": now}},
+        ]
+    }
+    if job_id:
+        query["id"] = job_id
+    return await db.clip_jobs.find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": config["active"],
+                "lease_owner": WORKER_ID,
+                "lease_expires_at": lease_deadline(),
+                "error_message": None,
+            },
+            "$inc": {"attempts": 1},
+        },
+        projection={"_id": 0},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def lease_filter(job: dict) -> dict:
+    # Matches only the claim this worker holds: a job reclaimed after its
+    # lease ran out, even by this same worker, has a higher attempts count.
+    return {"id": job["id"], "lease_owner": WORKER_ID, "attempts": job.get("attempts")}
+
+
+async def update_leased_job(job: dict, updates: dict) -> bool:
+    result = await db.clip_jobs.update_one(lease_filter(job), {"$set": updates})
+    if not result.matched_count:
+        return False
+    if not JOB_EVENTS_CHANGE_STREAM:
+        job_events.publish(job["id"], updates)
+    return True
+
+
+async def heartbeat_job(job: dict, active_status: str) -> None:
+    # A failed renewal is retried on the next beat; the lease outlasts two
+    # missed ones, so a single Mongo error does not hand the job away.
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            await db.clip_jobs.update_one(
+                {**lease_filter(job), "status": active_status},
+                {"$set": {"lease_expires_at": lease_deadline()}},
+            )
+        except Exception:
+            logger.exception("Failed to renew the lease on job %s", job["id"])
+
+
+async def run_claimed_job(stage: str, job: dict) -> None:
+    config = QUEUE_STAGES[stage]
+    if job.get("attempts", 1) > JOB_MAX_ATTEMPTS:
+        await update_leased_job(
+            job,
+            {
+                "status": "error",
+                "error_message": "Limite de tentativas excedido",
+                "progress": 0,
+                "lease_owner": None,
+                "lease_expires_at": None,
+            },
+        )
+        return
+    heartbeat = asyncio.create_task(heartbeat_job(job, config["active"]))
+    started = time.monotonic()
+    timings: dict = {}
+    token = job_timings.set(timings)
+    try:
+        updates = await config["handler"](job)
+        stage_durations[stage].append(time.monotonic() - started)
+        if stage == "download":
+            updates["status"] = "downloaded"
+            updates["attempts"] = 0
+    except Exception as exc:
+        updates = {"status": "error", "error_message": str(exc), "progress": 0, "progress_detail": None}
+    finally:
+        heartbeat.cancel()
+        job_timings.reset(token)
+    # The breakdown accumulates across stages (and retries) of the job.
+    merged = {stage_name: dict(timing) for stage_name, timing in (job.get("timings") or {}).items()}
+    for stage_name, timing in timings.items():
+        merge_stage_timing(merged, stage_name, timing)
+    updates.update({"lease_owner": None, "lease_expires_at": None, "timings": timing_breakdown(merged)})
+    if not await update_leased_job(job, updates):
+        # Another worker reclaimed the job after this lease ran out; its
+        # result and its hold on the source are the ones that count now.
+        logger.warning("Lost the lease on %s job %s, discarding this worker's result", stage, job["id"])
+        return
+    if updates["status"] == "downloaded":
+        notify_queue("render")
+    else:
+        await release_source(job["id"])
+
+
+async def queue_worker(stage: str) -> None:
+    wakeup = queue_wakeups[stage]
+    while True:
+        try:
+            job = await claim_job(stage)
+        except Exception:
+            logger.exception("Failed to claim %s job", stage)
+            job = None
+        if job:
+            await run_claimed_job(stage, job)
+            continue
+        wakeup.clear()
+        try:
+            await asyncio.wait_for(wakeup.wait(), QUEUE_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def attach_queue_info(jobs: List[dict]) -> None:
+    waiting = {job.get("status") for job in jobs}
+    positions: dict = {}
+    for stage, config in QUEUE_STAGES.items():
+        if config["ready"] not in waiting:
+            continue
+        queued = await db.clip_jobs.find({"status": config["ready"]}, {"_id": 0, "id": 1}).sort(
+            "created_at", 1
+        ).to_list(None)
+        for index, item in enumerate(queued):
+            positions[item["id"]] = (stage, index + 1)
+    render_seconds = average_stage_seconds("render")
+    for job in jobs:
+        if job.get("id") not in positions:
+            job["queue_position"] = None
+            job["eta_seconds"] = None
+            continue
+        stage, position = positions[job["id"]]
+        config = QUEUE_STAGES[stage]
+        rounds = -(-position // config["workers"])
+        eta = rounds * average_stage_seconds(stage)
+        if stage == "download":
+            eta += render_seconds
+        job["queue_position"] = position
+        job["eta_seconds"] = int(eta)
+
+
+@api_router.post("/jobs", response_model=ClipJob)
+async def create_job(payload: ClipJobCreate):
+    if MAX_QUEUED_JOBS > 0 and await db.clip_jobs.count_documents({"status": "queued"}) >= MAX_QUEUED_JOBS:
+        raise HTTPException(status_code=429, detail="Fila cheia, tente novamente em instantes")
+    job = ClipJob(
+        youtube_url=payload.youtube_url,
+        title="Importação do YouTube",
+        status="queued",
+        progress=0,
+        clip_count=0,
+        clips=[],
+        clip_length=payload.clip_length,
+        language=payload.language or "pt",
+        style=payload.style or "dinamico",
+        render_mode=payload.render_mode or "quality",
+        aspect_ratio=payload.aspect_ratio or "original",
+        render_profile=payload.render_profile or DEFAULT_ENCODE_PROFILE,
+        error_message=None,
+    )
+    doc = job.model_dump()
+    doc["clips"] = [clip.model_dump() for clip in job.clips]
+    await db.clip_jobs.insert_one(doc)
+    if not JOB_EVENTS_CHANGE_STREAM:
+        job_events.publish(job.id, doc)
+    notify_queue("download")
+    await attach_queue_info([doc])
+    job.queue_position = doc["queue_position"]
+    job.eta_seconds = doc["eta_seconds"]
+    return job
+
+
+SUMMARY_PROJECTION = {"_id": 0, **{field: 1 for field in ClipJobSummary.model_fields}}
+
+
+@api_router.get("/jobs", response_model=List[ClipJobSummary])
+async def list_jobs(
+    response: Response,
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+):
+    # Keyset pagination over (created_at, id) descending, served by the
+    # created_at_id index; the next page cursor is sent in X-Next-Cursor.
+    query: dict = {}
+    if status:
+        query["status"] = status
+    if created_after or created_before:
+        query["created_at"] = {}
+        if created_after:
+            query["created_at"]["$gte"] = created_after
+        if created_before:
+            query["created_at"]["$lt"] = created_before
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": cursor_created_at}},
+            {"created_at": cursor_created_at, "id": {"$lt": cursor_id}},
+        ]
+    jobs = await db.clip_jobs.find(query, SUMMARY_PROJECTION).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(jobs[-1])
+    await attach_queue_info(jobs)
+    return [serialize_summary(job) for job in jobs]
+
+
+def sse_message(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def job_snapshot(job_id: str) -> Optional[ClipJob]:
+    job = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0, "media_info.keyframes": 0})
+    if not job:
+        return None
+    await attach_queue_info([job])
+    return serialize_job(job)
+
+
+@api_router.get("/jobs/{job_id}", response_model=ClipJob)
+async def get_job(job_id: str):
+    job = await job_snapshot(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+@api_router.get("/jobs/{job_id}/clips", response_model=List[ClipSegment])
+async def get_job_clips(job_id: str):
+    job = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0, "clips": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
     return [ClipSegment(**clip) for clip in job.get("clips", [])]
 
 
+@functools.lru_cache(maxsize=32)
+def open_peaks(path: str, mtime_ns: int) -> dict:
+    # Memory-mapped once per file version; slices below are views into the
+    # page cache, and only the requested width is ever copied.
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    magic, sample_rate, base_bucket, factor, level_count, samples = PEAKS_HEADER.unpack_from(data, 0)
+    if magic != b"PKS1":
+        raise ValueError(f"{path} is not a peaks file")
+    levels = []
+    for index in range(level_count):
+        offset, count = PEAKS_LEVEL_ENTRY.unpack_from(data, PEAKS_HEADER.size + index * PEAKS_LEVEL_ENTRY.size)
+        levels.append(
+            {
+                "bucket_seconds": base_bucket * factor**index / sample_rate,
+                "peaks": np.ndarray((count, 2), dtype="<i2", buffer=data, offset=offset),
+            }
+        )
+    return {"duration": samples / sample_rate, "levels": levels}
+
+
+def slice_peaks(pyramid: dict, start: float, end: float, width: int) -> "np.ndarray":
+    # Uses the coarsest level that still has at least one bucket per pixel,
+    # then folds the slice down to exactly `width` (min, max) pairs.
+    span = max(end - start, 1e-3)
+    level = pyramid["levels"][0]
+    for candidate in pyramid["levels"]:
+        if span / candidate["bucket_seconds"] >= width:
+            level = candidate
+    bucket_seconds = level["bucket_seconds"]
+    first = int(start / bucket_seconds)
+    last = max(first + 1, int(np.ceil(end / bucket_seconds)))
+    view = level["peaks"][first:last]
+    if not len(view):
+        return np.zeros((width, 2), dtype="<i2")
+    if len(view) < width:
+        return view[(np.arange(width) * len(view)) // width]
+    edges = np.linspace(0, len(view), width + 1).astype(np.int64)[:-1]
+    return np.stack(
+        [np.minimum.reduceat(view[:, 0], edges), np.maximum.reduceat(view[:, 1], edges)], axis=1
+    ).astype("<i2")
+
+
+@api_router.get("/jobs/{job_id}/peaks")
+async def get_job_peaks(
+    job_id: str,
+    start: float = Query(0, alias="from", ge=0),
+    end: Optional[float] = Query(None, alias="to", gt=0),
+    width: int = Query(1000, ge=1, le=PEAKS_MAX_WIDTH),
+):
+    path = CLIP_DIR / job_id / "peaks.bin"
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Waveform não disponível")
+    pyramid = open_peaks(str(path), stat.st_mtime_ns)
+    end = min(end or pyramid["duration"], pyramid["duration"])
+    if end <= start:
+        raise HTTPException(status_code=400, detail="Intervalo inválido")
+    peaks = await asyncio.to_thread(slice_peaks, pyramid, start, end, width)
+    return Response(
+        content=peaks.tobytes(),
+        media_type="application/octet-stream",
+        headers={
+            "Cache-Control": "public, max-age=86400",
+            "X-Peaks-Duration": f"{pyramid['duration']:.3f}",
+        },
+    )
+
+
+async def sprite_job(job_id: str) -> dict:
+    job = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0, "id": 1, "duration": 1, "source_path": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if not job.get("duration"):
+        raise HTTPException(status_code=404, detail="Prévias ainda não disponíveis")
+    return job
+
+
+@api_router.get("/jobs/{job_id}/sprites.json")
+async def get_sprite_index(job_id: str):
+    job = await sprite_job(job_id)
+    return {
+        "duration": job["duration"],
+        "tile_width": SPRITE_TILE_WIDTH,
+        "tile_height": SPRITE_TILE_HEIGHT,
+        "columns": SPRITE_COLUMNS,
+        "rows": SPRITE_ROWS,
+        "levels": [
+            {**level, "url_template": f"/api/jobs/{job_id}/sprites/{level['level']}/{{sheet}}.jpg"}
+            for level in sprite_levels(job["duration"])
+        ],
+    }
+
+
+def vtt_timestamp(seconds: float) -> str:
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+@api_router.get("/jobs/{job_id}/sprites.vtt")
+async def get_sprite_vtt(job_id: str, level: int = Query(0, ge=0, lt=len(SPRITE_LEVEL_INTERVALS))):
+    job = await sprite_job(job_id)
+    duration = job["duration"]
+    spec = sprite_levels(duration)[level]
+    lines = ["WEBVTT", ""]
+    for tile in range(spec["tiles"]):
+        start = tile * spec["interval"]
+        sheet, x, y = sprite_tile(spec, tile)
+        lines.append(f"{vtt_timestamp(start)} --> {vtt_timestamp(min(duration, start + spec['interval']))}")
+        lines.append(
+            f"{sprite_sheet_url(job_id, level, sheet)}#xywh={x},{y},{SPRITE_TILE_WIDTH},{SPRITE_TILE_HEIGHT}"
+        )
+        lines.append("")
+    return Response(content="\n".join(lines), media_type="text/vtt")
+
+
+@api_router.get("/jobs/{job_id}/sprites/{level}/{sheet}.jpg")
+async def get_sprite_sheet(job_id: str, level: int, sheet: int):
+    job = await sprite_job(job_id)
+    levels = sprite_levels(job["duration"])
+    if not 0 <= level < len(levels) or not 0 <= sheet < levels[level]["sheets"]:
+        raise HTTPException(status_code=404, detail="Prévia não encontrada")
+    path = await ensure_sprite_sheet(job, levels[level], sheet)
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=86400"})
+
+
+ZIP_CHUNK_SIZE = 1024 * 1024
+ZIP_MAX_BYTES = 0xFFFFFFFF
+
+
+def export_entries(job: dict, clips: List[dict]) -> List[dict]:
+    entries = []
+    for clip in clips:
+        for url_field, folder in (("video_url", "clips"), ("thumbnail_url", "thumbs"), ("subtitles_url", "subtitles")):
+            if clip.get(url_field):
+                path = media_path(clip[url_field])
+                entries.append({"arcname": f"{folder}/{path.name}", "path": path, "version": clip.get("version", 1)})
+    for url_field, arcname in (("waveform_url", "timeline/waveform.png"), ("sprite_url", "timeline/sprite.jpg")):
+        if job.get(url_field):
+            entries.append({"arcname": arcname, "path": media_path(job[url_field]), "version": 1})
+    return entries
+
+
+def dos_timestamp(mtime: float) -> tuple:
+    stamp = time.gmtime(mtime)
+    dos_time = (stamp.tm_hour << 11) | (stamp.tm_min << 5) | (stamp.tm_sec // 2)
+    dos_date = ((max(1980, stamp.tm_year) - 1980) << 9) | (stamp.tm_mon << 5) | stamp.tm_mday
+    return dos_time, dos_date
+
+
+def file_crc32(path: Path) -> int:
+    crc = 0
+    with path.open("rb") as handle:
+        while chunk := handle.read(ZIP_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def load_export_manifest(export_dir: Path, entries: List[dict]) -> dict:
+    # The manifest pins size, mtime and CRC of every file in the archive, so
+    # the STORED zip layout is fully known before the first byte is sent.
+    # It is keyed by clip versions and file stats and reused until they change.
+    files = []
+    for entry in entries:
+        if entry["path"].exists():
+            stat = entry["path"].stat()
+            files.append({**entry, "path": str(entry["path"]), "size": stat.st_size, "mtime": stat.st_mtime})
+    fingerprint = [(item["arcname"], item["path"], item["version"], item["size"], item["mtime"]) for item in files]
+    key = hashlib.sha1(json.dumps(fingerprint).encode()).hexdigest()
+    manifest_path = export_dir / f"{key}.json"
+    if manifest_path.exists():
+        return json.loads(manifest_path.read_text())
+    for item in files:
+        item["crc"] = file_crc32(Path(item["path"]))
+        item["dos_time"], item["dos_date"] = dos_timestamp(item["mtime"])
+    manifest = {"key": key, "files": files}
+    export_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = manifest_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    temp_path.write_text(json.dumps(manifest))
+    os.replace(temp_path, manifest_path)
+    return manifest
+
+
+def zip_layout(files: List[dict]) -> List[tuple]:
+    segments: List[tuple] = []
+    central = bytearray()
+    offset = 0
+    for item in files:
+        name = item["arcname"].encode()
+        header = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034B50,
+            20,
+            0x0800,
+            0,
+            item["dos_time"],
+            item["dos_date"],
+            item["crc"],
+            item["size"],
+            item["size"],
+            len(name),
+            0,
+        )
+        segments.append(("bytes", header + name))
+        segments.append(("file", Path(item["path"]), item["size"]))
+        central += struct.pack(
+            "<IHHHHHHIIIHHHHHII",
+            0x02014B50,
+            20,
+            20,
+            0x0800,
+            0,
+            item["dos_time"],
+            item["dos_date"],
+            item["crc"],
+            item["size"],
+            item["size"],
+            len(name),
+            0,
+            0,
+            0,
+            0,
+            0,
+            offset,
+        )
+        central += name
+        offset += len(header) + len(name) + item["size"]
+    end = struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(files), len(files), len(central), offset, 0)
+    segments.append(("bytes", bytes(central) + end))
+    return segments
+
+
+def segment_length(segment: tuple) -> int:
+    return len(segment[1]) if segment[0] == "bytes" else segment[2]
+
+
+async def stream_segments(segments: List[tuple], start: int, end: int):
+    position = 0
+    for segment in segments:
+        segment_start = position
+        position += segment_length(segment)
+        if position <= start or segment_start > end:
+            continue
+        low = max(start, segment_start) - segment_start
+        high = min(end + 1, position) - segment_start
+        if segment[0] == "bytes":
+            yield segment[1][low:high]
+            continue
+        handle = await asyncio.to_thread(segment[1].open, "rb")
+        try:
+            await asyncio.to_thread(handle.seek, low)
+            remaining = high - low
+            while remaining > 0:
+                chunk = await asyncio.to_thread(handle.read, min(ZIP_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise RuntimeError(f"{segment[1].name} changed during export")
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            handle.close()
+
+
+MAX_RANGES = 16
+
+
+def parse_ranges(header: Optional[str], total: int) -> Optional[List[tuple]]:
+    # Returns the satisfiable (start, end) ranges of a Range header, or None
+    # when it should be ignored and the whole file sent.
+    if not header or not header.startswith("bytes="):
+        return None
+    specs = header[len("bytes="):].split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        first, _, last = spec.strip().partition("-")
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else total - 1
+            else:
+                start = max(0, total - int(last))
+                end = total - 1
+        except ValueError:
+            return None
+        if start <= end and start < total:
+            ranges.append((start, min(end, total - 1)))
+    if not ranges:
+        raise HTTPException(
+            status_code=416, detail="Intervalo inválido", headers={"Content-Range": f"bytes */{total}"}
+        )
+    return ranges
+
+
 @api_router.get("/jobs/{job_id}/download")
-async def download_job(job_id: str):
+async def download_job(job_id: str, request: Request, clips: Optional[str] = None):
     job = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0, "clips": 1, "waveform_url": 1, "sprite_url": 1})
     if not job:
         raise HTTPException(status_code=404, detail="Job não encontrado")
-    clips = job.get("clips", [])
-    if not clips:
+    selected = {clip_id for clip_id in clips.split(",") if clip_id} if clips else None
+    chosen = [clip for clip in job.get("clips", []) if selected is None or clip.get("id") in selected]
+    if not chosen:
         raise HTTPException(status_code=400, detail="Nenhum corte disponível")
-    zip_path = CLIP_DIR / job_id / "cortes.zip"
-    zip_path.parent.mkdir(parents=True, exist_ok=True)
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zipf:
-        for clip in clips:
-            video_url = clip.get("video_url", "")
-            thumb_url = clip.get("thumbnail_url", "")
-            if video_url:
-                video_path = STORAGE_DIR / video_url.replace("/media/", "")
-                if video_path.exists():
-                    zipf.write(video_path, arcname=f"clips/{video_path.name}")
-            if thumb_url:
-                thumb_path = STORAGE_DIR / thumb_url.replace("/media/", "")
-                if thumb_path.exists():
-                    zipf.write(thumb_path, arcname=f"thumbs/{thumb_path.name}")
-        waveform_url = job.get("waveform_url")
-        sprite_url = job.get("sprite_url")
-        if waveform_url:
-            waveform_path = STORAGE_DIR / waveform_url.replace("/media/", "")
-            if waveform_path.exists():
-                zipf.write(waveform_path, arcname="timeline/waveform.png")
-        if sprite_url:
-            sprite_path = STORAGE_DIR / sprite_url.replace("/media/", "")
-            if sprite_path.exists():
-                zipf.write(sprite_path, arcname="timeline/sprite.jpg")
-    return FileResponse(zip_path, filename=f"cortes-{job_id}.zip")
+    manifest = await asyncio.to_thread(
+        load_export_manifest, CLIP_DIR / job_id / "exports", export_entries(job, chosen)
+    )
+    segments = zip_layout(manifest["files"])
+    total = sum(segment_length(segment) for segment in segments)
+    if total > ZIP_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Exportação muito grande, selecione menos cortes")
+    etag = f'"{manifest["key"]}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="cortes-{job_id}.zip"',
+    }
+    byte_range = None
+    if request.headers.get("if-range", etag) == etag:
+        ranges = parse_ranges(request.headers.get("range"), total)
+        byte_range = ranges[0] if ranges and len(ranges) == 1 else None
+    start, end = byte_range or (0, total - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+    return StreamingResponse(
+        stream_segments(segments, start, end),
+        status_code=206 if byte_range else 200,
+        media_type="application/zip",
+        headers=headers,
+    )
+
+
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT", "")
+MEDIA_HASH_MAX_BYTES = int(float(os.environ.get("MEDIA_HASH_MAX_MB", "512")) * 1024**2)
+MEDIA_HASH_CACHE_SIZE = 4096
+MEDIA_CHUNK_SIZE = 1024 * 1024
+MEDIA_IMMUTABLE = "public, max-age=31536000, immutable"
+media_hashes: dict = {}
+media_hash_lock = threading.Lock()
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
+mimetypes.add_type("application/x-subrip", ".srt")
+
+
+def media_digest(path: Path, stat: os.stat_result) -> str:
+    # Content hash of a served file, remembered per (size, mtime). Files
+    # above MEDIA_HASH_MAX_BYTES (whole sources) fall back to size and mtime.
+    key = str(path)
+    with media_hash_lock:
+        cached = media_hashes.get(key)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    if stat.st_size > MEDIA_HASH_MAX_BYTES:
+        digest = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+    else:
+        hasher = hashlib.blake2b(digest_size=12)
+        with path.open("rb") as handle:
+            while chunk := handle.read(MEDIA_CHUNK_SIZE):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+    with media_hash_lock:
+        media_hashes.pop(key, None)
+        media_hashes[key] = (stat.st_size, stat.st_mtime_ns, digest)
+        while len(media_hashes) > MEDIA_HASH_CACHE_SIZE:
+            media_hashes.pop(next(iter(media_hashes)))
+    return digest
+
+
+def versioned_media_url(path: Path) -> str:
+    # ?v= pins the URL to the file's content, which lets it be cached as
+    # immutable by browsers and proxies.
+    return f"{media_url(path)}?v={media_digest(path, path.stat())}"
+
+
+class MediaFileResponse(Response):
+    # Sends one byte range of a file. Uses the ASGI zero-copy extension
+    # (sendfile) when the server offers it, otherwise reads 1 MiB chunks off
+    # the event loop.
+    def __init__(self, path: Path, start: int, end: int, status_code: int, headers: dict, media_type: str):
+        super().__init__(
+            status_code=status_code,
+            headers={**headers, "Content-Length": str(end - start + 1)},
+            media_type=media_type,
+        )
+        self.path = path
+        self.start = start
+        self.end = end
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if scope["method"] == "HEAD" or count <= 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        with self.path.open("rb") as handle:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": handle, "offset": self.start, "count": count})
+                return
+            await asyncio.to_thread(handle.seek, self.start)
+            while count > 0:
+                chunk = await asyncio.to_thread(handle.read, min(MEDIA_CHUNK_SIZE, count))
+                if not chunk:
+                    break
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+            if count > 0:
+                await send({"type": "http.response.body", "body": b""})
+
+
+async def stream_multirange(path: Path, ranges: List[tuple], boundary: str, media_type: str, total: int):
+    handle = await asyncio.to_thread(path.open, "rb")
+    try:
+        for start, end in ranges:
+            yield (
+                f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{total}\r\n\r\n"
+            ).encode()
+            await asyncio.to_thread(handle.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(handle.read, min(MEDIA_CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+    finally:
+        handle.close()
+
+
+@app.api_route("/media/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_media(file_path: str, request: Request, v: Optional[str] = None):
+    path = (STORAGE_DIR / file_path).resolve()
+    if not path.is_relative_to(STORAGE_DIR.resolve()) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    stat = path.stat()
+    digest = await run_media(media_digest, path, stat)
+    etag = f'"{digest}"'
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Only a URL pinned to the current content may be cached for good;
+        # bare or outdated URLs revalidate against the ETag.
+        "Cache-Control": MEDIA_IMMUTABLE if v == digest else "no-cache",
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+    }
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    if MEDIA_ACCEL_REDIRECT:
+        # nginx serves the bytes (ranges and sendfile included) from an
+        # internal location; Python only decides headers.
+        rel = path.relative_to(STORAGE_DIR.resolve()).as_posix()
+        return Response(
+            headers={**headers, "X-Accel-Redirect": f"{MEDIA_ACCEL_REDIRECT.rstrip('/')}/{rel}"},
+            media_type=media_type,
+        )
+    total = stat.st_size
+    ranges = None
+    if request.headers.get("if-range", etag) == etag and total:
+        ranges = parse_ranges(request.headers.get("range"), total)
+    if not ranges:
+        return MediaFileResponse(path, 0, total - 1, 200, headers, media_type)
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+        return MediaFileResponse(path, start, end, 206, headers, media_type)
+    boundary = uuid.uuid4().hex
+    length = sum(
+        len(f"--{boundary}\r\nContent-Type: {media_type}\r\nContent-Range: bytes {start}-{end}/{total}\r\n\r\n")
+        + (end - start + 1)
+        + 2
+        for start, end in ranges
+    ) + len(f"--{boundary}--\r\n")
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(
+        stream_multirange(path, ranges, boundary, media_type, total),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
 
 
 @api_router.post("/jobs/{job_id}/advance", response_model=ClipJob)
@@ -432,44 +4832,295 @@ async def advance_job(job_id: str):
     if not job:
         raise HTTPException(status_code=404, detail="Job não encontrado")
     status = job.get("status", "queued")
+    if status == "error":
+        await update_job(
+            job_id,
+            {"status": "queued", "progress": 0, "error_message": None, "attempts": 0},
+        )
     if status in ["queued", "error"]:
-        asyncio.create_task(process_job(job_id, job.get("youtube_url", ""), job.get("clip_length", 30)))
-    updated = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0})
+        notify_queue("download")
+    updated = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0, "media_info.keyframes": 0})
+    await attach_queue_info([updated])
     return serialize_job(updated)
 
 
+@api_router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, follow: bool = False):
+    # Subscribe before reading the snapshot so no update can fall between them.
+    queue = job_events.subscribe(job_id)
+    snapshot = await job_snapshot(job_id)
+    if not snapshot:
+        job_events.unsubscribe(queue, job_id)
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+
+    async def stream():
+        try:
+            yield sse_message("snapshot", snapshot)
+            if snapshot.status in TERMINAL_STATUSES and not follow:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event.get("resync"):
+                    current = await job_snapshot(job_id)
+                    if not current:
+                        return
+                    yield sse_message("snapshot", current)
+                    status = current.status
+                else:
+                    yield sse_message("update", event)
+                    status = event.get("status")
+                if status in TERMINAL_STATUSES and not follow:
+                    return
+        finally:
+            job_events.unsubscribe(queue, job_id)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@api_router.websocket("/jobs/ws")
+async def jobs_socket(websocket: WebSocket):
+    # One socket carries patches for every job, or only for the ids the
+    # client sends as {"subscribe": [...]} / {"unsubscribe": [...]}.
+    await websocket.accept()
+    queue = job_events.subscribe()
+    watched: Optional[set] = None
+
+    async def receive() -> None:
+        nonlocal watched
+        while True:
+            message = await websocket.receive_json()
+            if message.get("subscribe") is not None:
+                watched = (watched or set()) | set(message["subscribe"])
+            if message.get("unsubscribe") is not None and watched is not None:
+                watched -= set(message["unsubscribe"])
+
+    async def send() -> None:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.send_json({"type": "keepalive"})
+                continue
+            if watched is not None and event["id"] not in watched:
+                continue
+            kind = "resync" if event.get("resync") else "update"
+            await websocket.send_json({"type": kind, "job": jsonable_encoder(event)})
+
+    tasks = [asyncio.ensure_future(receive()), asyncio.ensure_future(send())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        job_events.unsubscribe(queue)
+
+
+RENDER_DEBOUNCE_SECONDS = float(os.environ.get("RENDER_DEBOUNCE_SECONDS", "0.75"))
+CLIP_PROJECTION_FIELDS = {
+    "render_mode": 1,
+    "aspect_ratio": 1,
+    "render_profile": 1,
+    "style": 1,
+    "language": 1,
+    "source_key": 1,
+    "source_path": 1,
+    "youtube_url": 1,
+}
+
+
+async def find_job_clip(job_id: str, clip_id: str) -> tuple:
+    job = await db.clip_jobs.find_one(
+        {"id": job_id},
+        {"_id": 0, "clips": {"$elemMatch": {"id": clip_id}}, **CLIP_PROJECTION_FIELDS},
+    )
+    clip = next(iter(job.get("clips", [])), None) if job else None
+    return job, clip
+
+
+async def set_clip_fields(
+    job_id: str, clip_id: str, version: Optional[int], fields: dict, render_status: Optional[str] = None
+) -> bool:
+    # Only the edited element is written, and only if nobody bumped its
+    # version in the meantime (documents from before versioning have none).
+    version_match = {"version": version} if version is not None else {"version": {"$exists": False}}
+    if render_status:
+        version_match["render_status"] = render_status
+    result = await db.clip_jobs.update_one(
+        {"id": job_id, "clips": {"$elemMatch": {"id": clip_id, **version_match}}},
+        {"$set": {f"clips.$[c].{field}": value for field, value in fields.items()}},
+        array_filters=[{"c.id": clip_id}],
+    )
+    if result.matched_count:
+        job_events.resync(job_id)
+    return bool(result.matched_count)
+
+
+async def render_clip_edit(job_id: str, clip_id: str) -> None:
+    job, clip = await find_job_clip(job_id, clip_id)
+    if not clip or clip.get("render_status") != "pending":
+        return
+    version = clip["version"]
+    start, end = clip["start_time"], clip["end_time"]
+    if not await set_clip_fields(job_id, clip_id, version, {"render_status": "rendering"}, "pending"):
+        return
+    # The edit holds the source under its own token, so releasing it leaves
+    # the ref of a render stage still running for the job in place.
+    holder = f"{job_id}:edit:{uuid.uuid4().hex}"
+    source_path = await acquire_job_source(job_id, job, holder)
+    try:
+        media_info = await run_media(load_media_info, source_path)
+        crop_track = None
+        if job.get("aspect_ratio") == "9:16" and media_info.get("video"):
+            crop_track = await load_crop_track(source_path)
+            media_info = reframed_media_info(media_info)
+        captions = None
+        if job_transcript_path(job_id).exists():
+            words = await run_media(read_transcript, job_transcript_path(job_id))
+            captions = caption_track(words, job.get("style") or "dinamico", job.get("language") or "pt", media_info)
+        encode = encode_profile(clip.get("render_profile") or job.get("render_profile"))
+        cached_clip, cached_thumb = await rerender_clip(
+            source_path,
+            render_source_id(job, source_path),
+            tuple(clip.get("rendered_range") or (start, end)),
+            start,
+            end - start,
+            job.get("render_mode", "quality"),
+            crop_track,
+            captions,
+            encode,
+        )
+    finally:
+        await release_source(holder)
+    # Each render gets new file names, so /media never serves a file that is
+    # being replaced; the previous ones are dropped once the new version is
+    # committed.
+    stem = f"{clip_id}-v{version}-{uuid.uuid4().hex[:8]}"
+    clip_path = CLIP_DIR / job_id / f"{stem}.mp4"
+    thumb_path = CLIP_DIR / job_id / f"{stem}.jpg"
+    subtitles_path = CLIP_DIR / job_id / f"{stem}.srt"
+    committed = False
+    try:
+        await run_media(link_file, cached_clip, clip_path)
+        await run_media(link_file, cached_thumb, thumb_path)
+        fields = {
+            "video_url": await run_media(versioned_media_url, clip_path),
+            "thumbnail_url": await run_media(versioned_media_url, thumb_path),
+            "render_status": "ready",
+            "render_version": version,
+            "rendered_range": [start, end],
+        }
+        if captions:
+            await run_media(write_srt, captions, start, end - start, subtitles_path)
+            fields["subtitles_url"] = await run_media(versioned_media_url, subtitles_path)
+        if HLS_ENABLED:
+            rungs = clip_rungs(media_info, job.get("render_mode", "quality"), encode)
+            async with cpu_budget.reserve(job_core_share()) as threads:
+                master_path = await render_hls_from_clip(clip_path, rungs, media_info, end - start, encode, threads)
+            fields["hls_url"] = media_url(master_path)
+        committed = await set_clip_fields(job_id, clip_id, version, fields)
+    finally:
+        superseded = [
+            media_path(clip[field]) for field in ("video_url", "thumbnail_url", "subtitles_url") if clip.get(field)
+        ]
+        for path in superseded if committed else [clip_path, thumb_path, subtitles_path]:
+            path.unlink(missing_ok=True)
+            shutil.rmtree(hls_dir_for(path), ignore_errors=True)
+
+
+class ClipRenderCoordinator:
+    # One render task per clip. Edits are written immediately and only mark
+    # the clip pending; the render starts after RENDER_DEBOUNCE_SECONDS of
+    # quiet. A newer edit cancels the pending or running task (killing its
+    # ffmpeg), so CPU only goes to the last trim state.
+    def __init__(self):
+        self.tasks: dict = {}
+
+    async def resume(self) -> None:
+        # Edits accepted before a restart are rendered again from scratch.
+        cursor = db.clip_jobs.find(
+            {"clips.render_status": {"$in": ["pending", "rendering"]}}, {"_id": 0, "id": 1, "clips": 1}
+        )
+        async for job in cursor:
+            for clip in job.get("clips", []):
+                if clip.get("render_status") in ("pending", "rendering"):
+                    await set_clip_fields(job["id"], clip["id"], clip.get("version"), {"render_status": "pending"})
+                    self.schedule(job["id"], clip["id"])
+
+    def schedule(self, job_id: str, clip_id: str) -> None:
+        key = (job_id, clip_id)
+        task = self.tasks.get(key)
+        if task and not task.done():
+            task.cancel()
+        self.tasks[key] = asyncio.ensure_future(self.run(key))
+
+    async def run(self, key: tuple) -> None:
+        job_id, clip_id = key
+        try:
+            await asyncio.sleep(RENDER_DEBOUNCE_SECONDS)
+            await render_clip_edit(job_id, clip_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Render of clip %s in job %s failed", clip_id, job_id)
+            _, clip = await find_job_clip(job_id, clip_id)
+            if clip:
+                await set_clip_fields(job_id, clip_id, clip.get("version"), {"render_status": "error"}, "rendering")
+        finally:
+            if self.tasks.get(key) is asyncio.current_task():
+                self.tasks.pop(key, None)
+
+    async def close(self) -> None:
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+clip_renders = ClipRenderCoordinator()
+
+
 @api_router.patch("/jobs/{job_id}/clips/{clip_id}", response_model=ClipSegment)
 async def update_clip(job_id: str, clip_id: str, payload: ClipUpdate):
-    job = await db.clip_jobs.find_one({"id": job_id}, {"_id": 0, "clips": 1})
+    job, clip = await find_job_clip(job_id, clip_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job não encontrado")
-    clips = job.get("clips", [])
-    clip = next((item for item in clips if item.get("id") == clip_id), None)
     if not clip:
         raise HTTPException(status_code=404, detail="Corte não encontrado")
     update_data = payload.model_dump(exclude_unset=True)
-    if "start_time" in update_data or "end_time" in update_data:
+    expected_version = update_data.pop("version", None)
+    current_version = clip.get("version", 1)
+    if expected_version is not None and expected_version != current_version:
+        raise HTTPException(status_code=409, detail="Corte alterado por outra edição, recarregue")
+    retime = "start_time" in update_data or "end_time" in update_data
+    profile = update_data.pop("render_profile", None)
+    if profile and profile != (clip.get("render_profile") or job.get("render_profile") or DEFAULT_ENCODE_PROFILE):
+        update_data["render_profile"] = profile
+    rerender = retime or "render_profile" in update_data
+    if retime:
         start = update_data.get("start_time", clip.get("start_time"))
         end = update_data.get("end_time", clip.get("end_time"))
         if end <= start:
             raise HTTPException(status_code=400, detail="Tempo final deve ser maior")
         update_data["duration"] = end - start
-        video_url = clip.get("video_url")
-        thumb_url = clip.get("thumbnail_url")
-        source_path = VIDEO_DIR / f"{job_id}.mp4"
-        if not source_path.exists():
-            raise HTTPException(status_code=400, detail="Arquivo fonte não encontrado")
-        if video_url:
-            clip_path = STORAGE_DIR / video_url.replace("/media/", "")
-            await asyncio.to_thread(render_clip, source_path, clip_path, start, end - start)
-        if thumb_url:
-            thumb_path = STORAGE_DIR / thumb_url.replace("/media/", "")
-            await asyncio.to_thread(render_thumbnail, source_path, thumb_path, max(0, start + 1))
+    if rerender:
+        update_data["render_status"] = "pending"
+        if "rendered_range" not in clip:
+            update_data["rendered_range"] = [clip.get("start_time"), clip.get("end_time")]
+    update_data["version"] = current_version + 1
+    if not await set_clip_fields(job_id, clip_id, clip.get("version"), update_data):
+        raise HTTPException(status_code=409, detail="Corte alterado por outra edição, recarregue")
+    if rerender:
+        clip_renders.schedule(job_id, clip_id)
     clip.update(update_data)
-    await db.clip_jobs.update_one(
-        {"id": job_id},
-        {"$set": {"clips": clips}},
-    )
     return ClipSegment(**clip)
 
 # Include the router in the main app
@@ -481,6 +5132,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Peaks-Duration"],
 )
 
 # Configure logging
@@ -490,6 +5142,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def ensure_indexes() -> None:
+    # Jobs created before dates were stored natively kept created_at as an
+    # ISO string; convert them so sorting and range filters see one type.
+    await db.clip_jobs.update_many(
+        {"created_at": {"$type": "string"}},
+        [{"$set": {"created_at": {"$toDate": "$created_at"}}}],
+    )
+    await db.clip_jobs.create_index("id", unique=True)
+    await db.clip_jobs.create_index([("created_at", -1), ("id", -1)])
+    await db.clip_jobs.create_index([("status", 1), ("created_at", 1)])
+    await db.source_cache.create_index("key", unique=True)
+
+
+@app.on_event("startup")
+async def start_queue_workers():
+    await ensure_indexes()
+    for stage, config in QUEUE_STAGES.items():
+        queue_wakeups[stage] = asyncio.Event()
+        for _ in range(config["workers"]):
+            queue_tasks.append(asyncio.create_task(queue_worker(stage)))
+    if JOB_EVENTS_CHANGE_STREAM:
+        queue_tasks.append(asyncio.create_task(watch_job_changes()))
+    if ENCODER_AUTOTUNE:
+        queue_tasks.append(asyncio.create_task(tune_encoder()))
+    queue_tasks.append(asyncio.create_task(storage_manager()))
+    await clip_renders.resume()
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await clip_renders.close()
+    for task in queue_tasks:
+        task.cancel()
+    await asyncio.gather(*queue_tasks, return_exceptions=True)
     client.close()
\ No newline at end of file
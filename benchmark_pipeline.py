@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+# Offline runs: no model downloads, no yt-dlp subprocess, no debounce on trims.
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cortes_recorte_bench")
+os.environ.setdefault("CAPTIONS_ENABLED", "0")
+os.environ.setdefault("STREAMING_INGEST", "0")
+os.environ.setdefault("RENDER_DEBOUNCE_SECONDS", "0")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import numpy as np  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+from pymongo import ReturnDocument  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import server  # noqa: E402
+from benchmark_render import make_source  # noqa: E402
+
+BENCH_URL_PREFIX = "bench://"
+PERCENTILES = (50, 90, 99)
+OPERATIONS = ("process_job", "update_clip", "download_job")
+
+
+class BenchCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def sort(self, *args, **kwargs):
+        return BenchCursor(self.cursor.sort(*args, **kwargs))
+
+    def limit(self, *args, **kwargs):
+        return BenchCursor(self.cursor.limit(*args, **kwargs))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return copy.deepcopy(await self.cursor.__anext__())
+
+    async def to_list(self, *args, **kwargs):
+        return copy.deepcopy(await self.cursor.to_list(*args, **kwargs))
+
+
+class BenchCollection:
+    # mongomock has no array filters; the server only uses them to address
+    # the clip its filter already matched with $elemMatch, which the
+    # positional operator expresses as well. With $elemMatch projections it
+    # also hands out live references into its store, so every read is copied
+    # the way a real driver decodes a fresh document. Updated documents are
+    # read back by _id: mongomock looks them up with the original filter,
+    # which misses once the update changed a field it matched on.
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def find(self, *args, **kwargs):
+        return BenchCursor(self.collection.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return copy.deepcopy(await self.collection.find_one(*args, **kwargs))
+
+    async def find_one_and_update(self, query: dict, update, projection=None, return_document=False, **kwargs):
+        if return_document != ReturnDocument.AFTER:
+            return copy.deepcopy(await self.collection.find_one_and_update(query, update, projection, **kwargs))
+        matched = await self.collection.find_one_and_update(query, update, {"_id": 1}, **kwargs)
+        return matched and await self.find_one({"_id": matched["_id"]}, projection)
+
+    async def update_one(self, query: dict, update, array_filters=None, **kwargs):
+        if array_filters:
+            update = {
+                operator: {re.sub(r"\.\$\[\w+\]", ".$", path): value for path, value in fields.items()}
+                for operator, fields in update.items()
+            }
+        return await self.collection.update_one(query, update, **kwargs)
+
+
+class BenchDatabase:
+    def __init__(self, database):
+        self.database = database
+        self.collections: dict = {}
+
+    def __getattr__(self, name):
+        if name not in self.collections:
+            self.collections[name] = BenchCollection(getattr(self.database, name))
+        return self.collections[name]
+
+
+class LocalProvider:
+    # Stands in for yt-dlp: bench://<source>/<run> resolves to a synthetic
+    # file, and every run is a distinct video so nothing is served warm.
+    def __init__(self):
+        self.sources: dict = {}
+
+    def add(self, name: str, path: Path, duration: int) -> None:
+        self.sources[name] = {"path": path, "duration": duration}
+
+    def resolve(self, url: str) -> tuple:
+        name, _, run = url[len(BENCH_URL_PREFIX):].partition("/")
+        return name, run, self.sources[name]
+
+    def probe(self, url: str) -> dict:
+        name, run, source = self.resolve(url)
+        return {
+            "id": f"{name}-{run}",
+            "extractor_key": "bench",
+            "title": f"Benchmark {name} #{run}",
+            "duration": source["duration"],
+            "webpage_url": url,
+        }
+
+    def download(self, key: str, url: str, info=None, on_progress=None) -> Path:
+        _, _, source = self.resolve(url)
+        target = server.source_path_for(key)
+        temp_path = target.with_name(f"{key}.{uuid.uuid4().hex}.tmp.mp4")
+        shutil.copyfile(source["path"], temp_path)
+        os.replace(temp_path, target)
+        if on_progress:
+            on_progress({"fraction": 1.0})
+        return target
+
+
+def use_sandbox(storage: Path, provider: LocalProvider) -> None:
+    server.STORAGE_DIR = storage
+    server.VIDEO_DIR = storage / "videos"
+    server.CLIP_DIR = storage / "clips"
+    server.RENDER_CACHE_DIR = storage / "renders"
+    for path in (server.VIDEO_DIR, server.CLIP_DIR):
+        path.mkdir(parents=True, exist_ok=True)
+    server.db = BenchDatabase(AsyncMongoMockClient()[os.environ["DB_NAME"]])
+    server.probe_video_metadata = provider.probe
+    server.download_source = provider.download
+
+
+def summarize(values: list) -> dict:
+    if not values:
+        return {}
+    summary = {f"p{q}": round(float(np.percentile(values, q)), 3) for q in PERCENTILES}
+    summary["mean"] = round(float(np.mean(values)), 3)
+    return summary
+
+
+def summarize_stages(breakdowns: list) -> dict:
+    stages = {}
+    for stage in sorted({stage for breakdown in breakdowns for stage in breakdown}):
+        runs = [breakdown[stage] for breakdown in breakdowns if stage in breakdown]
+        fps = [run["encode_fps"] for run in runs if run.get("encode_fps")]
+        stages[stage] = {
+            "count": sum(run["count"] for run in runs),
+            "wall_seconds": summarize([run["wall_seconds"] for run in runs]),
+            "cpu_seconds": summarize([run["cpu_seconds"] for run in runs]),
+            "max_rss_bytes": max(run["max_rss_bytes"] for run in runs),
+            "bytes_in": summarize([run["bytes_in"] for run in runs]),
+            "bytes_out": summarize([run["bytes_out"] for run in runs]),
+            **({"encode_fps": summarize(fps)} if fps else {}),
+        }
+    return stages
+
+
+async def run_process_job(provider_name: str, run: int, clip_length: int) -> dict:
+    # Created through the API handler and taken through each queue stage the
+    # way a worker would, so the job carries every field a real one does.
+    url = f"{BENCH_URL_PREFIX}{provider_name}/{run}"
+    job = await server.create_job(server.ClipJobCreate(youtube_url=url, clip_length=clip_length))
+    started = time.perf_counter()
+    for stage in server.QUEUE_STAGES:
+        claimed = await server.claim_job(stage, job.id)
+        if claimed is None:
+            break
+        await server.run_claimed_job(stage, claimed)
+    latency = time.perf_counter() - started
+    doc = await server.db.clip_jobs.find_one({"id": job.id}, {"_id": 0})
+    if doc["status"] != "completed":
+        raise RuntimeError(f"process_job failed for {url}: {doc.get('error_message')}")
+    return {"job": doc, "latency": latency, "timings": doc.get("timings") or {}}
+
+
+async def run_update_clip(job: dict) -> dict:
+    # Trims the first clip by a second on each side and waits for the
+    # re-render the edit schedules.
+    clip = job["clips"][0]
+    timings: dict = {}
+    server.job_timings.set(timings)
+    payload = server.ClipUpdate(
+        start_time=clip["start_time"] + 1, end_time=max(clip["start_time"] + 2, clip["end_time"] - 1)
+    )
+    started = time.perf_counter()
+    await server.update_clip(job["id"], clip["id"], payload)
+    task = server.clip_renders.tasks.get((job["id"], clip["id"]))
+    if task:
+        await task
+    latency = time.perf_counter() - started
+    _, edited = await server.find_job_clip(job["id"], clip["id"])
+    if edited.get("render_status") != "ready":
+        raise RuntimeError(f"update_clip left clip {clip['id']} {edited.get('render_status')}")
+    # A ready status alone would not catch a trim whose output was lost.
+    clip_path = server.media_path(edited["video_url"])
+    fps = server.load_media_info(Path(job["source_path"]))["video"]["fps"]
+    expected = edited["end_time"] - edited["start_time"]
+    if not clip_path.exists() or not server.duration_matches(clip_path, expected, fps):
+        raise RuntimeError(f"update_clip produced no {expected}s clip at {clip_path}")
+    return {"latency": latency, "timings": server.timing_breakdown(timings)}
+
+
+async def run_download_job(job_id: str) -> dict:
+    timings: dict = {}
+    server.job_timings.set(timings)
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+    started = time.perf_counter()
+    size = 0
+    with server.timed_stage("export") as metrics:
+        response = await server.download_job(job_id, request)
+        async for chunk in response.body_iterator:
+            size += len(chunk)
+        metrics.bytes_out = size
+    latency = time.perf_counter() - started
+    return {"latency": latency, "bytes": size, "timings": server.timing_breakdown(timings)}
+
+
+async def run_job(name: str, run: int, clip_length: int, slots: asyncio.Semaphore) -> dict:
+    async with slots:
+        processed = await asyncio.create_task(run_process_job(name, run, clip_length))
+        updated = await asyncio.create_task(run_update_clip(processed["job"]))
+        exported = await asyncio.create_task(run_download_job(processed["job"]["id"]))
+    return {
+        "clips": len(processed["job"]["clips"]),
+        "process_job": processed,
+        "update_clip": updated,
+        "download_job": exported,
+    }
+
+
+def usage_snapshot() -> dict:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "cpu_self": own.ru_utime + own.ru_stime,
+        "cpu_children": children.ru_utime + children.ru_stime,
+        # ru_maxrss is in KiB on Linux.
+        "rss_self": own.ru_maxrss * 1024,
+        "rss_children": children.ru_maxrss * 1024,
+    }
+
+
+async def bench_source(name: str, duration: int, runs: int, concurrency: int, clip_length: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+    before = usage_snapshot()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_job(name, run, clip_length, slots) for run in range(runs)))
+    wall = time.perf_counter() - started
+    after = usage_snapshot()
+    report = {
+        "runs": runs,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput": {
+            "jobs_per_minute": round(runs * 60 / wall, 2),
+            "source_seconds_per_second": round(runs * duration / wall, 2),
+            "clips_per_minute": round(sum(result["clips"] for result in results) * 60 / wall, 2),
+        },
+        "cpu_seconds": {
+            "self": round(after["cpu_self"] - before["cpu_self"], 3),
+            "children": round(after["cpu_children"] - before["cpu_children"], 3),
+        },
+        "peak_rss_bytes": {"self": after["rss_self"], "children": after["rss_children"]},
+    }
+    for operation in OPERATIONS:
+        report[operation] = {
+            "latency_seconds": summarize([result[operation]["latency"] for result in results]),
+            "stages": summarize_stages([result[operation]["timings"] for result in results]),
+        }
+    exported = sum(result["download_job"]["bytes"] for result in results)
+    export_seconds = sum(result["download_job"]["latency"] for result in results)
+    report["download_job"]["bytes_per_second"] = round(exported / export_seconds) if export_seconds else None
+    return report
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    # A regression is a p50 latency more than `tolerance` above the baseline
+    # for the same source and operation.
+    regressions = []
+    for name, report in results["sources"].items():
+        previous = baseline.get("sources", {}).get(name)
+        if not previous:
+            continue
+        for operation in OPERATIONS:
+            current = report[operation]["latency_seconds"].get("p50")
+            reference = previous.get(operation, {}).get("latency_seconds", {}).get("p50")
+            if not current or not reference:
+                continue
+            ratio = current / reference
+            report[operation]["baseline_ratio"] = round(ratio, 3)
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    {
+                        "source": name,
+                        "operation": operation,
+                        "p50": current,
+                        "baseline_p50": reference,
+                        "ratio": round(ratio, 3),
+                    }
+                )
+    return regressions
+
+
+def parse_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark of download, render, trim and export.")
+    parser.add_argument("--lengths", default="60,180", help="source lengths in seconds, comma separated")
+    parser.add_argument("--sizes", default="640x360,1280x720", help="source resolutions, comma separated")
+    parser.add_argument("--runs", type=int, default=3, help="jobs per source")
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs in flight at once")
+    parser.add_argument("--clip-length", type=int, default=30)
+    parser.add_argument("--baseline", type=Path, help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p50 slowdown over the baseline")
+    parser.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+async def bench(args: argparse.Namespace, workdir: Path) -> dict:
+    provider = LocalProvider()
+    use_sandbox(workdir / "storage", provider)
+    lengths = [int(length) for length in args.lengths.split(",") if length]
+    sizes = [size for size in args.sizes.split(",") if size]
+    results = {
+        "config": {
+            "lengths": lengths,
+            "sizes": sizes,
+            "runs": args.runs,
+            "concurrency": args.concurrency,
+            "clip_length": args.clip_length,
+            "cpu_count": os.cpu_count(),
+        },
+        "sources": {},
+    }
+    try:
+        for duration, size in itertools.product(lengths, sizes):
+            name = f"{duration}s-{size}"
+            path = workdir / f"{name}.mp4"
+            make_source(path, duration, size)
+            provider.add(name, path, duration)
+            results["sources"][name] = await bench_source(
+                name, duration, args.runs, args.concurrency, args.clip_length
+            )
+    finally:
+        await server.clip_renders.close()
+    return results
+
+
+def main() -> int:
+    args = parse_args(sys.argv[1:])
+    with tempfile.TemporaryDirectory() as tmp:
+        results = asyncio.run(bench(args, Path(tmp)))
+    status = 0
+    if args.baseline:
+        results["regressions"] = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        status = 1 if results["regressions"] else 0
+    report = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(report)
+    else:
+        print(report)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
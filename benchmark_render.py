@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from functools import partial
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cortes_recorte_bench")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from server import (  # noqa: E402
+    build_clip_plan,
+    render_job_batch,
+    render_clip,
+    render_job_parallel,
+    render_thumbnail,
+    render_waveform,
+)
+
+
+def make_source(path: Path, duration: int, size: str = "1280x720") -> None:
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc=duration={duration}:size={size}:rate=30",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=440:duration={duration}",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "ultrafast",
+            "-c:a",
+            "aac",
+            "-shortest",
+            str(path),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def build_renders(output_dir: Path, duration: int, clip_length: int) -> list:
+    safe_length = min(clip_length, max(5, duration))
+    renders = []
+    for start_time in build_clip_plan(duration, clip_length):
+        clip_id = str(uuid.uuid4())
+        renders.append(
+            {
+                "id": clip_id,
+                "start": start_time,
+                "duration": safe_length,
+                "thumb_at": min(start_time + 1, duration - 1),
+                "video_path": output_dir / f"{clip_id}.mp4",
+                "thumb_path": output_dir / f"{clip_id}.jpg",
+            }
+        )
+    return renders
+
+
+async def render_per_output(video_path: Path, clips: list, waveform_path: Path) -> None:
+    # One ffmpeg process per output, each decoding the source again: the
+    # baseline the single-pass batch render is measured against.
+    await render_waveform(video_path, waveform_path)
+    for clip in clips:
+        await render_clip(video_path, clip["video_path"], clip["start"], clip["duration"])
+        await render_thumbnail(video_path, clip["thumb_path"], clip["thumb_at"])
+
+
+def measure(renderer, source: Path, output_dir: Path, duration: int, clip_length: int) -> dict:
+    renders = build_renders(output_dir, duration, clip_length)
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    result = renderer(source, renders, output_dir / "waveform.png")
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
+    wall = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {"wall_seconds": round(wall, 3), "cpu_seconds": round(cpu, 3), "clips": len(renders)}
+
+
+def main() -> int:
+    duration = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    clip_length = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        source = workdir / "source.mp4"
+        make_source(source, duration)
+        results = {"source_seconds": duration, "clip_length": clip_length}
+        renderers = [
+            ("per_clip", render_per_output),
+            ("parallel", render_job_parallel),
+            ("batched", partial(render_job_batch, duration=duration)),
+        ]
+        for name, renderer in renderers:
+            output_dir = workdir / name
+            output_dir.mkdir()
+            results[name] = measure(renderer, source, output_dir, duration, clip_length)
+        if results["batched"]["cpu_seconds"]:
+            results["cpu_speedup"] = round(results["per_clip"]["cpu_seconds"] / results["batched"]["cpu_seconds"], 2)
+        if results["batched"]["wall_seconds"]:
+            results["wall_speedup"] = round(results["per_clip"]["wall_seconds"] / results["batched"]["wall_seconds"], 2)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
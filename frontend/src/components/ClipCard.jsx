@@ -1,13 +1,21 @@
 import { Card } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { Button } from "@/components/ui/button";
-import { Download, Pencil, Play } from "lucide-react";
+import { Captions, Download, Pencil, Play } from "lucide-react";
 import { toast } from "sonner";
 import { resolveMediaUrl } from "@/lib/media";
 
+const RENDER_STATUS_LABELS = {
+  pending: "Renderizando...",
+  rendering: "Renderizando...",
+  error: "Falha ao renderizar",
+};
+
 export const ClipCard = ({ clip, onPreview, onDownload, onEdit }) => {
   const thumbnailUrl = resolveMediaUrl(clip.thumbnail_url);
   const videoUrl = resolveMediaUrl(clip.video_url);
+  const subtitlesUrl = resolveMediaUrl(clip.subtitles_url);
+  const renderLabel = RENDER_STATUS_LABELS[clip.render_status];
   const handlePreview = () => {
     if (onPreview) {
       onPreview(clip);
@@ -54,6 +62,14 @@ export const ClipCard = ({ clip, onPreview, onDownload, onEdit }) => {
         >
           Viral {clip.viral_score}/100
         </Badge>
+        {renderLabel && (
+          <Badge
+            className="absolute top-3 left-3 bg-black/70 text-white"
+            data-testid={`clip-render-status-${clip.id}`}
+          >
+            {renderLabel}
+          </Badge>
+        )}
       </div>
       <div className="flex flex-col gap-2">
         <h3
@@ -93,6 +109,15 @@ export const ClipCard = ({ clip, onPreview, onDownload, onEdit }) => {
             <Pencil size={16} /> Editar corte
           </Button>
         )}
+        {subtitlesUrl && (
+          <Button
+            onClick={() => window.open(subtitlesUrl, "_blank", "noopener,noreferrer")}
+            className="col-span-2 bg-white/5 hover:bg-white/10"
+            data-testid={`clip-subtitles-button-${clip.id}`}
+          >
+            <Captions size={16} /> Legendas (.srt)
+          </Button>
+        )}
       </div>
     </Card>
   );
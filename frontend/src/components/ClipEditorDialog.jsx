@@ -10,12 +10,25 @@ import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
 import { Textarea } from "@/components/ui/textarea";
 import { Slider } from "@/components/ui/slider";
+import {
+  Select,
+  SelectContent,
+  SelectItem,
+  SelectTrigger,
+  SelectValue,
+} from "@/components/ui/select";
 import { resolveMediaUrl } from "@/lib/media";
+import { WaveformPeaks } from "@/components/WaveformPeaks";
+import { TimelineSprites } from "@/components/TimelineSprites";
+
+const ZOOM_PADDING_SECONDS = 10;
 
 export const ClipEditorDialog = ({ clip, job, open, onOpenChange, onSave }) => {
   const [title, setTitle] = useState("");
   const [caption, setCaption] = useState("");
   const [range, setRange] = useState([0, 0]);
+  const [zoomed, setZoomed] = useState(false);
+  const [renderProfile, setRenderProfile] = useState("publish");
 
   const maxRange = useMemo(() => {
     if (job?.duration) return job.duration;
@@ -30,12 +43,33 @@ export const ClipEditorDialog = ({ clip, job, open, onOpenChange, onSave }) => {
     return { left: `${left}%`, width: `${width}%` };
   }, [range, job]);
 
+  const timelineView = useMemo(() => {
+    const duration = job?.duration || maxRange;
+    if (!zoomed || !clip) return [0, duration];
+    return [
+      Math.max(0, clip.start_time - ZOOM_PADDING_SECONDS),
+      Math.min(duration, clip.end_time + ZOOM_PADDING_SECONDS),
+    ];
+  }, [zoomed, clip, job, maxRange]);
+
+  const timelineHighlight = useMemo(() => {
+    const span = timelineView[1] - timelineView[0];
+    if (span <= 0) return { left: "0%", width: "0%" };
+    const start = Math.max(range[0], timelineView[0]);
+    const end = Math.min(range[1], timelineView[1]);
+    const left = ((start - timelineView[0]) / span) * 100;
+    const width = (Math.max(0, end - start) / span) * 100;
+    return { left: `${left}%`, width: `${width}%` };
+  }, [range, timelineView]);
+
   useEffect(() => {
     if (!clip) return;
     setTitle(clip.title);
     setCaption(clip.caption);
     setRange([clip.start_time, clip.end_time]);
-  }, [clip]);
+    setZoomed(false);
+    setRenderProfile(clip.render_profile || job?.render_profile || "publish");
+  }, [clip, job]);
 
   const handleNudge = (delta, isStart) => {
     setRange((prev) => {
@@ -59,6 +93,8 @@ export const ClipEditorDialog = ({ clip, job, open, onOpenChange, onSave }) => {
       caption,
       start_time: range[0],
       end_time: range[1],
+      render_profile: renderProfile,
+      version: clip.version,
     });
   };
 
@@ -79,7 +115,30 @@ export const ClipEditorDialog = ({ clip, job, open, onOpenChange, onSave }) => {
           </DialogDescription>
         </DialogHeader>
         <div className="flex flex-col gap-4">
-          {job?.waveform_url && (
+          {job?.peaks_url && (
+            <div className="flex flex-col gap-2" data-testid="clip-editor-waveform-section">
+              <div className="flex items-center justify-between text-xs text-white/60">
+                <span data-testid="clip-editor-waveform-label">Waveform do áudio</span>
+                <Button
+                  variant="ghost"
+                  className="h-7 px-3 text-xs bg-white/5 hover:bg-white/10"
+                  onClick={() => setZoomed((value) => !value)}
+                  data-testid="clip-editor-waveform-zoom"
+                >
+                  {zoomed ? "Ver vídeo inteiro" : "Zoom no corte"}
+                </Button>
+              </div>
+              <div className="relative rounded-2xl overflow-hidden border border-white/10 bg-black/40">
+                <WaveformPeaks jobId={job.id} from={timelineView[0]} to={timelineView[1]} />
+                <div
+                  className="absolute top-0 bottom-0 bg-[var(--e1-secondary)]/20 border border-[var(--e1-secondary)]"
+                  style={timelineHighlight}
+                  data-testid="clip-editor-waveform-highlight"
+                />
+              </div>
+            </div>
+          )}
+          {!job?.peaks_url && job?.waveform_url && (
             <div className="flex flex-col gap-2" data-testid="clip-editor-waveform-section">
               <div className="text-xs text-white/60" data-testid="clip-editor-waveform-label">
                 Waveform do áudio
@@ -99,7 +158,22 @@ export const ClipEditorDialog = ({ clip, job, open, onOpenChange, onSave }) => {
               </div>
             </div>
           )}
-          {job?.sprite_url && (
+          {job?.sprites_url && (
+            <div className="flex flex-col gap-2" data-testid="clip-editor-sprite-section">
+              <div className="text-xs text-white/60" data-testid="clip-editor-sprite-label">
+                Thumbnails por frame
+              </div>
+              <div className="relative rounded-2xl border border-white/10">
+                <TimelineSprites jobId={job.id} from={timelineView[0]} to={timelineView[1]} />
+                <div
+                  className="absolute top-0 bottom-0 bg-[var(--e1-primary)]/15 border border-[var(--e1-primary)] pointer-events-none"
+                  style={timelineHighlight}
+                  data-testid="clip-editor-sprite-highlight"
+                />
+              </div>
+            </div>
+          )}
+          {!job?.sprites_url && job?.sprite_url && (
             <div className="flex flex-col gap-2" data-testid="clip-editor-sprite-section">
               <div className="text-xs text-white/60" data-testid="clip-editor-sprite-label">
                 Thumbnails por frame
@@ -195,6 +269,30 @@ export const ClipEditorDialog = ({ clip, job, open, onOpenChange, onSave }) => {
               </Button>
             </div>
           </div>
+          <div className="flex flex-col gap-2" data-testid="clip-editor-profile-field">
+            <label className="text-sm text-white/70" data-testid="clip-editor-profile-label">
+              Perfil de saída
+            </label>
+            <Select value={renderProfile} onValueChange={setRenderProfile}>
+              <SelectTrigger
+                className="bg-black/40 border-white/10"
+                data-testid="clip-editor-profile-trigger"
+              >
+                <SelectValue placeholder="Selecione" />
+              </SelectTrigger>
+              <SelectContent data-testid="clip-editor-profile-content">
+                <SelectItem value="preview" data-testid="clip-editor-profile-preview">
+                  Prévia (480p, rápida)
+                </SelectItem>
+                <SelectItem value="publish" data-testid="clip-editor-profile-publish">
+                  Publicação
+                </SelectItem>
+                <SelectItem value="archive" data-testid="clip-editor-profile-archive">
+                  Arquivo (máxima qualidade)
+                </SelectItem>
+              </SelectContent>
+            </Select>
+          </div>
           <Button
             onClick={handleSave}
             className="pill-button bg-[var(--e1-primary)] text-white"
@@ -8,9 +8,17 @@ import {
 import { Button } from "@/components/ui/button";
 import { resolveMediaUrl } from "@/lib/media";
 
+// Browsers with native HLS (Safari, iOS, most Android) get the adaptive
+// rendition ladder; everyone else plays the progressive mp4.
+const supportsNativeHls = () =>
+  typeof document !== "undefined" &&
+  document.createElement("video").canPlayType("application/vnd.apple.mpegurl") !== "";
+
 export const ClipPreviewDialog = ({ clip, open, onOpenChange, onDownload }) => {
   if (!clip) return null;
-  const videoUrl = resolveMediaUrl(clip.video_url);
+  const videoUrl = resolveMediaUrl(
+    clip.hls_url && supportsNativeHls() ? clip.hls_url : clip.video_url
+  );
 
   return (
     <Dialog open={open} onOpenChange={onOpenChange}>
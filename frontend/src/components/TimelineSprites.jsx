@@ -0,0 +1,96 @@
+import { useEffect, useMemo, useRef, useState } from "react";
+import { getSpriteIndex } from "@/lib/api";
+import { resolveMediaUrl } from "@/lib/media";
+
+const SLOT_WIDTH = 80;
+
+const tileStyle = (index, level, time, width) => {
+  const tile = Math.min(level.tiles - 1, Math.floor(time / level.interval));
+  const perSheet = index.columns * index.rows;
+  const sheet = Math.floor(tile / perSheet);
+  const position = tile % perSheet;
+  const scale = width / index.tile_width;
+  const x = (position % index.columns) * index.tile_width * scale;
+  const y = Math.floor(position / index.columns) * index.tile_height * scale;
+  return {
+    width,
+    height: index.tile_height * scale,
+    backgroundImage: `url(${resolveMediaUrl(level.url_template.replace("{sheet}", sheet))})`,
+    backgroundPosition: `-${x}px -${y}px`,
+    backgroundSize: `${index.columns * index.tile_width * scale}px auto`,
+  };
+};
+
+export const TimelineSprites = ({ jobId, from, to }) => {
+  const containerRef = useRef(null);
+  const [index, setIndex] = useState(null);
+  const [width, setWidth] = useState(0);
+  const [hover, setHover] = useState(null);
+
+  useEffect(() => {
+    let active = true;
+    getSpriteIndex(jobId)
+      .then((data) => {
+        if (active) setIndex(data);
+      })
+      .catch(() => {});
+    return () => {
+      active = false;
+    };
+  }, [jobId]);
+
+  useEffect(() => {
+    const container = containerRef.current;
+    if (!container) return undefined;
+    const observer = new ResizeObserver(([entry]) => {
+      setWidth(entry.contentRect.width);
+    });
+    observer.observe(container);
+    return () => observer.disconnect();
+  }, []);
+
+  const slots = useMemo(() => {
+    if (!index || !width || to <= from) return [];
+    const count = Math.max(1, Math.round(width / SLOT_WIDTH));
+    const span = (to - from) / count;
+    const level =
+      [...index.levels].reverse().find((candidate) => candidate.interval <= span) || index.levels[0];
+    return Array.from({ length: count }, (_, slot) => ({
+      key: slot,
+      style: tileStyle(index, level, from + slot * span, width / count),
+    }));
+  }, [index, width, from, to]);
+
+  const handleMove = (event) => {
+    if (!index) return;
+    const bounds = event.currentTarget.getBoundingClientRect();
+    const fraction = Math.min(1, Math.max(0, (event.clientX - bounds.left) / bounds.width));
+    setHover({ left: fraction * bounds.width, time: from + fraction * (to - from) });
+  };
+
+  return (
+    <div
+      ref={containerRef}
+      className="relative w-full"
+      onMouseMove={handleMove}
+      onMouseLeave={() => setHover(null)}
+      data-testid="clip-editor-sprite-tiles"
+    >
+      <div className="flex w-full rounded-2xl overflow-hidden">
+        {slots.map((slot) => (
+          <div key={slot.key} className="bg-no-repeat shrink-0" style={slot.style} />
+        ))}
+      </div>
+      {hover && index && (
+        <div
+          className="absolute bottom-full mb-2 -translate-x-1/2 rounded-lg overflow-hidden border border-white/20 pointer-events-none"
+          style={{ left: hover.left }}
+          data-testid="clip-editor-sprite-preview"
+        >
+          <div className="bg-no-repeat" style={tileStyle(index, index.levels[0], hover.time, index.tile_width)} />
+          <div className="bg-black/70 text-[10px] text-center text-white/80">{Math.round(hover.time)}s</div>
+        </div>
+      )}
+    </div>
+  );
+};
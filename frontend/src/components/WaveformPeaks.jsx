@@ -0,0 +1,55 @@
+import { useEffect, useRef, useState } from "react";
+import { getJobPeaks } from "@/lib/api";
+
+const WAVEFORM_COLOR = "#ccff00";
+
+export const WaveformPeaks = ({ jobId, from, to, height = 96 }) => {
+  const canvasRef = useRef(null);
+  const [width, setWidth] = useState(0);
+
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas) return undefined;
+    const observer = new ResizeObserver(([entry]) => {
+      setWidth(Math.round(entry.contentRect.width));
+    });
+    observer.observe(canvas);
+    return () => observer.disconnect();
+  }, []);
+
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas || !width || to <= from) return undefined;
+    let active = true;
+    const ratio = window.devicePixelRatio || 1;
+    const pixels = Math.min(8192, Math.round(width * ratio));
+    getJobPeaks(jobId, { from, to, width: pixels })
+      .then((peaks) => {
+        if (!active) return;
+        canvas.width = pixels;
+        canvas.height = Math.round(height * ratio);
+        const context = canvas.getContext("2d");
+        const middle = canvas.height / 2;
+        context.clearRect(0, 0, canvas.width, canvas.height);
+        context.fillStyle = WAVEFORM_COLOR;
+        for (let x = 0; x < pixels; x += 1) {
+          const low = (peaks[x * 2] / 32768) * middle;
+          const high = (peaks[x * 2 + 1] / 32768) * middle;
+          context.fillRect(x, middle - high, 1, Math.max(1, high - low));
+        }
+      })
+      .catch(() => {});
+    return () => {
+      active = false;
+    };
+  }, [jobId, from, to, width, height]);
+
+  return (
+    <canvas
+      ref={canvasRef}
+      className="block w-full"
+      style={{ height }}
+      data-testid="clip-editor-waveform-canvas"
+    />
+  );
+};
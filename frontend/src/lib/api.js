@@ -8,11 +8,16 @@ export const createJob = async (payload) => {
   return data;
 };
 
-export const listJobs = async () => {
-  const { data } = await axios.get(`${API}/jobs`);
+export const listJobs = async (params = {}) => {
+  const { data } = await axios.get(`${API}/jobs`, { params });
   return data;
 };
 
+export const listJobsPage = async (params = {}) => {
+  const response = await axios.get(`${API}/jobs`, { params });
+  return { items: response.data, nextCursor: response.headers["x-next-cursor"] || null };
+};
+
 export const getJob = async (jobId) => {
   const { data } = await axios.get(`${API}/jobs/${jobId}`);
   return data;
@@ -23,6 +28,30 @@ export const getJobClips = async (jobId) => {
   return data;
 };
 
+export const getJobPeaks = async (jobId, { from, to, width }) => {
+  const { data } = await axios.get(`${API}/jobs/${jobId}/peaks`, {
+    params: { from, to, width },
+    responseType: "arraybuffer",
+  });
+  return new Int16Array(data);
+};
+
+export const getSpriteIndex = async (jobId) => {
+  const { data } = await axios.get(`${API}/jobs/${jobId}/sprites.json`);
+  return data;
+};
+
+export const subscribeToJob = (jobId, { onSnapshot, onUpdate, onError, follow = false }) => {
+  const source = new EventSource(`${API}/jobs/${jobId}/events${follow ? "?follow=true" : ""}`);
+  source.addEventListener("snapshot", (event) => onSnapshot(JSON.parse(event.data)));
+  source.addEventListener("update", (event) => onUpdate(JSON.parse(event.data)));
+  source.onerror = () => {
+    source.close();
+    if (onError) onError();
+  };
+  return () => source.close();
+};
+
 export const advanceJob = async (jobId) => {
   const { data } = await axios.post(`${API}/jobs/${jobId}/advance`);
   return data;
@@ -33,6 +62,7 @@ export const updateClip = async (jobId, clipId, payload) => {
   return data;
 };
 
-export const getDownloadUrl = (jobId) => {
-  return `${BACKEND_URL || ""}/api/jobs/${jobId}/download`;
+export const getDownloadUrl = (jobId, clipIds) => {
+  const base = `${BACKEND_URL || ""}/api/jobs/${jobId}/download`;
+  return clipIds?.length ? `${base}?clips=${clipIds.map(encodeURIComponent).join(",")}` : base;
 };
@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useNavigate, useSearchParams } from "react-router-dom";
 import { Navbar } from "@/components/Navbar";
 import { Button } from "@/components/ui/button";
@@ -14,7 +14,7 @@ import {
 } from "@/components/ui/select";
 import { Slider } from "@/components/ui/slider";
 import { ClipCard } from "@/components/ClipCard";
-import { createJob, listJobs, getJob, advanceJob } from "@/lib/api";
+import { createJob, listJobsPage, getJob, advanceJob, subscribeToJob } from "@/lib/api";
 import { toast } from "sonner";
 import { Scissors, Sparkles, Timer } from "lucide-react";
 
@@ -25,8 +25,13 @@ export default function Create() {
   const [clipLength, setClipLength] = useState([30]);
   const [style, setStyle] = useState("dinamico");
   const [language, setLanguage] = useState("pt");
+  const [renderMode, setRenderMode] = useState("quality");
+  const [aspectRatio, setAspectRatio] = useState("original");
+  const [renderProfile, setRenderProfile] = useState("publish");
   const [currentJob, setCurrentJob] = useState(null);
   const [jobs, setJobs] = useState([]);
+  const [jobsCursor, setJobsCursor] = useState(null);
+  const [isLoadingJobs, setIsLoadingJobs] = useState(false);
   const [isSubmitting, setIsSubmitting] = useState(false);
 
   useEffect(() => {
@@ -39,8 +44,9 @@ export default function Create() {
   useEffect(() => {
     const fetchJobs = async () => {
       try {
-        const data = await listJobs();
-        setJobs(data);
+        const { items, nextCursor } = await listJobsPage({ limit: 4 });
+        setJobs(items);
+        setJobsCursor(nextCursor);
       } catch (error) {
         toast.error("Não foi possível carregar os jobs.");
       }
@@ -48,36 +54,58 @@ export default function Create() {
     fetchJobs();
   }, []);
 
+  const latestJob = useRef(null);
+  const currentJobId = currentJob?.id;
+  const currentJobDone = ["completed", "error"].includes(currentJob?.status);
+
   useEffect(() => {
-    if (!currentJob || ["completed", "error"].includes(currentJob.status)) {
+    if (!currentJobId || currentJobDone) {
       return undefined;
     }
     let cancelled = false;
-    const interval = setInterval(async () => {
-      try {
-        const updated = await getJob(currentJob.id);
-        if (cancelled) return;
-        setCurrentJob(updated);
-        setJobs((prev) => {
-          const exists = prev.find((job) => job.id === updated.id);
-          if (!exists) return [updated, ...prev];
-          return prev.map((job) => (job.id === updated.id ? updated : job));
-        });
+    let interval = null;
+    latestJob.current = currentJob;
+    const applyJob = (updated) => {
+      if (cancelled) return;
+      const previous = latestJob.current;
+      latestJob.current = updated;
+      if (previous && previous.status !== updated.status) {
         if (updated.status === "completed") {
           toast.success("Cortes prontos para revisão!");
         }
         if (updated.status === "error") {
           toast.error("Falha no processamento. Verifique o link do YouTube.");
         }
-      } catch (error) {
-        toast.error("Falha ao atualizar o progresso.");
       }
-    }, 1400);
+      setCurrentJob(updated);
+      setJobs((prev) => {
+        const exists = prev.find((job) => job.id === updated.id);
+        if (!exists) return [updated, ...prev];
+        return prev.map((job) => (job.id === updated.id ? updated : job));
+      });
+    };
+    const startPolling = () => {
+      interval = setInterval(async () => {
+        try {
+          applyJob(await getJob(currentJobId));
+        } catch (error) {
+          toast.error("Falha ao atualizar o progresso.");
+        }
+      }, 1400);
+    };
+    const unsubscribe = subscribeToJob(currentJobId, {
+      onSnapshot: applyJob,
+      onUpdate: (patch) => applyJob({ ...latestJob.current, ...patch }),
+      onError: () => {
+        if (!cancelled) startPolling();
+      },
+    });
     return () => {
       cancelled = true;
-      clearInterval(interval);
+      unsubscribe();
+      if (interval) clearInterval(interval);
     };
-  }, [currentJob]);
+  }, [currentJobId, currentJobDone]);
 
   const handleSubmit = async (event) => {
     event.preventDefault();
@@ -92,6 +120,9 @@ export default function Create() {
         clip_length: clipLength[0],
         language,
         style,
+        render_mode: renderMode,
+        aspect_ratio: aspectRatio,
+        render_profile: renderProfile,
       });
       setCurrentJob(job);
       setJobs((prev) => [job, ...prev]);
@@ -103,6 +134,20 @@ export default function Create() {
     }
   };
 
+  const handleLoadMoreJobs = async () => {
+    if (!jobsCursor) return;
+    setIsLoadingJobs(true);
+    try {
+      const { items, nextCursor } = await listJobsPage({ limit: 4, cursor: jobsCursor });
+      setJobs((prev) => [...prev, ...items.filter((job) => !prev.some((known) => known.id === job.id))]);
+      setJobsCursor(nextCursor);
+    } catch (error) {
+      toast.error("Não foi possível carregar os jobs.");
+    } finally {
+      setIsLoadingJobs(false);
+    }
+  };
+
   const handleRetry = async () => {
     if (!currentJob) return;
     try {
@@ -249,6 +294,81 @@ export default function Create() {
                   </SelectContent>
                 </Select>
               </div>
+              <div className="flex flex-col gap-3" data-testid="studio-render-mode-field">
+                <label
+                  className="text-sm text-white/70"
+                  data-testid="studio-render-mode-label"
+                >
+                  Renderização
+                </label>
+                <Select value={renderMode} onValueChange={setRenderMode}>
+                  <SelectTrigger
+                    className="bg-black/40 border-white/10"
+                    data-testid="studio-render-mode-trigger"
+                  >
+                    <SelectValue placeholder="Selecione" />
+                  </SelectTrigger>
+                  <SelectContent data-testid="studio-render-mode-content">
+                    <SelectItem value="quality" data-testid="studio-render-mode-quality">
+                      Qualidade
+                    </SelectItem>
+                    <SelectItem value="fast" data-testid="studio-render-mode-fast">
+                      Rápida (sem recodificar)
+                    </SelectItem>
+                  </SelectContent>
+                </Select>
+              </div>
+              <div className="flex flex-col gap-3" data-testid="studio-aspect-ratio-field">
+                <label
+                  className="text-sm text-white/70"
+                  data-testid="studio-aspect-ratio-label"
+                >
+                  Formato
+                </label>
+                <Select value={aspectRatio} onValueChange={setAspectRatio}>
+                  <SelectTrigger
+                    className="bg-black/40 border-white/10"
+                    data-testid="studio-aspect-ratio-trigger"
+                  >
+                    <SelectValue placeholder="Selecione" />
+                  </SelectTrigger>
+                  <SelectContent data-testid="studio-aspect-ratio-content">
+                    <SelectItem value="original" data-testid="studio-aspect-ratio-original">
+                      Original
+                    </SelectItem>
+                    <SelectItem value="9:16" data-testid="studio-aspect-ratio-vertical">
+                      Vertical 9:16
+                    </SelectItem>
+                  </SelectContent>
+                </Select>
+              </div>
+              <div className="flex flex-col gap-3" data-testid="studio-render-profile-field">
+                <label
+                  className="text-sm text-white/70"
+                  data-testid="studio-render-profile-label"
+                >
+                  Perfil de saída
+                </label>
+                <Select value={renderProfile} onValueChange={setRenderProfile}>
+                  <SelectTrigger
+                    className="bg-black/40 border-white/10"
+                    data-testid="studio-render-profile-trigger"
+                  >
+                    <SelectValue placeholder="Selecione" />
+                  </SelectTrigger>
+                  <SelectContent data-testid="studio-render-profile-content">
+                    <SelectItem value="preview" data-testid="studio-render-profile-preview">
+                      Prévia (480p, rápida)
+                    </SelectItem>
+                    <SelectItem value="publish" data-testid="studio-render-profile-publish">
+                      Publicação
+                    </SelectItem>
+                    <SelectItem value="archive" data-testid="studio-render-profile-archive">
+                      Arquivo (máxima qualidade)
+                    </SelectItem>
+                  </SelectContent>
+                </Select>
+              </div>
             </div>
             <Button
               type="submit"
@@ -288,7 +408,19 @@ export default function Create() {
                     ? "Cortes prontos para revisão"
                     : currentJob.status === "error"
                       ? "Falha no processamento"
-                      : "Analisando momentos-chave"}
+                      : currentJob.queue_position
+                        ? `Posição na fila: ${currentJob.queue_position}${
+                            currentJob.eta_seconds
+                              ? ` · ~${Math.ceil(currentJob.eta_seconds / 60)} min`
+                              : ""
+                          }`
+                        : currentJob.progress_detail?.eta_seconds != null
+                          ? `${
+                              currentJob.progress_detail.stage === "download"
+                                ? "Baixando vídeo"
+                                : "Renderizando cortes"
+                            } · ~${currentJob.progress_detail.eta_seconds}s restantes`
+                          : "Analisando momentos-chave"}
                 </span>
               </div>
               {currentJob.status === "completed" && (
@@ -359,7 +491,7 @@ export default function Create() {
               </div>
             ) : (
               <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
-                {jobs.slice(0, 4).map((job) => (
+                {jobs.map((job) => (
                   <div
                     key={job.id}
                     className="glass-card p-4 flex flex-col gap-3"
@@ -401,6 +533,17 @@ export default function Create() {
                 ))}
               </div>
             )}
+            {jobsCursor && (
+              <Button
+                variant="ghost"
+                onClick={handleLoadMoreJobs}
+                disabled={isLoadingJobs}
+                className="pill-button text-white/70 hover:text-white hover:bg-white/10 w-fit"
+                data-testid="studio-jobs-load-more"
+              >
+                {isLoadingJobs ? "Carregando..." : "Carregar mais"}
+              </Button>
+            )}
           </div>
         </section>
       </main>
@@ -8,7 +8,7 @@ import { Progress } from "@/components/ui/progress";
 import { ClipCard } from "@/components/ClipCard";
 import { ClipEditorDialog } from "@/components/ClipEditorDialog";
 import { ClipPreviewDialog } from "@/components/ClipPreviewDialog";
-import { getJob, getJobClips, updateClip, getDownloadUrl } from "@/lib/api";
+import { getJob, getJobClips, updateClip, getDownloadUrl, subscribeToJob } from "@/lib/api";
 import { resolveMediaUrl } from "@/lib/media";
 import { toast } from "sonner";
 import { ArrowLeft, DownloadCloud } from "lucide-react";
@@ -45,6 +45,20 @@ export default function Results() {
     loadJob();
   }, [jobId]);
 
+  useEffect(() => {
+    // Trim edits render in the background; follow the job so clips swap to
+    // their new video once the render lands.
+    const applySnapshot = (data) => {
+      setJob(data);
+      if (data.clips?.length) setClips(data.clips);
+    };
+    return subscribeToJob(jobId, {
+      follow: true,
+      onSnapshot: applySnapshot,
+      onUpdate: (patch) => setJob((prev) => (prev ? { ...prev, ...patch } : prev)),
+    });
+  }, [jobId]);
+
   if (loading) {
     return (
       <div className="app-shell" data-testid="results-loading">
@@ -110,9 +124,15 @@ export default function Results() {
     try {
       const updated = await updateClip(jobId, editingClip.id, payload);
       setClips((prev) => prev.map((item) => (item.id === updated.id ? updated : item)));
-      toast.success("Ajustes salvos.");
+      toast.success(
+        updated.render_status === "pending" ? "Ajustes salvos. Renderizando o novo trecho..." : "Ajustes salvos."
+      );
       setEditorOpen(false);
     } catch (err) {
+      if (err.response?.status === 409) {
+        toast.error("Outra edição alterou este corte. Recarregue a página.");
+        return;
+      }
       toast.error("Não foi possível salvar o corte.");
     }
   };
@@ -0,0 +1,47 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cortes_recorte_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def database(monkeypatch):
+    # The benchmark's mongomock sandbox, which fills in what mongomock lacks
+    # (array_filters, copied reads) so the server's queries run unchanged.
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from benchmark_pipeline import BenchDatabase
+
+    import server
+
+    database = BenchDatabase(mongomock_motor.AsyncMongoMockClient(tz_aware=True)["cortes_recorte_test"])
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+@pytest.fixture
+def insert_job(database):
+    import server
+
+    def insert(job_id, created_at, clips=(), **fields):
+        job = server.ClipJob(
+            id=job_id,
+            youtube_url="https://youtu.be/x",
+            title=job_id,
+            status="completed",
+            progress=100,
+            clip_count=len(clips),
+            clip_length=30,
+            language="pt",
+            style="dinamico",
+        )
+        doc = {**job.model_dump(), "created_at": created_at, "clips": list(clips), **fields}
+        asyncio.run(database.clip_jobs.insert_one(doc))
+        return doc
+
+    return insert
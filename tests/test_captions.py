@@ -0,0 +1,68 @@
+import server
+
+WORDS = [
+    [10.0, 10.3, "um"],
+    [10.3, 10.6, "dois"],
+    [10.6, 10.9, "três"],
+    [10.9, 11.2, "quatro."],
+    [11.2, 11.5, "cinco"],
+    [12.5, 12.8, "{seis}"],
+]
+MEDIA_INFO = {"video": {"width": 1080, "height": 1920}}
+
+
+def test_lines_break_on_word_count_punctuation_and_pauses():
+    assert server.caption_lines(WORDS, "dinamico") == [
+        (10.0, 10.9, "um dois três"),
+        (10.9, 11.2, "quatro."),
+        (11.2, 11.5, "cinco"),
+        (12.5, 12.8, "{seis}"),
+    ]
+    assert server.caption_lines(WORDS, "calmo") == [
+        (10.0, 11.2, "um dois três quatro."),
+        (11.2, 11.5, "cinco"),
+        (12.5, 12.8, "{seis}"),
+    ]
+
+
+def test_track_falls_back_to_the_default_style_and_size():
+    track = server.caption_track(WORDS, "unknown", "pt", {"video": None})
+    assert (track["style"], track["key"], track["width"], track["height"]) == ("dinamico", "unknown-pt", 1280, 720)
+    assert server.caption_track([], "calmo", "pt", MEDIA_INFO) is None
+
+
+def test_clip_lines_are_sliced_and_clamped_to_the_clip():
+    track = server.caption_track(WORDS, "dinamico", "pt", MEDIA_INFO)
+    lines = server.clip_lines(track, 10.5, 1.0)
+    assert [(round(begin, 3), round(end, 3), text) for begin, end, text in lines] == [
+        (0.0, 0.4, "um dois três"),
+        (0.4, 0.7, "quatro."),
+        (0.7, 1.0, "cinco"),
+    ]
+    assert server.clip_lines(track, 20.0, 5.0) == []
+
+
+def test_srt_uses_clip_relative_times(tmp_path):
+    track = server.caption_track(WORDS, "calmo", "pt", MEDIA_INFO)
+    path = tmp_path / "clip.srt"
+    server.write_srt(track, 11.0, 2.0, path)
+    assert path.read_text(encoding="utf-8") == (
+        "1\n00:00:00,000 --> 00:00:00,200\num dois três quatro.\n\n"
+        "2\n00:00:00,200 --> 00:00:00,500\ncinco\n\n"
+        "3\n00:00:01,500 --> 00:00:01,800\n{seis}\n"
+    )
+
+
+def test_ass_script_styles_and_escapes_events(tmp_path):
+    track = server.caption_track(WORDS, "dinamico", "pt", MEDIA_INFO)
+    path = tmp_path / "clip.ass"
+    assert server.caption_filter(track, 11.0, 2.0, path) == f"ass=filename={path.as_posix()}"
+    script = path.read_text(encoding="utf-8")
+    assert "PlayResX: 1080\nPlayResY: 1920\n" in script
+    assert "Style: Default,DejaVu Sans,144,&H0000FFFF," in script
+    events = [line for line in script.splitlines() if line.startswith("Dialogue:")]
+    assert events == [
+        "Dialogue: 0,0:00:00.00,0:00:00.20,Default,,0,0,0,,QUATRO.",
+        "Dialogue: 0,0:00:00.20,0:00:00.50,Default,,0,0,0,,CINCO",
+        "Dialogue: 0,0:00:01.50,0:00:01.80,Default,,0,0,0,,SEIS",
+    ]
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import server
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+FPS = 30
+# 250-frame GOPs put keyframes at multiples of 8.333…s, which do not survive
+# rounding to milliseconds.
+GOP = 250
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    path = tmp_path_factory.mktemp("source") / "source.mp4"
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc=duration=90:size=320x240:rate={FPS}",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=frequency=440:duration=90",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-g",
+            str(GOP),
+            "-keyint_min",
+            str(GOP),
+            "-sc_threshold",
+            "0",
+            "-pix_fmt",
+            "yuv420p",
+            "-c:a",
+            "aac",
+            "-shortest",
+            str(path),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return path
+
+
+@needs_ffmpeg
+def test_copy_segment_starts_on_the_requested_keyframe(source, tmp_path):
+    keyframe = server.load_media_info(source)["keyframes"][7]
+    assert keyframe == pytest.approx(58.333, abs=0.001)
+    output = tmp_path / "copy.mp4"
+    asyncio.run(server.copy_segment(source, output, keyframe, 84 - keyframe))
+    assert server.probe_frames(output) == pytest.approx((84 - keyframe) * FPS, abs=1)
+
+
+@needs_ffmpeg
+def test_length_check_counts_frames_the_container_does_not_store(source, tmp_path):
+    output = tmp_path / "copy.mkv"
+    subprocess.run(
+        ["ffmpeg", "-y", "-i", str(source), "-frames:v", str(2 * FPS), "-an", "-c", "copy", str(output)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    assert server.probe_frames(output, FPS) == 2 * FPS
+    assert server.duration_matches(output, 2, FPS)
+    assert not server.duration_matches(output, 3, FPS)
+
+
+@needs_ffmpeg
+def test_fast_render_matches_requested_duration(source, tmp_path, caplog):
+    output = tmp_path / "fast.mp4"
+    asyncio.run(server.render_clip_fast(source, output, 54, 30))
+    assert server.probe_frames(output) == pytest.approx(30 * FPS, abs=1)
+    assert "re-encoding" not in caplog.text
+
+
+@needs_ffmpeg
+def test_partial_render_matches_trimmed_duration(source, tmp_path):
+    base = tmp_path / "base.mp4"
+    asyncio.run(server.render_clip(source, base, 14, 30))
+    output = tmp_path / "trimmed.mp4"
+    assert asyncio.run(server.render_clip_partial(source, base, 14, output, 16, 31))
+    assert server.probe_frames(output) == pytest.approx(31 * FPS, abs=1)
+
+
+@needs_ffmpeg
+def test_partial_render_gives_up_on_wrong_length(source, tmp_path, monkeypatch):
+    base = tmp_path / "base.mp4"
+    asyncio.run(server.render_clip(source, base, 14, 30))
+    monkeypatch.setattr(server, "duration_matches", lambda *args: False)
+    assert not asyncio.run(server.render_clip_partial(source, base, 14, tmp_path / "trimmed.mp4", 16, 31))
+
+
+@needs_ffmpeg
+def test_trim_at_the_end_of_the_source_gets_a_thumbnail(source, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "RENDER_CACHE_DIR", tmp_path / "cache")
+    clip_path, thumb_path = asyncio.run(server.rerender_clip(source, "source", (0, 30), 89, 1))
+    assert server.probe_frames(clip_path) == pytest.approx(FPS, abs=1)
+    assert thumb_path == server.thumb_cache_path("source", 89, "original", server.encode_profile())
+    assert thumb_path.stat().st_size > 0
+
+
+def test_length_check_falls_back_to_the_duration(monkeypatch):
+    probe = {"streams": [{"duration": "2.000000"}], "format": {"duration": "2.1"}}
+    monkeypatch.setattr(server, "run_command", lambda command: json.dumps(probe))
+    assert server.probe_frames(Path("clip.mkv"), FPS) == 2 * FPS
+    probe["streams"] = [{}]
+    assert server.probe_frames(Path("clip.mkv"), FPS) == round(2.1 * FPS)
+    probe["format"] = {}
+    assert server.probe_frames(Path("clip.mkv"), FPS) == 0
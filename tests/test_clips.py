@@ -0,0 +1,25 @@
+import asyncio
+from datetime import datetime, timezone
+
+import server
+
+CREATED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def stored_clips(database):
+    return asyncio.run(database.clip_jobs.find_one({"id": "job"}))["clips"]
+
+
+def test_set_clip_fields_only_writes_the_expected_version(database, insert_job):
+    insert_job("job", CREATED_AT, [{"id": "a", "version": 2}, {"id": "b", "version": 2}])
+    assert asyncio.run(server.set_clip_fields("job", "a", 2, {"title": "novo"}))
+    assert not asyncio.run(server.set_clip_fields("job", "a", 1, {"title": "antigo"}))
+    assert [clip.get("title") for clip in stored_clips(database)] == ["novo", None]
+    assert not asyncio.run(server.set_clip_fields("job", "b", 2, {"render_status": "rendering"}, "pending"))
+    assert "render_status" not in stored_clips(database)[1]
+
+
+def test_set_clip_fields_matches_clips_from_before_versioning(insert_job):
+    insert_job("job", CREATED_AT, [{"id": "a"}])
+    assert asyncio.run(server.set_clip_fields("job", "a", None, {"title": "novo"}))
+    assert not asyncio.run(server.set_clip_fields("job", "a", 1, {"title": "antigo"}))
@@ -0,0 +1,30 @@
+import asyncio
+from pathlib import Path
+
+import server
+
+
+def test_parallel_render_stays_within_the_job_core_share(monkeypatch):
+    budget = server.CpuBudget(8)
+    peak = []
+
+    async def fake_render(*args, **kwargs):
+        peak.append(budget.total - budget.available)
+        await asyncio.sleep(0.01)
+
+    async def no_audio(video_path):
+        return False
+
+    monkeypatch.setattr(server, "cpu_budget", budget)
+    monkeypatch.setattr(server, "job_core_share", lambda: 2)
+    monkeypatch.setattr(server, "encoder_tuning", {})
+    monkeypatch.setattr(server, "render_clip", fake_render)
+    monkeypatch.setattr(server, "render_thumbnail", fake_render)
+    monkeypatch.setattr(server, "has_audio_stream", no_audio)
+    clips = [
+        {"start": index * 30, "duration": 30, "thumb_at": index * 30 + 1, "video_path": None, "thumb_path": None}
+        for index in range(6)
+    ]
+    asyncio.run(server.render_job_parallel(Path("source.mp4"), clips, None))
+    assert len(peak) == 12
+    assert max(peak) == 2
@@ -0,0 +1,79 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_parse_ranges_reads_single_open_and_suffix_ranges():
+    assert server.parse_ranges("bytes=0-99", 1000) == [(0, 99)]
+    assert server.parse_ranges("bytes=900-", 1000) == [(900, 999)]
+    assert server.parse_ranges("bytes=-100", 1000) == [(900, 999)]
+    assert server.parse_ranges("bytes=990-2000", 1000) == [(990, 999)]
+    assert server.parse_ranges("bytes=0-9, 20-29", 1000) == [(0, 9), (20, 29)]
+
+
+def test_parse_ranges_ignores_malformed_headers():
+    assert server.parse_ranges(None, 1000) is None
+    assert server.parse_ranges("items=0-9", 1000) is None
+    assert server.parse_ranges("bytes=a-b", 1000) is None
+    assert server.parse_ranges("bytes=" + ",".join(["0-1"] * (server.MAX_RANGES + 1)), 1000) is None
+
+
+def test_parse_ranges_rejects_unsatisfiable_ranges():
+    with pytest.raises(HTTPException) as error:
+        server.parse_ranges("bytes=1000-1100", 1000)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */1000"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    contents = {"clips/corte-1.mp4": b"\x00\x01" * 5000, "thumbs/corte-1.jpg": b"jpeg" * 300}
+    entries = []
+    for arcname, data in contents.items():
+        path = tmp_path / arcname.replace("/", "-")
+        path.write_bytes(data)
+        entries.append({"arcname": arcname, "path": path, "version": 1})
+    manifest = server.load_export_manifest(tmp_path / "exports", entries)
+    segments = server.zip_layout(manifest["files"])
+    return contents, segments, sum(server.segment_length(segment) for segment in segments)
+
+
+def collect(segments, start, end):
+    async def read():
+        return b"".join([chunk async for chunk in server.stream_segments(segments, start, end)])
+
+    return asyncio.run(read())
+
+
+def test_zip_layout_is_a_valid_stored_archive(archive):
+    contents, segments, total = archive
+    body = collect(segments, 0, total - 1)
+    assert len(body) == total
+    with zipfile.ZipFile(io.BytesIO(body)) as bundle:
+        assert bundle.testzip() is None
+        assert {info.filename: info.compress_type for info in bundle.infolist()} == dict.fromkeys(
+            contents, zipfile.ZIP_STORED
+        )
+        assert {name: bundle.read(name) for name in contents} == contents
+
+
+def test_zip_ranges_match_the_full_body(archive):
+    _, segments, total = archive
+    body = collect(segments, 0, total - 1)
+    for start, end in [(0, 0), (10, 40), (25, 10_050), (total - 22, total - 1)]:
+        assert collect(segments, start, end) == body[start : end + 1]
+
+
+def test_export_manifest_is_reused_until_a_file_changes(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"first")
+    entries = [{"arcname": "clip.mp4", "path": path, "version": 1}]
+    first = server.load_export_manifest(tmp_path / "exports", entries)
+    assert server.load_export_manifest(tmp_path / "exports", entries) == first
+    changed = server.load_export_manifest(tmp_path / "exports", [{**entries[0], "version": 2}])
+    assert changed["key"] != first["key"]
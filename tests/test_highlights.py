@@ -0,0 +1,38 @@
+import numpy as np
+
+import server
+
+HOP = 0.5
+
+
+def analysis(duration, loud=(), cuts=()):
+    # Flat background with optional loud seconds and scene cuts.
+    loudness = np.full(int(duration / HOP), -40.0)
+    for second in loud:
+        loudness[int(second / HOP) : int((second + 1) / HOP)] = -10.0
+    return {
+        "hop_seconds": HOP,
+        "loudness": loudness,
+        "zcr": np.full(loudness.size, 0.1),
+        "scene_times": np.asarray(cuts, dtype=np.float64),
+        "scene_scores": np.ones(len(cuts)),
+    }
+
+
+def test_flat_silence_keeps_the_window_start():
+    plan = server.plan_highlights(analysis(600, cuts=range(300, 330)), 600, 30)
+    assert 300 in [start for start, _ in plan]
+
+
+def test_cut_moves_to_the_closest_quieter_second():
+    # Speech starts at 300 s and both seconds before it are equally quiet;
+    # the cut moves back one second, not to the first of them.
+    plan = server.plan_highlights(analysis(600, loud=range(300, 330), cuts=range(302, 332)), 600, 30)
+    starts = [start for start, _ in plan]
+    assert 299 in starts
+    assert 298 not in starts
+
+
+def test_source_without_audio_or_cuts_is_spaced_evenly():
+    empty = {**analysis(0), "loudness": [], "zcr": []}
+    assert server.plan_highlights(empty, 600, 30) == server.even_clip_plan(600, 30)
@@ -0,0 +1,34 @@
+from pathlib import Path
+
+import server
+
+
+def option(args, name):
+    return [args[index + 1] for index, arg in enumerate(args) if arg == name]
+
+
+def test_rungs_follow_the_profile_preset_and_thread_share():
+    args = server.hls_rung_args(360, server.encode_profile("preview"), 2)
+    assert option(args, "-preset") == ["ultrafast"]
+    assert option(args, "-threads") == ["2"]
+
+
+def test_ladder_uses_the_tuned_preset_and_splits_threads(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "encoder_tuning", {"preset": "faster"})
+    encode = server.encode_profile("publish")
+    _, _, _, outputs = server.hls_ladder_graph("0:v", "0:a", [360, 720], "h", tmp_path / "clip.hls", encode, 3)
+    assert option(outputs, "-preset") == ["faster", "faster"]
+    assert option(outputs, "-threads") == ["3", "3"]
+    clips = [
+        {
+            "start": index * 30,
+            "duration": 30,
+            "thumb_at": index * 30 + 1,
+            "video_path": tmp_path / f"{index}.mp4",
+            "thumb_path": tmp_path / f"{index}.jpg",
+        }
+        for index in range(2)
+    ]
+    command = server.build_batch_command(Path("source.mp4"), clips, None, True, 8, [360], encode=encode)
+    # Two clips, each a main output and one rung: four encoders share 8 cores.
+    assert option(command, "-threads") == ["2"] * 4
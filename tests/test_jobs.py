@@ -0,0 +1,39 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+
+import server
+
+CREATED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def test_cursor_round_trips():
+    cursor = server.encode_cursor({"created_at": CREATED_AT, "id": "job-1"})
+    assert server.decode_cursor(cursor) == (CREATED_AT, "job-1")
+
+
+def test_invalid_cursor_is_a_bad_request():
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor("bm90IGpzb24")
+    assert error.value.status_code == 400
+
+
+def test_pages_cover_every_job_once(insert_job):
+    # Two jobs share a timestamp, so the id breaks the tie across pages.
+    for index in range(7):
+        insert_job(f"job-{index}", CREATED_AT + timedelta(minutes=min(index, 5)))
+    seen, cursor = [], None
+    while True:
+        response = Response()
+        page = asyncio.run(
+            server.list_jobs(
+                response, limit=2, cursor=cursor, status=None, created_after=None, created_before=None
+            )
+        )
+        seen += [job.id for job in page]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == ["job-6", "job-5", "job-4", "job-3", "job-2", "job-1", "job-0"]
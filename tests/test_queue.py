@@ -0,0 +1,123 @@
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+CREATED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def iso(offset_seconds):
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)).isoformat()
+
+
+def stored(database, job_id):
+    return asyncio.run(database.clip_jobs.find_one({"id": job_id}, {"_id": 0}))
+
+
+def test_claim_takes_the_oldest_ready_job(insert_job):
+    insert_job("newer", CREATED_AT + timedelta(minutes=1), status="queued")
+    insert_job("older", CREATED_AT, status="queued")
+    insert_job("rendering", CREATED_AT, status="downloaded")
+    claimed = asyncio.run(server.claim_job("download"))
+    assert claimed["id"] == "older"
+    assert claimed["status"] == "downloading"
+    assert claimed["lease_owner"] == server.WORKER_ID
+    assert claimed["attempts"] == 1
+
+
+def test_claim_retakes_a_job_only_once_its_lease_ran_out(database, insert_job):
+    insert_job("held", CREATED_AT, status="downloading", lease_expires_at=iso(60), attempts=1)
+    assert asyncio.run(server.claim_job("download")) is None
+    asyncio.run(database.clip_jobs.update_one({"id": "held"}, {"$set": {"lease_expires_at": iso(-1)}}))
+    claimed = asyncio.run(server.claim_job("download"))
+    assert claimed["id"] == "held"
+    assert claimed["attempts"] == 2
+
+
+def test_job_over_the_attempt_limit_is_marked_as_error(database, insert_job):
+    insert_job(
+        "flaky", CREATED_AT, status="downloading", lease_expires_at=iso(-1), attempts=server.JOB_MAX_ATTEMPTS
+    )
+    claimed = asyncio.run(server.claim_job("download"))
+    asyncio.run(server.run_claimed_job("download", claimed))
+    job = stored(database, "flaky")
+    assert job["status"] == "error"
+    assert job["error_message"] == "Limite de tentativas excedido"
+    assert job["lease_owner"] is None
+
+
+def test_result_is_dropped_once_the_job_was_reclaimed(database, insert_job, monkeypatch):
+    insert_job("slow", CREATED_AT, status="queued")
+
+    async def stalled_download(job):
+        # The lease runs out mid-stage and the job is claimed again.
+        await database.clip_jobs.update_one({"id": "slow"}, {"$set": {"lease_expires_at": iso(-1)}})
+        await server.claim_job("download")
+        return {"title": "stale"}
+
+    monkeypatch.setitem(server.QUEUE_STAGES["download"], "handler", stalled_download)
+    claimed = asyncio.run(server.claim_job("download"))
+    asyncio.run(server.run_claimed_job("download", claimed))
+    job = stored(database, "slow")
+    assert job["status"] == "downloading"
+    assert job["attempts"] == 2
+    assert job["title"] == "slow"
+
+
+def test_heartbeat_keeps_renewing_after_a_failed_write(monkeypatch):
+    calls = []
+
+    class FlakyJobs:
+        async def update_one(self, query, update):
+            calls.append(query)
+            if len(calls) == 1:
+                raise RuntimeError("primary stepped down")
+
+    class FlakyDatabase:
+        clip_jobs = FlakyJobs()
+
+    monkeypatch.setattr(server, "db", FlakyDatabase())
+    monkeypatch.setattr(server, "JOB_LEASE_SECONDS", 0.03)
+
+    async def beat():
+        heartbeat = asyncio.create_task(server.heartbeat_job({"id": "job", "attempts": 1}, "processing"))
+        await asyncio.sleep(0.1)
+        alive = not heartbeat.done()
+        heartbeat.cancel()
+        return alive
+
+    assert asyncio.run(beat())
+    assert len(calls) >= 2
+    assert calls[-1] == {"id": "job", "lease_owner": server.WORKER_ID, "attempts": 1, "status": "processing"}
+
+
+def test_create_job_refuses_when_the_queue_is_full(insert_job, monkeypatch):
+    monkeypatch.setattr(server, "MAX_QUEUED_JOBS", 1)
+    insert_job("waiting", CREATED_AT, status="queued")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.create_job(server.ClipJobCreate(youtube_url="https://youtu.be/y", clip_length=30)))
+    assert error.value.status_code == 429
+
+
+def test_queue_info_counts_position_and_rounds_of_workers(insert_job, monkeypatch):
+    monkeypatch.setattr(server, "stage_durations", {stage: deque() for stage in server.QUEUE_STAGES})
+    monkeypatch.setitem(server.QUEUE_STAGES["download"], "workers", 2)
+    for index in range(3):
+        insert_job(f"queued-{index}", CREATED_AT + timedelta(minutes=index), status="queued")
+    insert_job("downloaded", CREATED_AT, status="downloaded")
+    insert_job("running", CREATED_AT, status="processing")
+    jobs = [{"id": job_id} for job_id in ("queued-0", "queued-2", "downloaded", "running")]
+    for job, status in zip(jobs, ("queued", "queued", "downloaded", "processing")):
+        job["status"] = status
+    asyncio.run(server.attach_queue_info(jobs))
+    download, render = server.DEFAULT_STAGE_SECONDS["download"], server.DEFAULT_STAGE_SECONDS["render"]
+    assert [(job["queue_position"], job["eta_seconds"]) for job in jobs] == [
+        (1, int(download + render)),
+        (3, int(2 * download + render)),
+        (1, int(render)),
+        (None, None),
+    ]
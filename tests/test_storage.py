@@ -0,0 +1,42 @@
+import os
+import time
+
+import server
+
+
+def age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_known_source_keys_cover_legacy_jobs():
+    jobs = [
+        {"id": "job-a", "source_path": "/storage/videos/abc123.mp4"},
+        {"id": "job-b"},
+        {"id": "job-c", "source_path": None},
+    ]
+    assert server.known_source_keys(["cached"], jobs) == {"cached", "abc123", "job-b", "job-c"}
+
+
+def test_orphan_sweep_keeps_legacy_job_sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "VIDEO_DIR", tmp_path)
+    legacy = tmp_path / "job-b.mp4"
+    sidecar = tmp_path / "job-b.probe.json"
+    orphan = tmp_path / "gone.mp4"
+    partial = tmp_path / "cached.0f3c.tmp.mp4"
+    fresh = tmp_path / "new.mp4"
+    for path in (legacy, sidecar, orphan, partial, fresh):
+        path.write_bytes(b"x")
+    for path in (legacy, sidecar, orphan, partial):
+        age(path, server.ORPHAN_GRACE_SECONDS + 60)
+    server.remove_orphan_sources(server.known_source_keys(["cached"], [{"id": "job-b"}]), set())
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["job-b.mp4", "job-b.probe.json", "new.mp4"]
+
+
+def test_orphan_sweep_skips_active_downloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "VIDEO_DIR", tmp_path)
+    partial = tmp_path / "busy.0f3c.tmp.mp4"
+    partial.write_bytes(b"x")
+    age(partial, server.ORPHAN_GRACE_SECONDS + 60)
+    server.remove_orphan_sources(set(), {"busy"})
+    assert partial.exists()
@@ -0,0 +1,97 @@
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+import server
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+def growing_source(path, video):
+    growing = server.GrowingSource("key", path, path.with_name("key.mp4"), {"duration": 60.0, "video": video})
+    growing.advance(1.0)
+    return growing
+
+
+def write_fragmented_source(path, audio=False):
+    sine = ["-f", "lavfi", "-i", "sine=frequency=440:duration=2", "-c:a", "aac"] if audio else []
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            "testsrc=duration=2:size=320x240:rate=25",
+            *sine,
+            "-c:v",
+            "libx264",
+            "-preset",
+            "ultrafast",
+            "-movflags",
+            "frag_keyframe+empty_moov+default_base_moof",
+            str(path),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+@needs_ffmpeg
+def test_streaming_info_reads_missing_dimensions_from_the_fragment_header(tmp_path):
+    path = tmp_path / "key.tmp.mp4"
+    write_fragmented_source(path)
+    video = {"codec": "h264", "width": None, "height": None, "fps": None}
+    assert asyncio.run(server.complete_streaming_video_info(growing_source(path, video)))
+    assert video == {"codec": "h264", "width": 320, "height": 240, "fps": 25.0}
+
+
+@needs_ffmpeg
+def test_streaming_info_reports_unknown_dimensions(tmp_path):
+    path = tmp_path / "key.tmp.mp4"
+    path.write_bytes(b"not a video yet")
+    video = {"codec": "h264", "width": None, "height": None, "fps": None}
+    assert not asyncio.run(server.complete_streaming_video_info(growing_source(path, video)))
+
+
+def test_streaming_info_keeps_extractor_dimensions(tmp_path):
+    video = {"codec": "h264", "width": 1280, "height": 720, "fps": 30.0}
+    assert asyncio.run(server.complete_streaming_video_info(growing_source(tmp_path / "missing.mp4", video)))
+    assert video["width"] == 1280
+
+
+@needs_ffmpeg
+def test_ladder_render_of_a_growing_source_does_not_probe_it(tmp_path):
+    path = tmp_path / "key.tmp.mp4"
+    write_fragmented_source(path, audio=True)
+    media_info = {"duration": 2.0, "video": {"width": 320, "height": 240, "fps": 25.0}, "audio": {"codec": "aac"}}
+    output = tmp_path / "clip.mp4"
+    asyncio.run(server.render_clip(path, output, 0, 1, rungs=[120], media_info=media_info))
+    assert output.exists()
+    assert (server.hls_dir_for(output) / "120" / "index.m3u8").exists()
+    assert not server.media_info_path(path).exists()
+
+
+@needs_ffmpeg
+def test_failed_ingest_reports_what_yt_dlp_said(tmp_path):
+    growing = server.GrowingSource("key", tmp_path / "key.tmp.mp4", tmp_path / "key.mp4", {"duration": 60.0})
+    with pytest.raises(server.DownloadError) as error:
+        asyncio.run(server.ingest_source(growing, "not-a-video-url", {"format_id": "18"}))
+    assert "not a valid URL" in str(error.value)
+
+
+def test_stream_regions_cap_the_first_region():
+    assert server.stream_regions(3600, 30) == [(0, 180), (180, 684), (864, 684), (1548, 684), (2232, 684), (2916, 684)]
+
+
+def test_stream_regions_tile_the_source():
+    for duration in (20, 30, 59, 61, 95, 200, 601, 7201):
+        regions = server.stream_regions(duration, min(30, max(5, duration)))
+        assert regions[0][0] == 0
+        assert sum(length for _, length in regions) == duration
+        for (start, length), (following, _) in zip(regions, regions[1:]):
+            assert start + length == following
+            assert length >= 30